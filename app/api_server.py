@@ -0,0 +1,582 @@
+import argparse
+import json
+import os
+import re
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.sharedctypes import RawArray
+from urllib.parse import urlparse, parse_qs
+
+from config import engine, session_scope
+from services import (
+    ServiceError, NotFound, Conflict, members, trainers, admin, scheduling, enrollments, receivables,
+    reference_cache,
+)
+from services.auto_scheduler import schedule_requests
+from services.validation import BadRequest, required, as_int, as_float, as_bool, as_datetime, as_date
+
+# HTTP/JSON front end for the club operations, for the front desk app, member app and kiosks.
+# Same service functions as the CLI, one session per request.
+#
+#   python -m app.api_server --port 8000 --workers 4
+#
+#   POST   /members                      {"full_name", "email", "date_of_birth", "gender", "phone"}
+#   PATCH  /members/<id>/goal            {"fitness_goal", "target_weight"}
+#   POST   /members/<id>/metrics         {"recorded_at", "weight", "heart_rate", "body_fat_percentage"}
+#   GET    /members?name=<part>&limit=&offset=
+#   POST   /pt-sessions                  {"member_id", "trainer_id", "room_id", "start_time", "end_time"}
+#   POST   /pt-sessions/<id>/cancel
+#   POST   /pt-sessions/batch            {"requests": [{"member_id", "specialty", "earliest", "latest",
+#                                         "duration", "participants"}], "open_hour", "close_hour", "dry_run"}
+#   GET    /trainers/<id>/schedule?from=&to=&limit=&after=   (after = "next" from the previous page)
+#   GET    /slots?member_id=&trainer_id=&specialty=&room_id=&from=&to=&duration=&open_hour=&close_hour=&limit=
+#   POST   /classes                      {"title", "room_id", "trainer_id", "capacity", "start_time", "end_time"}
+#   POST   /classes/<id>/enrollments     {"member_id"}   (waitlisted when the class is full)
+#   GET    /classes/<id>/enrollments     enrolled members, then the waitlist in order
+#   POST   /enrollments/<id>/cancel      gives the seat to the next member on the waitlist
+#   POST   /invoices                     {"member_id", "amount", "description"}
+#   GET    /reports/aging?member_id=     open balance by age (whole club, or one member)
+#   GET    /reports/debtors?limit=       biggest open balances with their aging
+#   GET    /reports/revenue?months=      invoiced per month, category and status
+#   GET    /stats                        request counts, latency percentiles and throughput per route
+#                                        (plus the reference cache of the worker that answered)
+#
+# Workers are forked processes that all accept() on the same listening socket, each one
+# a threaded server speaking HTTP/1.1 so clients can keep their connection open.
+# Times are ISO 8601 ("2025-01-31T18:00", or with an offset like "...T18:00+02:00", read as club local time). Errors come back as {"error": "..."}.
+# Lists are paginated with limit/offset and next_offset, except the schedule which is
+# keyset paginated with an opaque "next" cursor.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SIZE = 1000
+KEEP_ALIVE_TIMEOUT = 30  # seconds an idle connection is kept open
+
+
+#REQUEST HELPERS
+
+
+def to_json(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def row_dict(obj):
+    # ORM object -> dict of its columns
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+
+def page_params(query):
+    limit = as_int(query.get("limit", DEFAULT_PAGE_SIZE), "limit")
+    offset = as_int(query.get("offset", 0), "offset")
+    if not 1 <= limit <= MAX_PAGE_SIZE or offset < 0:
+        raise BadRequest(f"limit must be 1-{MAX_PAGE_SIZE} and offset can't be negative.")
+    return limit, offset
+
+
+def page(items, limit, offset, has_more):
+    return {
+        "items": items,
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + limit if has_more else None,
+    }
+
+
+#ROUTES
+
+
+def register_member(body, query):
+    with session_scope() as db:
+        member = members.register_member(
+            db,
+            required(body, "full_name"),
+            required(body, "email"),
+            as_date(body.get("date_of_birth"), "date_of_birth"),
+            body.get("gender"),
+            body.get("phone"),
+        )
+    return 201, row_dict(member)
+
+
+def update_member_goal(body, query, member_id):
+    with session_scope() as db:
+        member = members.update_member_goal(
+            db, int(member_id), body.get("fitness_goal"), as_float(body.get("target_weight"), "target_weight")
+        )
+    return 200, row_dict(member)
+
+
+def add_health_metric(body, query, member_id):
+    heart_rate = body.get("heart_rate")
+    with session_scope() as db:
+        metric = members.add_health_metric(
+            db,
+            int(member_id),
+            as_datetime(body.get("recorded_at"), "recorded_at"),
+            as_float(body.get("weight"), "weight"),
+            None if heart_rate in (None, "") else as_int(heart_rate, "heart_rate"),
+            as_float(body.get("body_fat_percentage"), "body_fat_percentage"),
+        )
+    return 201, row_dict(metric)
+
+
+def lookup_members(body, query):
+    name = query.get("name", "").strip()
+    if not name:
+        raise BadRequest("name is required.")
+    limit, offset = page_params(query)
+    with session_scope() as db:
+        # one extra row tells us whether there is another page
+        rows = [dict(row._mapping) for row in trainers.search_members(db, name, limit + 1, offset)]
+    return 200, page(rows[:limit], limit, offset, len(rows) > limit)
+
+
+def book_pt_session(body, query):
+    with session_scope() as db:
+        session = members.book_pt_session(
+            db,
+            as_int(required(body, "member_id"), "member_id"),
+            as_int(required(body, "trainer_id"), "trainer_id"),
+            as_int(required(body, "room_id"), "room_id"),
+            as_datetime(required(body, "start_time"), "start_time"),
+            as_datetime(required(body, "end_time"), "end_time"),
+        )
+    return 201, row_dict(session)
+
+
+def batch_pt_sessions(body, query):
+    items = required(body, "requests")
+    if not isinstance(items, list) or not 1 <= len(items) <= MAX_BATCH_SIZE:
+        raise BadRequest(f"requests must be a list of 1-{MAX_BATCH_SIZE} requests.")
+    requests = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise BadRequest("Every request must be an object.")
+        requests.append({
+            "member_id": as_int(required(item, "member_id"), "member_id"),
+            "specialty": item.get("specialty") or None,
+            "earliest": as_datetime(required(item, "earliest"), "earliest"),
+            "latest": as_datetime(required(item, "latest"), "latest"),
+            "duration": timedelta(minutes=as_int(item.get("duration", 60), "duration")),
+            "participants": as_int(item.get("participants", 1), "participants"),
+        })
+    dry_run = as_bool(body.get("dry_run"), "dry_run")
+    with session_scope() as db:
+        placed, unplaced = schedule_requests(
+            db,
+            requests,
+            as_int(body.get("open_hour", scheduling.OPEN_HOUR), "open_hour"),
+            as_int(body.get("close_hour", scheduling.CLOSE_HOUR), "close_hour"),
+            dry_run=dry_run,
+        )
+    return 200 if dry_run else 201, {
+        "placed": placed,
+        "unplaced": [{"request": index, "reason": reason} for index, reason in unplaced],
+    }
+
+
+def cancel_pt_session(body, query, session_id):
+    with session_scope() as db:
+        session = members.cancel_pt_session(db, int(session_id))
+    return 200, row_dict(session)
+
+
+def schedule_cursor(key):
+    # keyset of the last row as an opaque "start_time|kind|id" string
+    return None if key is None else f"{key[0].isoformat()}|{key[1]}|{key[2]}"
+
+
+def parse_schedule_cursor(value):
+    if not value:
+        return None
+    try:
+        start, kind, row_id = value.split("|")
+        return datetime.fromisoformat(start), kind, int(row_id)
+    except ValueError:
+        raise BadRequest("after is not a valid cursor.")
+
+
+def trainer_schedule(body, query, trainer_id):
+    limit, _ = page_params(query)
+    window_start = as_datetime(query.get("from"), "from") or datetime.combine(date.today(), datetime.min.time())
+    window_end = as_datetime(query.get("to"), "to") or window_start + timedelta(days=trainers.SCHEDULE_DAYS)
+    with session_scope() as db:
+        trainer, rows, key = trainers.trainer_schedule(
+            db, int(trainer_id), window_start, window_end, parse_schedule_cursor(query.get("after")), limit
+        )
+    return 200, {
+        "trainer": row_dict(trainer),
+        "from": window_start,
+        "to": window_end,
+        "items": [dict(row._mapping) for row in rows],
+        "limit": limit,
+        "next": schedule_cursor(key),
+    }
+
+
+def find_slots(body, query):
+    range_start = as_datetime(query.get("from"), "from") or datetime.now().replace(second=0, microsecond=0)
+    range_end = as_datetime(query.get("to"), "to") or range_start + timedelta(days=30)
+    trainer_id = query.get("trainer_id")
+    room_id = query.get("room_id")
+    limit = as_int(query.get("limit", scheduling.SLOT_LIMIT), "limit")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise BadRequest(f"limit must be 1-{MAX_PAGE_SIZE}.")
+    with session_scope() as db:
+        slots = scheduling.find_free_slots(
+            db,
+            as_int(required(query, "member_id"), "member_id"),
+            range_start,
+            range_end,
+            timedelta(minutes=as_int(query.get("duration", 60), "duration")),
+            trainer_id=as_int(trainer_id, "trainer_id") if trainer_id else None,
+            specialty=query.get("specialty") or None,
+            room_id=as_int(room_id, "room_id") if room_id else None,
+            open_hour=as_int(query.get("open_hour", scheduling.OPEN_HOUR), "open_hour"),
+            close_hour=as_int(query.get("close_hour", scheduling.CLOSE_HOUR), "close_hour"),
+            limit=limit,
+        )
+    return 200, {"items": slots, "limit": limit}
+
+
+def create_class_session(body, query):
+    with session_scope() as db:
+        new_class = admin.create_class_session(
+            db,
+            required(body, "title"),
+            as_int(required(body, "room_id"), "room_id"),
+            as_int(required(body, "trainer_id"), "trainer_id"),
+            as_int(required(body, "capacity"), "capacity"),
+            as_datetime(required(body, "start_time"), "start_time"),
+            as_datetime(required(body, "end_time"), "end_time"),
+        )
+    return 201, row_dict(new_class)
+
+
+def enroll_in_class(body, query, class_id):
+    with session_scope() as db:
+        enrollment = enrollments.enroll(db, int(class_id), as_int(required(body, "member_id"), "member_id"))
+        position = enrollments.waitlist_position(db, enrollment)
+    return 201, dict(row_dict(enrollment), waitlist_position=position)
+
+
+def class_roster(body, query, class_id):
+    with session_scope() as db:
+        class_session, rows = enrollments.class_roster(db, int(class_id))
+        return 200, {
+            "class_id": class_session.id,
+            "capacity": class_session.capacity,
+            "enrolled_count": class_session.enrolled_count,
+            "items": [dict(row._mapping) for row in rows],
+        }
+
+
+def cancel_enrollment(body, query, enrollment_id):
+    with session_scope() as db:
+        enrollment, promoted = enrollments.cancel_enrollment(db, int(enrollment_id))
+    return 200, dict(row_dict(enrollment), promoted=row_dict(promoted) if promoted else None)
+
+
+def create_invoice(body, query):
+    with session_scope() as db:
+        invoice = admin.create_invoice(
+            db, as_int(required(body, "member_id"), "member_id"), required(body, "amount"), body.get("description")
+        )
+    return 201, row_dict(invoice)
+
+
+def aging_report(body, query):
+    member_id = query.get("member_id")
+    with session_scope() as db:
+        if not member_id:
+            return 200, {"buckets": receivables.aging_totals(db)}
+        member, buckets = receivables.member_aging(db, as_int(member_id, "member_id"))
+    return 200, {"member_id": member.id, "buckets": buckets}
+
+
+def debtors_report(body, query):
+    limit = as_int(query.get("limit", receivables.DEBTORS_LIMIT), "limit")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise BadRequest(f"limit must be 1-{MAX_PAGE_SIZE}.")
+    with session_scope() as db:
+        return 200, {"items": receivables.top_debtors(db, limit)}
+
+
+def revenue_report(body, query):
+    with session_scope() as db:
+        rows = receivables.monthly_revenue(db, as_int(query.get("months", receivables.REVENUE_MONTHS), "months"))
+    return 200, {"items": rows}
+
+
+def server_stats(body, query):
+    return 200, dict(STATS.report(), reference_cache=reference_cache.reference_cache.stats())
+
+
+# (method, path pattern, handler, name used in /stats)
+ROUTES = [
+    ("POST", r"/members", register_member, "register_member"),
+    ("GET", r"/members", lookup_members, "lookup_members"),
+    ("PATCH", r"/members/(\d+)/goal", update_member_goal, "update_member_goal"),
+    ("POST", r"/members/(\d+)/metrics", add_health_metric, "add_health_metric"),
+    ("POST", r"/pt-sessions", book_pt_session, "book_pt_session"),
+    ("POST", r"/pt-sessions/batch", batch_pt_sessions, "batch_pt_sessions"),
+    ("POST", r"/pt-sessions/(\d+)/cancel", cancel_pt_session, "cancel_pt_session"),
+    ("GET", r"/trainers/(\d+)/schedule", trainer_schedule, "trainer_schedule"),
+    ("GET", r"/slots", find_slots, "find_slots"),
+    ("POST", r"/classes", create_class_session, "create_class_session"),
+    ("POST", r"/classes/(\d+)/enrollments", enroll_in_class, "enroll_in_class"),
+    ("GET", r"/classes/(\d+)/enrollments", class_roster, "class_roster"),
+    ("POST", r"/enrollments/(\d+)/cancel", cancel_enrollment, "cancel_enrollment"),
+    ("POST", r"/invoices", create_invoice, "create_invoice"),
+    ("GET", r"/reports/aging", aging_report, "aging_report"),
+    ("GET", r"/reports/debtors", debtors_report, "debtors_report"),
+    ("GET", r"/reports/revenue", revenue_report, "revenue_report"),
+    ("GET", r"/stats", server_stats, "stats"),
+]
+ROUTES = [(method, re.compile(pattern + "$"), handler, name) for method, pattern, handler, name in ROUTES]
+ROUTE_NAMES = [name for _, _, _, name in ROUTES] + ["not_found"]
+
+
+#STATS
+
+
+# latency histogram bucket upper bounds in ms, 0.1ms to ~20s in 25% steps
+BUCKETS = [0.1 * 1.25 ** i for i in range(56)]
+
+
+class Stats:
+    # Request counters in shared memory, created before forking so /stats on any worker
+    # can add up every worker. Each worker only writes its own slice, under its own lock.
+    # Per (worker, route): count, errors, total microseconds, then one counter per bucket.
+
+    FIELDS = 3 + len(BUCKETS) + 1
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.values = RawArray("Q", workers * len(ROUTE_NAMES) * self.FIELDS)
+        self.started = time.time()
+        self.worker = 0
+        self.lock = threading.Lock()
+
+    def slot(self, worker, route):
+        return (worker * len(ROUTE_NAMES) + ROUTE_NAMES.index(route)) * self.FIELDS
+
+    def record(self, route, seconds, error):
+        base = self.slot(self.worker, route)
+        ms = seconds * 1000
+        bucket = next((i for i, bound in enumerate(BUCKETS) if ms <= bound), len(BUCKETS))
+        with self.lock:
+            self.values[base] += 1
+            self.values[base + 1] += int(error)
+            self.values[base + 2] += int(seconds * 1_000_000)
+            self.values[base + 3 + bucket] += 1
+
+    def report(self):
+        uptime = time.time() - self.started
+        routes = {}
+        total = 0
+        for route in ROUTE_NAMES:
+            merged = [0] * self.FIELDS
+            for worker in range(self.workers):
+                base = self.slot(worker, route)
+                for i in range(self.FIELDS):
+                    merged[i] += self.values[base + i]
+            count = merged[0]
+            if not count:
+                continue
+            total += count
+            histogram = merged[3:]
+            routes[route] = {
+                "requests": count,
+                "errors": merged[1],
+                "requests_per_sec": round(count / uptime, 2),
+                "mean_ms": round(merged[2] / count / 1000, 3),
+                "p50_ms": self.percentile(histogram, count, 50),
+                "p95_ms": self.percentile(histogram, count, 95),
+                "p99_ms": self.percentile(histogram, count, 99),
+            }
+        return {
+            "workers": self.workers,
+            "uptime_sec": round(uptime, 1),
+            "requests": total,
+            "requests_per_sec": round(total / uptime, 2),
+            "routes": routes,
+        }
+
+    @staticmethod
+    def percentile(histogram, count, pct):
+        # upper bound of the bucket the percentile falls in
+        target = count * pct / 100
+        seen = 0
+        for i, n in enumerate(histogram):
+            seen += n
+            if seen >= target:
+                return round(BUCKETS[i], 2) if i < len(BUCKETS) else None
+        return None
+
+
+STATS = Stats(1)
+
+
+#SERVER
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive by default
+    timeout = KEEP_ALIVE_TIMEOUT
+    # headers and body are separate writes, with Nagle on every keep-alive response
+    # would wait for the client's delayed ACK (~40ms)
+    disable_nagle_algorithm = True
+    server_version = "HealthClubAPI/1.0"
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def do_PATCH(self):
+        self.dispatch()
+
+    def dispatch(self):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        route_name = "not_found"
+        try:
+            body = self.read_body()
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            for method, pattern, handler, name in ROUTES:
+                match = pattern.match(url.path)
+                if match and method == self.command:
+                    route_name = name
+                    status, payload = handler(body, query, *match.groups())
+                    break
+            else:
+                status, payload = 404, {"error": f"No route for {self.command} {url.path}"}
+        except BadRequest as e:
+            status, payload = 400, {"error": str(e)}
+        except NotFound as e:
+            status, payload = 404, {"error": str(e)}
+        except Conflict as e:
+            status, payload = 409, {"error": str(e)}
+        except ServiceError as e:
+            status, payload = 422, {"error": str(e)}
+        except Exception:
+            # the details (SQL, parameters) only go to the server's log, not to the client
+            print(f"{self.command} {self.path} failed:\n{traceback.format_exc()}", file=sys.stderr, end="")
+            status, payload = 500, {"error": "Internal server error."}
+
+        self.send_json(status, payload)
+        STATS.record(route_name, time.perf_counter() - start, status >= 500)
+
+    def read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            # we can't tell where this body ends, so the connection can't be reused
+            self.close_connection = True
+            raise BadRequest("Content-Length must be a non-negative integer.")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise BadRequest("Body must be JSON.")
+        if not isinstance(body, dict):
+            raise BadRequest("Body must be a JSON object.")
+        return body
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload, default=to_json).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # one line per request would be the bottleneck under load
+        if self.server.access_log:
+            super().log_message(format, *args)
+
+
+class ClubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def run_worker(sock, access_log):
+    server = ClubServer(sock.getsockname()[:2], Handler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.access_log = access_log
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def serve(host, port, workers, access_log=False):
+    global STATS
+
+    sock = socket.create_server((host, port), backlog=ClubServer.request_queue_size)
+    if not hasattr(os, "fork"):
+        # Windows: no fork, so a single process
+        workers = 1
+    STATS = Stats(workers)
+    print(f"Listening on http://{host}:{port} with {workers} worker(s)")
+    if workers == 1:
+        run_worker(sock, access_log)
+        return
+
+    children = []
+    for worker in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            STATS.worker = worker
+            # connections in the pool must not be shared with the parent
+            engine.dispose(close=False)
+            run_worker(sock, access_log)
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        stop(None, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for the health club.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--access-log", action="store_true", help="print a line for every request")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.access_log)
+
+
+if __name__ == "__main__":
+    main()
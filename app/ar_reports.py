@@ -0,0 +1,96 @@
+import argparse
+import time
+
+from config import bulk_engine, session_scope
+from services import ServiceError, receivables
+
+# Accounts receivable and revenue reports for the front office.
+#
+#   python -m app.ar_reports aging                 open balance of the whole club by age
+#   python -m app.ar_reports aging --member 42     the same for one member
+#   python -m app.ar_reports debtors --limit 20    biggest open balances, split by age
+#   python -m app.ar_reports revenue --months 12   invoiced per month, category and status
+#   python -m app.ar_reports refresh               just catch the aggregates up
+#
+# Needs python -m app.create_invoice_summary once.
+
+
+def print_buckets(buckets):
+    for label, bucket in buckets.items():
+        print(f"  {label:>6} days  {bucket['invoices']:>8,} invoices  {bucket['amount']:>14,.2f}")
+    total = sum(b["amount"] for b in buckets.values())
+    print(f"  {'total':>11}  {sum(b['invoices'] for b in buckets.values()):>8,} invoices  {total:>14,.2f}")
+
+
+def aging(member_id=None):
+    with session_scope() as db:
+        if member_id is None:
+            buckets = receivables.aging_totals(db)
+            title = "Open balance by age, whole club"
+        else:
+            member, buckets = receivables.member_aging(db, member_id)
+            title = f"Open balance by age, member {member.id} ({member.full_name})"
+    print(title)
+    print_buckets(buckets)
+
+
+def debtors(limit):
+    with session_scope() as db:
+        rows = receivables.top_debtors(db, limit)
+    labels = [label for label, _ in receivables.AGING_BUCKETS]
+    print(f"{'member':>8}  {'name':<28} {'open':>11}  " + "  ".join(f"{label:>10}" for label in labels) + "  oldest")
+    for row in rows:
+        print(
+            f"{row['member_id']:>8}  {row['full_name'][:28]:<28} {row['open_amount']:>11,.2f}  "
+            + "  ".join(f"{row['aging'][label]['amount']:>10,.2f}" for label in labels)
+            + f"  {row['oldest_open_at']:%Y-%m-%d}"
+        )
+
+
+def revenue(months):
+    with session_scope() as db:
+        rows = receivables.monthly_revenue(db, months)
+    month = None
+    for row in rows:
+        if row["month"] != month:
+            month = row["month"]
+            total = sum(r["amount"] for r in rows if r["month"] == month)
+            print(f"\n{month:%Y-%m}  total {total:,.2f}")
+        print(f"  {row['category']:<20} {row['status']:<8} {row['invoices']:>8,} invoices  {row['amount']:>14,.2f}")
+
+
+def refresh():
+    # after a big import the catch-up can take a while, so no statement timeout here
+    start = time.perf_counter()
+    with bulk_engine.begin() as conn:
+        days, members = receivables.refresh(conn)
+    print(f"Recomputed {days:,} days and {members:,} member balances in {time.perf_counter() - start:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accounts receivable and revenue reports.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    aging_parser = commands.add_parser("aging", help="open balance by age")
+    aging_parser.add_argument("--member", type=int, help="only this member")
+    debtors_parser = commands.add_parser("debtors", help="members with the biggest open balance")
+    debtors_parser.add_argument("--limit", type=int, default=receivables.DEBTORS_LIMIT)
+    revenue_parser = commands.add_parser("revenue", help="invoiced amounts per month")
+    revenue_parser.add_argument("--months", type=int, default=receivables.REVENUE_MONTHS)
+    commands.add_parser("refresh", help="bring the summary tables up to date")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "aging":
+            aging(args.member)
+        elif args.command == "debtors":
+            debtors(args.limit)
+        elif args.command == "revenue":
+            revenue(args.months)
+        else:
+            refresh()
+    except ServiceError as e:
+        raise SystemExit(str(e))
+
+
+if __name__ == "__main__":
+    main()
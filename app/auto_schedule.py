@@ -0,0 +1,74 @@
+import argparse
+import csv
+import time
+from datetime import datetime, timedelta
+
+from config import session_scope
+from services import ServiceError
+from services.auto_scheduler import schedule_requests
+from services.scheduling import OPEN_HOUR, CLOSE_HOUR
+
+# Schedules a whole batch of PT requests at once (e.g. everyone who signed up for a program
+# launch). The CSV has the columns
+#   member_id, specialty, earliest, latest, duration_minutes, participants
+# with times as YYYY-MM-DD HH:MM; specialty and participants can be left empty.
+#
+#   python -m app.auto_schedule launch_requests.csv --dry-run
+#   python -m app.auto_schedule launch_requests.csv
+
+
+def read_requests(path):
+    requests = []
+    with open(path, newline="") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                requests.append({
+                    "member_id": int(row["member_id"]),
+                    "specialty": (row.get("specialty") or "").strip() or None,
+                    "earliest": datetime.strptime(row["earliest"].strip(), "%Y-%m-%d %H:%M"),
+                    "latest": datetime.strptime(row["latest"].strip(), "%Y-%m-%d %H:%M"),
+                    "duration": timedelta(minutes=int(row["duration_minutes"])),
+                    "participants": int(row.get("participants") or 1),
+                })
+            except (KeyError, TypeError, ValueError) as e:
+                raise SystemExit(f"{path} line {line_no}: {e}")
+    return requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assign trainers, rooms and times to a batch of PT requests.")
+    parser.add_argument("requests", help="CSV file with the requests")
+    parser.add_argument("--open-hour", type=int, default=OPEN_HOUR)
+    parser.add_argument("--close-hour", type=int, default=CLOSE_HOUR)
+    parser.add_argument("--dry-run", action="store_true", help="show the plan without booking anything")
+    args = parser.parse_args()
+
+    requests = read_requests(args.requests)
+    start = time.perf_counter()
+    try:
+        with session_scope() as db:
+            placed, unplaced = schedule_requests(
+                db, requests, args.open_hour, args.close_hour, dry_run=args.dry_run
+            )
+    except ServiceError as e:
+        raise SystemExit(str(e))
+    elapsed = time.perf_counter() - start
+
+    for p in placed:
+        booked = f"PT {p['session_id']}" if "session_id" in p else "plan"
+        print(
+            f"  request {p['request'] + 1:>4}: member {p['member_id']} "
+            f"{p['start_time']:%Y-%m-%d %H:%M}-{p['end_time']:%H:%M} "
+            f"trainer {p['trainer_id']} ({p['trainer_name']}) room {p['room_id']} ({p['room_name']}) [{booked}]"
+        )
+    if unplaced:
+        print("\nCould not place:")
+        for index, reason in unplaced:
+            print(f"  request {index + 1:>4}: member {requests[index]['member_id']}: {reason}")
+
+    action = "planned" if args.dry_run else "booked"
+    print(f"\n{len(placed)} of {len(requests)} requests {action} in {elapsed:.2f}s, {len(unplaced)} not placed.")
+
+
+if __name__ == "__main__":
+    main()
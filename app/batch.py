@@ -0,0 +1,208 @@
+import json
+import sys
+import time
+
+from config import SessionLocal
+from services import ServiceError, members, admin
+from services.validation import BadRequest, required, as_int, as_float, as_date, as_datetime
+
+# Batch mode for app/main.py: the menu operations without the menu. Reads one JSON object
+# per line, e.g.
+#
+#   {"op": "register_member", "full_name": "Ann Lee", "email": "ann@example.com"}
+#   {"op": "book_pt_session", "member_id": 4, "trainer_id": 2, "room_id": 1,
+#    "start_time": "2025-03-01T10:00", "end_time": "2025-03-01T11:00", "ref": "anything"}
+#
+# and runs each through the same service function the menu (and the API, same field
+# checks) uses. Records share one session, which commits every --commit-every records
+# instead of after each one. Records run straight through, without a savepoint each (that
+# would roughly double the statements of a clean batch). When one is refused or fails the
+# batch so far is rolled back, the records before it run again and the rest of the batch
+# each get a savepoint, so a bad record costs only itself. For every record a JSON line
+# goes to the output (line, op, ref, status ok/refused/invalid/error, id or error), once
+# the batch it's in has committed.
+#
+#   python -m app.main --batch operations.jsonl --output results.jsonl --commit-every 500
+
+DEFAULT_COMMIT_EVERY = 500
+
+
+# Each parser turns a record into the service function's arguments (after the session),
+# checked up front so an invalid record never touches the database.
+
+
+def register_member_args(r):
+    return (
+        required(r, "full_name"), required(r, "email"),
+        as_date(r.get("date_of_birth"), "date_of_birth"), r.get("gender"), r.get("phone"),
+    )
+
+
+def update_member_goal_args(r):
+    return (
+        as_int(required(r, "member_id"), "member_id"), r.get("fitness_goal"),
+        as_float(r.get("target_weight"), "target_weight"),
+    )
+
+
+def add_health_metric_args(r):
+    heart_rate = r.get("heart_rate")
+    return (
+        as_int(required(r, "member_id"), "member_id"), as_datetime(r.get("recorded_at"), "recorded_at"),
+        as_float(r.get("weight"), "weight"), None if heart_rate in (None, "") else as_int(heart_rate, "heart_rate"),
+        as_float(r.get("body_fat_percentage"), "body_fat_percentage"),
+    )
+
+
+def book_pt_session_args(r):
+    return (
+        as_int(required(r, "member_id"), "member_id"), as_int(required(r, "trainer_id"), "trainer_id"),
+        as_int(required(r, "room_id"), "room_id"), as_datetime(required(r, "start_time"), "start_time"),
+        as_datetime(required(r, "end_time"), "end_time"),
+    )
+
+
+def create_class_session_args(r):
+    return (
+        required(r, "title"), as_int(required(r, "room_id"), "room_id"),
+        as_int(required(r, "trainer_id"), "trainer_id"), as_int(required(r, "capacity"), "capacity"),
+        as_datetime(required(r, "start_time"), "start_time"), as_datetime(required(r, "end_time"), "end_time"),
+    )
+
+
+def create_invoice_args(r):
+    return as_int(required(r, "member_id"), "member_id"), required(r, "amount"), r.get("description")
+
+
+# op -> (service function, parser)
+OPERATIONS = {
+    "register_member": (members.register_member, register_member_args),
+    "update_member_goal": (members.update_member_goal, update_member_goal_args),
+    "add_health_metric": (members.add_health_metric, add_health_metric_args),
+    "book_pt_session": (members.book_pt_session, book_pt_session_args),
+    "create_class_session": (admin.create_class_session, create_class_session_args),
+    "create_invoice": (admin.create_invoice, create_invoice_args),
+}
+
+
+def parse_record(line_no, line):
+    # returns (result, operation, args); operation is None when the record is invalid and
+    # result already says why
+    result = {"line": line_no}
+    try:
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise BadRequest("A record must be a JSON object.")
+    except ValueError as e:
+        return dict(result, status="invalid", error=f"Not valid JSON: {e}"), None, None
+    except BadRequest as e:
+        return dict(result, status="invalid", error=str(e)), None, None
+
+    result["op"] = record.get("op")
+    if "ref" in record:
+        result["ref"] = record["ref"]
+    if record.get("op") not in OPERATIONS:
+        error = f"Unknown op, expected one of: {', '.join(OPERATIONS)}"
+        return dict(result, status="invalid", error=error), None, None
+    operation, parse = OPERATIONS[record["op"]]
+    try:
+        args = parse(record)
+    except BadRequest as e:
+        return dict(result, status="invalid", error=str(e)), None, None
+    return result, operation, args
+
+
+def failed(result, e):
+    if isinstance(e, ServiceError):
+        return dict(result, status="refused", error=str(e))
+    return dict(result, status="error", error=f"{e.__class__.__name__}: {e}".splitlines()[0])
+
+
+def run_record(db, result, operation, args):
+    # one record in its own savepoint, for the rest of a batch once a record has failed
+    if operation is None:
+        return result
+    try:
+        with db.begin_nested():
+            obj = operation(db, *args)
+    except Exception as e:
+        return failed(result, e)
+    return dict(result, status="ok", id=obj.id)
+
+
+def run_records(db, records):
+    # [(result, operation, args)] -> results, nothing committed yet
+    results = []
+    for n, (result, operation, args) in enumerate(records):
+        if operation is None:
+            results.append(result)
+            continue
+        try:
+            obj = operation(db, *args)
+        except Exception as e:
+            # A refusal can come after the record already wrote something (a failed insert),
+            # so the batch so far is undone: the records before this one run again the same
+            # way, the ones after it each in a savepoint
+            db.rollback()
+            return run_records(db, records[:n]) + [failed(result, e)] + [run_record(db, *r) for r in records[n + 1:]]
+        results.append(dict(result, status="ok", id=obj.id))
+    return results
+
+
+def commit(db, pending, out, counts):
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        # nothing in this batch was saved after all
+        for result in pending:
+            if result["status"] == "ok":
+                result.update(status="error", error=f"Batch commit failed: {e.__class__.__name__}: {e}".splitlines()[0])
+                result.pop("id")
+    # the identity map only holds what this batch created
+    db.expunge_all()
+    for result in pending:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+        out.write(json.dumps(result) + "\n")
+    out.flush()
+    pending.clear()
+
+
+def run_batch(source, out, commit_every=DEFAULT_COMMIT_EVERY):
+    # returns {status: count}
+    counts = {}
+    records = []
+    db = SessionLocal()
+    try:
+        for line_no, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            records.append(parse_record(line_no, line))
+            if len(records) >= commit_every:
+                commit(db, run_records(db, records), out, counts)
+                records.clear()
+        commit(db, run_records(db, records), out, counts)
+    finally:
+        db.close()
+    return counts
+
+
+def main_batch(path, output=None, commit_every=DEFAULT_COMMIT_EVERY):
+    source = sys.stdin if path == "-" else open(path)
+    out = sys.stdout if output in (None, "-") else open(output, "w")
+    start = time.perf_counter()
+    try:
+        counts = run_batch(source, out, commit_every)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    total = sum(counts.values())
+    print(
+        f"{total:,} records in {elapsed:.2f}s ({total / elapsed:,.0f}/sec): "
+        + ", ".join(f"{status} {n:,}" for status, n in sorted(counts.items())),
+        file=sys.stderr,
+    )
+    return counts
@@ -0,0 +1,281 @@
+import argparse
+import json
+import random
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from config import engine, session_scope
+from app.generate_data import FIRST_NAMES, generate
+from services import (
+    ServiceError, members as member_ops, trainers as trainer_ops, admin as admin_ops, scheduling, enrollments,
+    receivables, profiling,
+)
+from services.availability import pt_availability
+
+# Benchmarks every operation the CLI offers without anybody typing.
+# Each operation calls the same service function app/main.py does, with generated
+# arguments and its own session_scope(), and for every call we record latency and, through
+# services/profiling.py, how many SQL statements it sent, their time on the database and
+# how many rows came back. Repeated statements (N+1 suspects) and the slowest statements
+# of each operation go in the report too. The report is JSON so two runs (e.g. two
+# commits) can be diffed.
+#
+#   python -m app.benchmark --scale 1k 100k --generate --output bench_before.json
+#   python -m app.benchmark --output bench_after.json --compare bench_before.json
+
+# dataset sizes, keyed by roughly how many rows the big tables have
+SCALES = {
+    "1k": dict(members=1_000, trainers=10, rooms=10, class_sessions=200,
+               pt_sessions=1_000, metrics=1_000, invoices=1_000),
+    "100k": dict(members=100_000, trainers=100, rooms=40, class_sessions=10_000,
+                 pt_sessions=100_000, metrics=100_000, invoices=100_000),
+    "10m": dict(members=1_000_000, trainers=500, rooms=200, class_sessions=500_000,
+                pt_sessions=10_000_000, metrics=10_000_000, invoices=10_000_000),
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def id_range(table):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT MIN(id), MAX(id) FROM {table}")).one()
+
+
+#GENERATED CALLS FOR EACH OPERATION
+
+
+def future_slot(rng, hours=1):
+    # far enough in the future that bookings mostly succeed instead of clashing with generated data
+    start = datetime(2035, 1, 1, rng.randint(6, 21)) + timedelta(days=rng.randrange(3650))
+    return start, start + timedelta(hours=hours)
+
+
+def schedule_window(rng, days=7):
+    # a week somewhere in the last three months, where the generated sessions are
+    start = datetime.combine(date.today(), datetime.min.time()) - timedelta(days=rng.randrange(90))
+    return start, start + timedelta(days=days)
+
+
+def operations(rng, ids, run_id):
+    # name -> function returning the next call, a function that takes the session
+    members, trainers, rooms = ids["members"], ids["trainers"], ids["rooms"]
+    upcoming_classes = ids["upcoming_classes"] or [0]
+    counter = iter(range(10**9))
+
+    def member():
+        return rng.randint(*members)
+
+    def trainer():
+        return rng.randint(*trainers)
+
+    def room():
+        return rng.randint(*rooms)
+
+    def call(func, *args):
+        return lambda db: func(db, *args)
+
+    return {
+        "register_member": lambda: call(
+            member_ops.register_member, "Bench Member", f"bench.{run_id}.{next(counter)}@example.com", date(1990, 5, 1),
+        ),
+        "update_member_goal": lambda: call(
+            member_ops.update_member_goal, member(), "Benchmark goal", round(rng.uniform(55, 95), 1),
+        ),
+        "add_health_metric": lambda: call(
+            member_ops.add_health_metric, member(), None,
+            round(rng.uniform(55, 110), 1), rng.randint(50, 100), round(rng.uniform(10, 35), 1),
+        ),
+        "book_pt_session": lambda: call(member_ops.book_pt_session, member(), trainer(), room(), *future_slot(rng)),
+        "view_trainer_schedule": lambda: call(trainer_ops.trainer_schedule, trainer(), *schedule_window(rng)),
+        "trainer_lookup_member": lambda: call(
+            lambda db, name: list(trainer_ops.search_members(db, name)), rng.choice(FIRST_NAMES)[:3],
+        ),
+        "find_pt_slots": lambda: call(
+            scheduling.find_free_slots, member(), *schedule_window(rng, 30), timedelta(hours=1),
+        ),
+        "enroll_in_class": lambda: call(enrollments.enroll, rng.choice(upcoming_classes), member()),
+        "create_class_session": lambda: call(
+            admin_ops.create_class_session, "Bench Class", room(), trainer(), 20, *future_slot(rng),
+        ),
+        "create_invoice": lambda: call(admin_ops.create_invoice, member(), "49.99", "Monthly membership"),
+        # these also refresh the AR summaries, so they pay for the invoices created above
+        "ar_aging_report": lambda: call(receivables.aging_totals),
+        "top_debtors": lambda: call(receivables.top_debtors, 20),
+        "revenue_report": lambda: call(receivables.monthly_revenue, 12),
+    }
+
+
+def run_call(func):
+    # refusals (double booking, unknown id, ...) are normal outcomes, not errors
+    try:
+        with session_scope() as db:
+            func(db)
+    except ServiceError:
+        return False
+    return True
+
+
+def bench_operation(name, make_call, iterations, warmup):
+    for _ in range(warmup):
+        try:
+            run_call(make_call())
+        except Exception:
+            pass
+
+    latencies = []
+    statements = 0
+    rows = 0
+    db_ms = 0
+    errors = 0
+    refused = 0
+    for _ in range(iterations):
+        func = make_call()
+        with profiling.operation(name) as profile:
+            start = time.perf_counter()
+            try:
+                if not run_call(func):
+                    refused += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+        statements += profile.statements
+        rows += profile.rows
+        db_ms += profile.db_ms
+
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "errors": errors,
+        "refused": refused,
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p90_ms": round(percentile(latencies, 90), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3),
+        "statements_per_call": round(statements / iterations, 2),
+        "rows_per_call": round(rows / iterations, 2),
+        "db_ms_per_call": round(db_ms / iterations, 3),
+    }
+
+
+def bench_scale(label, iterations, warmup, seed, only=None):
+    ids = {table: id_range(table) for table in ("members", "trainers", "rooms")}
+    if any(low is None for low, high in ids.values()):
+        raise SystemExit("Database is empty, run with --generate or python -m app.generate_data first.")
+    with engine.connect() as conn:
+        # enrolling only works before the class starts
+        ids["upcoming_classes"] = conn.execute(
+            text("SELECT id FROM class_sessions WHERE start_time > now() ORDER BY start_time LIMIT 500")
+        ).scalars().all()
+
+    with engine.connect() as conn:
+        counts = {
+            table: conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+            for table in ("members", "pt_sessions", "class_sessions", "health_metrics", "invoices")
+        }
+
+    rng = random.Random(seed)
+    results = {}
+    profiling.reset()
+    for name, make_call in operations(rng, ids, f"{label}.{int(time.time())}").items():
+        if only and name not in only:
+            continue
+        results[name] = bench_operation(name, make_call, iterations, warmup)
+        r = results[name]
+        print(
+            f"  {name:<24} p50 {r['p50_ms']:>9.2f}ms  p95 {r['p95_ms']:>9.2f}ms  "
+            f"{r['statements_per_call']:>7.1f} stmts  {r['rows_per_call']:>10.1f} rows"
+        )
+    for name, p in profiling.summary().items():
+        results[name]["slowest"] = p["slowest"]
+        results[name]["n_plus_one"] = p["n_plus_one"]
+        for suspect in p["n_plus_one"]:
+            print(f"  N+1? {name}: {suspect['max_repeats']}x {suspect['statement'][:90]}")
+    return {"row_counts": counts, "operations": results}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared to {baseline_path} (commit {baseline.get('commit')}):")
+    for label, scale in report["scales"].items():
+        old_scale = baseline.get("scales", {}).get(label)
+        if not old_scale:
+            continue
+        for name, r in scale["operations"].items():
+            old = old_scale["operations"].get(name)
+            if not old:
+                continue
+            change = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0
+            print(
+                f"  [{label}] {name:<24} p95 {old['p95_ms']:>9.2f} -> {r['p95_ms']:>9.2f}ms ({change:+.0f}%)  "
+                f"stmts {old['statements_per_call']} -> {r['statements_per_call']}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the club operations.")
+    parser.add_argument("--scale", nargs="+", choices=list(SCALES), default=["current"],
+                        help="dataset sizes to run; with --generate each one is regenerated first")
+    parser.add_argument("--generate", action="store_true",
+                        help="TRUNCATE and regenerate the data for every scale before benchmarking it")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", help="only run these operations")
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--slow-ms", type=float, help="also log statements at least this slow")
+    args = parser.parse_args()
+
+    # statement logging would dominate the timings; the profiler only counts
+    engine.echo = False
+    profiling.enable(args.slow_ms)
+    if args.slow_ms is None:
+        profiling.slow_log = None  # just count, no slow-query log
+
+    if args.generate and args.scale == ["current"]:
+        parser.error("--generate needs --scale")
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "iterations": args.iterations,
+        "seed": args.seed,
+        "scales": {},
+    }
+    for label in args.scale:
+        if args.generate:
+            generate(seed=args.seed, truncate=True, **SCALES[label])
+            pt_availability.clear()
+        print(f"\nBenchmark [{label}]")
+        report["scales"][label] = bench_scale(label, args.iterations, args.warmup, args.seed, args.only)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import argparse
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from config import bulk_engine as engine
+from services import ServiceError, receivables
+from services.admin import parse_amount
+
+# Month-end billing: for each member an invoice for the membership fee, and one for every
+# PT session they had in that month (charged per hour, anything not cancelled; nothing in
+# the app marks a session completed) if they had any, all worked out in SQL. Each invoice
+# has its category set, so the revenue report counts PT as PT. Only a month that is over
+# can be billed, sessions still to come would never be.
+# Members go in chunks of consecutive ids. Each chunk is a single INSERT ... SELECT (the
+# PT charges are aggregated in the same statement) and commits together with the progress
+# row in billing_runs, so a run that crashed picks up after the last chunk it committed.
+# A member's invoices for a month are made together, and only if they have none for that
+# month yet (invoices are also unique per member, billing_period and category), so
+# re-running a chunk or a whole month never bills anybody twice; re-running a finished
+# month only bills members added since.
+# Run app/create_billing.py once first on a database made before this existed.
+#
+#   python -m app.billing_run --period 2025-02
+#   python -m app.billing_run --period 2025-02 --fee 49.99 --pt-rate 60 --chunk-size 5000
+
+MEMBERSHIP_FEE = "49.99"
+PT_HOURLY_RATE = "60.00"
+DEFAULT_CHUNK_SIZE = 5_000
+
+bill_chunk_sql = text("""
+WITH chunk AS (
+    SELECT id FROM members
+    WHERE id > :after_member_id
+    ORDER BY id
+    LIMIT :chunk_size
+),
+pt AS (
+    SELECT p.member_id,
+           count(*) AS sessions,
+           sum(round(extract(epoch FROM p.end_time - p.start_time) / 3600 * :pt_rate, 2)) AS charge
+    FROM pt_sessions p
+    JOIN chunk c ON c.id = p.member_id
+    WHERE p.status <> 'cancelled'
+      AND p.start_time >= :period_start AND p.start_time < :period_end
+      AND p.end_time <= :period_end
+    GROUP BY p.member_id
+),
+lines AS (
+    SELECT id AS member_id, 'Membership' AS category, CAST(:fee AS numeric) AS amount,
+           'Monthly membership ' || :label AS description
+    FROM chunk
+    UNION ALL
+    SELECT member_id, 'Personal training', charge, 'PT ' || :label || ': ' || sessions || ' session(s)'
+    FROM pt
+),
+inserted AS (
+    INSERT INTO invoices (member_id, created_at, amount, status, description, billing_period, category)
+    SELECT l.member_id, :now, l.amount, 'unpaid', l.description, :period_start, l.category
+    FROM lines l
+    WHERE NOT EXISTS (
+        SELECT 1 FROM invoices i WHERE i.member_id = l.member_id AND i.billing_period = :period_start
+    )
+    ON CONFLICT (member_id, billing_period, category) DO NOTHING
+    RETURNING member_id, amount
+)
+SELECT (SELECT max(id) FROM chunk) AS last_member_id,
+       (SELECT count(*) FROM chunk) AS members,
+       (SELECT count(DISTINCT member_id) FROM inserted) AS billed,
+       (SELECT count(*) FROM inserted) AS invoices,
+       (SELECT coalesce(sum(amount), 0) FROM inserted) AS amount
+""")
+
+start_run_sql = text("""
+INSERT INTO billing_runs (billing_period, last_member_id, invoices, total_amount, started_at)
+VALUES (:period_start, 0, 0, 0, :now)
+ON CONFLICT (billing_period) DO NOTHING
+""")
+
+run_state_sql = text("""
+SELECT last_member_id, invoices, total_amount, finished_at
+FROM billing_runs
+WHERE billing_period = :period_start
+""")
+
+progress_sql = text("""
+UPDATE billing_runs
+SET last_member_id = GREATEST(last_member_id, :last_member_id),
+    invoices = invoices + :invoices,
+    total_amount = total_amount + :amount
+WHERE billing_period = :period_start
+""")
+
+finish_sql = text("UPDATE billing_runs SET finished_at = :now WHERE billing_period = :period_start")
+
+lock_sql = text("SELECT pg_try_advisory_lock(hashtext('billing_run'), :key)")
+unlock_sql = text("SELECT pg_advisory_unlock(hashtext('billing_run'), :key)")
+
+
+def parse_period(value):
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("period must look like 2025-02")
+
+
+def previous_month(today=None):
+    first = (today or date.today()).replace(day=1)
+    return (first - timedelta(days=1)).replace(day=1)
+
+
+def next_month(first):
+    return (first + timedelta(days=32)).replace(day=1)
+
+
+def billing_run(period_start, fee=MEMBERSHIP_FEE, pt_rate=PT_HOURLY_RATE, chunk_size=DEFAULT_CHUNK_SIZE):
+    fee = parse_amount(fee)
+    pt_rate = parse_amount(pt_rate)
+    if next_month(period_start) > date.today():
+        # sessions still to come would never be billed
+        raise ServiceError(f"{period_start:%Y-%m} isn't over yet, it can be billed from {next_month(period_start)}.")
+    params = {
+        "period_start": period_start,
+        "period_end": next_month(period_start),
+        "label": f"{period_start:%Y-%m}",
+        "fee": fee,
+        "pt_rate": pt_rate,
+        "chunk_size": chunk_size,
+    }
+
+    with engine.connect() as conn:
+        # one run per month at a time; the lock is released below, or with the connection if we crash
+        lock_key = {"key": period_start.year * 100 + period_start.month}
+        got_lock = conn.execute(lock_sql, lock_key).scalar()
+        conn.commit()
+        if not got_lock:
+            raise SystemExit(f"Another billing run for {params['label']} is already running.")
+
+        try:
+            with conn.begin():
+                conn.execute(start_run_sql, dict(params, now=datetime.now()))
+                after, billed, total, finished_at = conn.execute(run_state_sql, params).one()
+            if finished_at:
+                print(f"{params['label']} was finished on {finished_at:%Y-%m-%d %H:%M}, "
+                      f"billing members added since then")
+            elif after:
+                print(f"Resuming {params['label']} after member {after} ({billed:,} invoices so far)")
+            print(f"Billing {params['label']}: fee {fee}, PT {pt_rate}/hour, chunks of {chunk_size:,} members")
+
+            start = time.perf_counter()
+            members = members_billed = invoices = 0
+            amount = 0
+            while True:
+                chunk_start = time.perf_counter()
+                with conn.begin():
+                    row = conn.execute(bill_chunk_sql, dict(params, after_member_id=after, now=datetime.now())).one()
+                    if not row.members:
+                        break
+                    conn.execute(progress_sql, dict(
+                        params, last_member_id=row.last_member_id, invoices=row.invoices, amount=row.amount
+                    ))
+                after = row.last_member_id
+                members += row.members
+                members_billed += row.billed
+                invoices += row.invoices
+                amount += row.amount
+                chunk_time = time.perf_counter() - chunk_start
+                print(
+                    f"  up to member {after}: {row.invoices:,} invoices in {chunk_time:.2f}s "
+                    f"({row.invoices / chunk_time:,.0f}/sec)"
+                )
+
+            with conn.begin():
+                conn.execute(finish_sql, dict(params, now=datetime.now()))
+            elapsed = time.perf_counter() - start
+
+            # a whole month of members changed at once; catch the AR/revenue aggregates up here,
+            # without the app's statement timeout, instead of in the next report
+            with conn.begin():
+                if conn.execute(text("SELECT to_regproc('refresh_invoice_summaries') IS NOT NULL")).scalar():
+                    days, refreshed = receivables.refresh(conn)
+                    print(f"  AR summaries refreshed for {refreshed:,} members")
+        finally:
+            # the pool keeps the connection open, so a session lock has to be given back by hand
+            conn.rollback()
+            conn.execute(unlock_sql, lock_key)
+            conn.commit()
+
+    skipped = members - members_billed
+    print(
+        f"\n{invoices:,} invoices for {amount} in {elapsed:.2f}s ({invoices / elapsed:,.0f} invoices/sec)"
+        + (f", {skipped:,} members already billed" if skipped else "")
+    )
+    return invoices, amount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bill every member for a month.")
+    parser.add_argument("--period", type=parse_period, default=previous_month(),
+                        help="month to bill as YYYY-MM (default: last month)")
+    parser.add_argument("--fee", default=MEMBERSHIP_FEE, help="monthly membership fee")
+    parser.add_argument("--pt-rate", default=PT_HOURLY_RATE, help="charge per hour of PT (sessions not cancelled)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="members per transaction")
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    try:
+        billing_run(args.period, args.fee, args.pt_rate, args.chunk_size)
+    except ServiceError as e:
+        raise SystemExit(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+import argparse
+import multiprocessing
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.orm import sessionmaker
+
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, OVERLAP_MODE, engine, bulk_engine, session_scope
+from app.benchmark import id_range, percentile
+from app.class_rush import warm_pool
+from services import ServiceError, Conflict, members, admin, enrollments
+
+# Load test for the write paths that race: PT bookings (check, then insert), class
+# enrollments and health metrics, from many threads or processes at once, with demand
+# skewed the way it is at a real club: a few trainers and rooms everybody wants (Zipf)
+# and most bookings in the evening peak. Deadlocks and serialization failures are
+# retried like a client would, and counted. Afterwards the test window is audited for
+# overlapping PT sessions and oversold classes, i.e. whatever got past the checks.
+#
+# Everything happens in a week far in the future that nothing else uses, and is deleted
+# again at the end (--keep to look at it).
+#
+#   python -m app.booking_load --workers 32 --requests 50
+#   python -m app.booking_load --workers 8 --mode processes --isolation serializable
+
+OPEN_HOUR, CLOSE_HOUR = 6, 22
+PEAK_HOURS = (17, 20)          # [from, to) most bookings want to start in
+PEAK_SHARE = 0.7
+SESSION_MINUTES = (30, 60, 60, 60, 90)
+DEFAULT_MIX = "book=70,enroll=15,metric=15"
+
+# SQLSTATE -> what happened; deadlocks and serialization failures are worth a retry
+SQLSTATES = {
+    "40P01": "deadlock",
+    "40001": "serialization_failure",
+    "57014": "statement_timeout",
+    "55P03": "lock_timeout",
+    "P0001": "refused",  # raised by a trigger (prevent_overlapping_pt)
+}
+RETRYABLE = {"deadlock", "serialization_failure"}
+
+overlap_pairs_sql = """
+SELECT '{resource}' AS resource, a.{resource}_id AS resource_id, a.id AS first_id, b.id AS second_id,
+       a.start_time AS first_start, b.start_time AS second_start
+FROM pt_sessions a
+JOIN pt_sessions b
+  ON b.{resource}_id = a.{resource}_id AND b.id > a.id
+ AND b.start_time < a.end_time AND a.start_time < b.end_time
+WHERE a.status <> 'cancelled' AND b.status <> 'cancelled'
+  AND a.start_time >= :window_start - interval '1 day' AND a.start_time < :window_end
+  AND b.start_time >= :window_start - interval '1 day' AND b.start_time < :window_end
+"""
+
+# every pair of live sessions that share a trainer, room or member and overlap in time
+overlaps_sql = text(
+    " UNION ALL ".join(overlap_pairs_sql.format(resource=r) for r in ("trainer", "room", "member"))
+    + " ORDER BY 1, 2, 3"
+)
+
+classes_audit_sql = text("""
+SELECT c.id, c.capacity, c.enrolled_count,
+       count(e.id) FILTER (WHERE e.status = 'enrolled') AS enrolled,
+       count(e.id) FILTER (WHERE e.status = 'waitlisted') AS waitlisted
+FROM class_sessions c
+LEFT JOIN class_enrollments e ON e.class_id = c.id
+WHERE c.id = ANY(:class_ids)
+GROUP BY c.id
+ORDER BY c.id
+""")
+
+# only what this run created, the window may have been picked by hand
+cleanup_sql = [
+    "DELETE FROM class_enrollments WHERE class_id = ANY(:class_ids)",
+    "DELETE FROM class_sessions WHERE id = ANY(:class_ids)",
+    "DELETE FROM pt_sessions WHERE id = ANY(:pt_session_ids)",
+    "DELETE FROM health_metrics WHERE id = ANY(:metric_ids)",
+]
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("book", "enroll", "metric") or not weight.isdigit():
+            raise argparse.ArgumentTypeError("mix looks like book=70,enroll=15,metric=15")
+        mix[name] = int(weight)
+    return mix
+
+
+def zipf_weights(count, skew):
+    # cumulative weights for rng.choices: the first id is the most wanted one
+    return list(accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+class Demand:
+    # who books what and when; plain data so it can be sent to worker processes
+
+    def __init__(self, rng, args, window_start, class_ids):
+        self.window_start = window_start
+        self.days = args.days
+        self.trainers = rng.sample(range(args.trainer_range[0], args.trainer_range[1] + 1), args.hot_trainers)
+        self.rooms = rng.sample(range(args.room_range[0], args.room_range[1] + 1), args.hot_rooms)
+        self.members = rng.sample(range(args.member_range[0], args.member_range[1] + 1), args.members)
+        self.trainer_weights = zipf_weights(len(self.trainers), args.skew)
+        self.room_weights = zipf_weights(len(self.rooms), args.skew)
+        self.class_ids = class_ids
+        self.class_weights = zipf_weights(len(class_ids), args.skew) if class_ids else None
+        self.operations = list(args.mix)
+        self.operation_weights = list(accumulate(args.mix.values()))
+
+    def slot(self, rng):
+        day = self.window_start + timedelta(days=rng.randrange(self.days))
+        if rng.random() < PEAK_SHARE:
+            first, last = PEAK_HOURS
+        else:
+            first, last = OPEN_HOUR, CLOSE_HOUR - 1
+        start = day + timedelta(minutes=30 * rng.randrange(first * 2, last * 2))
+        return start, start + timedelta(minutes=rng.choice(SESSION_MINUTES))
+
+    def call(self, rng):
+        # (operation name, function taking the session)
+        name = rng.choices(self.operations, cum_weights=self.operation_weights)[0]
+        member_id = rng.choice(self.members)
+        if name == "enroll" and self.class_ids:
+            class_id = rng.choices(self.class_ids, cum_weights=self.class_weights)[0]
+            return name, lambda db: enrollments.enroll(db, class_id, member_id)
+        if name == "metric":
+            recorded_at = self.slot(rng)[0]
+            weight, heart_rate = round(rng.uniform(55, 110), 1), rng.randint(50, 100)
+            return name, lambda db: members.add_health_metric(db, member_id, recorded_at, weight, heart_rate)
+        trainer_id = rng.choices(self.trainers, cum_weights=self.trainer_weights)[0]
+        room_id = rng.choices(self.rooms, cum_weights=self.room_weights)[0]
+        start, end = self.slot(rng)
+        return "book", lambda db: members.book_pt_session(db, member_id, trainer_id, room_id, start, end)
+
+
+def classify(error):
+    if isinstance(error, ServiceError):
+        return "refused"
+    if isinstance(error, PoolTimeout):
+        return "pool_timeout"
+    code = getattr(getattr(error, "orig", None), "pgcode", None)
+    return SQLSTATES.get(code, "error")
+
+
+def scope_factory(isolation):
+    if isolation is None:
+        return session_scope
+    Session = sessionmaker(bind=engine.execution_options(isolation_level=isolation), expire_on_commit=False)
+
+    @contextmanager
+    def scope():
+        db = Session()
+        try:
+            yield db
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    return scope
+
+
+def client(job):
+    # one client doing its requests back to back; returns plain data for the report
+    demand, seed, requests, retries, isolation = job
+    rng = random.Random(seed)
+    scope = scope_factory(isolation)
+    latencies = {}
+    outcomes = Counter()
+    events = Counter()
+    first_error = None
+    created = {"book": [], "metric": []}
+    for _ in range(requests):
+        name, call = demand.call(rng)
+        start = time.perf_counter()
+        for attempt in range(retries + 1):
+            try:
+                with scope() as db:
+                    row = call(db)
+                outcome = "ok"
+                if name in created:
+                    created[name].append(row.id)
+            except Exception as e:
+                outcome = classify(e)
+                if outcome == "error" and first_error is None:
+                    first_error = f"{name}: {e.__class__.__name__}: {e}".splitlines()[0]
+            if outcome not in RETRYABLE:
+                break
+            events[outcome] += 1
+            if attempt < retries:
+                events["retries"] += 1
+                # back off a little (with jitter) so the same transactions don't collide again
+                time.sleep(rng.uniform(0, 0.005 * 2 ** attempt))
+        else:
+            outcome = "gave_up"
+        latencies.setdefault(name, []).append(time.perf_counter() - start)
+        outcomes[(name, outcome)] += 1
+    return {"latencies": latencies, "outcomes": outcomes, "events": events,
+            "first_error": first_error, "created": created}
+
+
+def init_process():
+    # pooled connections must not be shared with the parent
+    engine.dispose(close=False)
+
+
+def run(jobs, mode, workers):
+    if mode == "processes":
+        with multiprocessing.get_context("fork").Pool(workers, initializer=init_process) as pool:
+            return pool.map(client, jobs)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(client, jobs))
+
+
+def create_test_classes(rng, count, capacity, window_start, room_range, trainer_range):
+    # the classes everybody tries to get into, early morning so they don't block PT rooms at peak
+    class_ids = []
+    for i in range(count):
+        start = window_start + timedelta(days=i % 7, hours=OPEN_HOUR, minutes=60 * (i // 7))
+        for _ in range(20):
+            try:
+                with session_scope() as db:
+                    new_class = admin.create_class_session(
+                        db, "Load test class", rng.randint(*room_range), rng.randint(*trainer_range),
+                        capacity, start, start + timedelta(hours=1),
+                    )
+                class_ids.append(new_class.id)
+                break
+            except Conflict:
+                continue
+    return class_ids
+
+
+def audit(window_start, window_end, class_ids):
+    params = {"window_start": window_start, "window_end": window_end, "class_ids": class_ids}
+    with bulk_engine.connect() as conn:
+        overlaps = conn.execute(overlaps_sql, params).all()
+        classes = conn.execute(classes_audit_sql, params).all()
+        booked = conn.execute(text(
+            "SELECT count(*) FROM pt_sessions WHERE status <> 'cancelled' "
+            "AND start_time >= :window_start AND start_time < :window_end"
+        ), params).scalar()
+
+    print(f"\nAudit of {window_start:%Y-%m-%d} .. {window_end:%Y-%m-%d}: {booked:,} PT sessions booked")
+    problems = 0
+    by_resource = Counter(row.resource for row in overlaps)
+    for resource in ("trainer", "room", "member"):
+        print(f"  overlapping pairs per {resource:<7} {by_resource[resource]:>6}")
+    for row in overlaps[:5]:
+        print(f"    {row.resource} {row.resource_id}: sessions {row.first_id} ({row.first_start:%a %H:%M}) "
+              f"and {row.second_id} ({row.second_start:%a %H:%M})")
+    problems += len(overlaps)
+    for row in classes:
+        bad = []
+        if row.enrolled != row.enrolled_count:
+            bad.append(f"enrolled_count {row.enrolled_count} but {row.enrolled} enrolled")
+        if row.enrolled > row.capacity:
+            bad.append("oversold")
+        if row.waitlisted and row.enrolled < row.capacity:
+            bad.append("free seats with a waitlist")
+        print(f"  class {row.id}: {row.enrolled}/{row.capacity} enrolled, {row.waitlisted} waitlisted"
+              + (f"  PROBLEM: {', '.join(bad)}" if bad else ""))
+        problems += len(bad)
+    print("  OK, nothing got through" if not problems else f"  {problems} problem(s)")
+    return problems
+
+
+def cleanup(results, class_ids):
+    params = {
+        "class_ids": class_ids,
+        "pt_session_ids": [i for result in results for i in result["created"]["book"]],
+        "metric_ids": [i for result in results for i in result["created"]["metric"]],
+    }
+    with bulk_engine.begin() as conn:
+        for sql in cleanup_sql:
+            conn.execute(text(sql), params)
+
+
+def report(results, elapsed):
+    latencies = {}
+    outcomes = Counter()
+    events = Counter()
+    for result in results:
+        for name, values in result["latencies"].items():
+            latencies.setdefault(name, []).extend(values)
+        outcomes.update(result["outcomes"])
+        events.update(result["events"])
+    total = sum(len(values) for values in latencies.values())
+    print(f"\n{total:,} operations in {elapsed:.2f}s ({total / elapsed:,.0f} ops/sec)")
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        counts = ", ".join(f"{outcome} {n:,}" for (op, outcome), n in sorted(outcomes.items()) if op == name)
+        print(
+            f"  {name:<7} {len(values):>7,}  p50 {percentile(values, 50) * 1000:7.1f}ms  "
+            f"p95 {percentile(values, 95) * 1000:7.1f}ms  p99 {percentile(values, 99) * 1000:7.1f}ms  ({counts})"
+        )
+    print(
+        f"  deadlocks {events['deadlock']:,}, serialization failures {events['serialization_failure']:,}, "
+        f"retries {events['retries']:,}"
+    )
+    errors = [result["first_error"] for result in results if result["first_error"]]
+    if errors:
+        print(f"  first error: {errors[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent booking load with a correctness audit.")
+    parser.add_argument("--workers", type=int, default=32, help="clients running at the same time")
+    parser.add_argument("--mode", choices=["threads", "processes"], default="threads")
+    parser.add_argument("--requests", type=int, default=50, help="operations per client")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--hot-trainers", type=int, default=10, help="trainers the demand is spread over")
+    parser.add_argument("--hot-rooms", type=int, default=5)
+    parser.add_argument("--members", type=int, default=500, help="members doing the booking")
+    parser.add_argument("--skew", type=float, default=1.2, help="Zipf exponent, 0 = evenly spread")
+    parser.add_argument("--days", type=int, default=5, help="days in the booking window")
+    parser.add_argument("--classes", type=int, default=3)
+    parser.add_argument("--class-capacity", type=int, default=20)
+    parser.add_argument("--isolation", choices=["read_committed", "repeatable_read", "serializable"])
+    parser.add_argument("--retries", type=int, default=3, help="for deadlocks and serialization failures")
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="first day of the window (default: a random week years from now)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="keep the test data instead of deleting it")
+    args = parser.parse_args()
+
+    args.member_range = id_range("members")
+    args.trainer_range = id_range("trainers")
+    args.room_range = id_range("rooms")
+    if args.member_range[0] is None or args.trainer_range[0] is None or args.room_range[0] is None:
+        raise SystemExit("Database is empty, run python -m app.generate_data first.")
+    args.hot_trainers = min(args.hot_trainers, args.trainer_range[1] - args.trainer_range[0] + 1)
+    args.hot_rooms = min(args.hot_rooms, args.room_range[1] - args.room_range[0] + 1)
+    args.members = min(args.members, args.member_range[1] - args.member_range[0] + 1)
+
+    rng = random.Random(args.seed)
+    # a fresh Monday each run unless --start says otherwise, so runs don't see each other
+    # (after 2100, where the benchmark and load_async never book)
+    window_start = args.start or datetime(2100, 1, 4) + timedelta(weeks=random.randrange(5000))
+    window_start = window_start.replace(hour=0, minute=0, second=0, microsecond=0)
+    window_end = window_start + timedelta(days=args.days)
+    isolation = args.isolation and args.isolation.upper().replace("_", " ")
+
+    class_ids = []
+    if args.mix.get("enroll"):
+        class_ids = create_test_classes(
+            rng, args.classes, args.class_capacity, window_start, args.room_range, args.trainer_range
+        )
+    demand = Demand(rng, args, window_start, class_ids)
+    jobs = [(demand, f"{args.seed}:{i}", args.requests, args.retries, isolation) for i in range(args.workers)]
+
+    print(
+        f"{args.workers} {args.mode} x {args.requests} operations "
+        f"({','.join(f'{name}={weight}' for name, weight in args.mix.items())}), "
+        f"overlap mode {OVERLAP_MODE}, isolation {args.isolation or 'read_committed'}, pool {DB_POOL_SIZE}+{DB_MAX_OVERFLOW}"
+    )
+    print(
+        f"Window {window_start:%Y-%m-%d} + {args.days} days, {len(demand.trainers)} trainers, "
+        f"{len(demand.rooms)} rooms, {len(demand.members)} members, skew {args.skew}, "
+        f"{len(class_ids)} classes of {args.class_capacity}"
+    )
+
+    problems = 0
+    results = []
+    try:
+        if args.mode == "threads":
+            warm_pool()
+        start = time.perf_counter()
+        results = run(jobs, args.mode, args.workers)
+        elapsed = time.perf_counter() - start
+        report(results, elapsed)
+        problems = audit(window_start, window_end, class_ids)
+    finally:
+        if args.keep:
+            print(f"Kept the test data (window starts {window_start:%Y-%m-%d}).")
+        else:
+            cleanup(results, class_ids)
+    if problems:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
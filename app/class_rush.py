@@ -0,0 +1,183 @@
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, engine, session_scope
+from app.benchmark import id_range, percentile, future_slot
+from services import ServiceError, Conflict, admin, enrollments
+
+# The rush when a popular class opens: lots of members hit "enroll" at the same moment.
+# Creates a throwaway class, lets every client enroll at once (they wait on a barrier
+# first), then cancels some seats at once so the waitlist gets promoted. Prints latency
+# percentiles for both, with how much of it was spent waiting for a pooled connection,
+# and checks that the class was never oversold.
+#
+#   python -m app.class_rush --clients 300 --capacity 25 --cancellations 10
+
+audit_sql = text("""
+SELECT c.capacity, c.enrolled_count,
+       count(e.id) FILTER (WHERE e.status = 'enrolled') AS enrolled,
+       count(e.id) FILTER (WHERE e.status = 'waitlisted') AS waitlisted
+FROM class_sessions c
+LEFT JOIN class_enrollments e ON e.class_id = c.id
+WHERE c.id = :class_id
+GROUP BY c.id
+""")
+
+
+def create_rush_class(rng, capacity):
+    rooms = id_range("rooms")
+    trainers = id_range("trainers")
+    for _ in range(20):
+        start, end = future_slot(rng)
+        try:
+            with session_scope() as db:
+                new_class = admin.create_class_session(
+                    db, "Rush test", rng.randint(*rooms), rng.randint(*trainers), capacity, start, end
+                )
+            return new_class.id
+        except Conflict:
+            continue
+    raise SystemExit("Couldn't find a free room for the test class.")
+
+
+def warm_pool():
+    # a running server has its pool open already; without this the first rush mostly
+    # measures how long it takes to open connections
+    connections = [engine.connect() for _ in range(DB_POOL_SIZE)]
+    for conn in connections:
+        conn.close()
+
+
+def rush(calls):
+    # runs every call at the same moment, one thread each;
+    # returns (elapsed, latencies, pool waits, results)
+    barrier = threading.Barrier(len(calls))
+    latencies = []
+    waits = []
+    results = []
+
+    def client(call):
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            with session_scope() as db:
+                db.connection()  # borrow the connection up front so waiting for the pool is timed on its own
+                waits.append(time.perf_counter() - start)
+                outcome = call(db)
+        except ServiceError as e:
+            outcome = ("refused", str(e))
+        except Exception as e:
+            outcome = ("error", f"{e.__class__.__name__}: {e}")
+        latencies.append(time.perf_counter() - start)
+        results.append(outcome)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        list(pool.map(client, calls))
+    return time.perf_counter() - started, sorted(latencies), sorted(waits), results
+
+
+def enroll_call(class_id, member_id):
+    def call(db):
+        enrollment = enrollments.enroll(db, class_id, member_id)
+        return enrollment.status, enrollment.id
+    return call
+
+
+def cancel_call(enrollment_id):
+    def call(db):
+        _, promoted = enrollments.cancel_enrollment(db, enrollment_id)
+        return ("promoted", promoted.id) if promoted else ("freed", None)
+    return call
+
+
+def ms(sorted_values, pct):
+    return f"{percentile(sorted_values, pct) * 1000:.1f}ms"
+
+
+def report(title, elapsed, latencies, waits, results):
+    counts = {}
+    for outcome, _ in results:
+        counts[outcome] = counts.get(outcome, 0) + 1
+    print(f"{title}: {len(latencies)} at once, done in {elapsed:.2f}s")
+    print("  " + ", ".join(f"{outcome} {n}" for outcome, n in sorted(counts.items())))
+    print(
+        f"  latency        p50 {ms(latencies, 50)}  p95 {ms(latencies, 95)}  "
+        f"p99 {ms(latencies, 99)}  max {ms(latencies, 100)}"
+    )
+    if waits:
+        print(f"  of which pool  p50 {ms(waits, 50)}  p95 {ms(waits, 95)}  max {ms(waits, 100)}")
+    errors = [detail for outcome, detail in results if outcome == "error"]
+    if errors:
+        print(f"  first error: {errors[0]}")
+
+
+def audit(class_id):
+    # the invariants the enrollment code promises
+    with engine.connect() as conn:
+        row = conn.execute(audit_sql, {"class_id": class_id}).one()
+    problems = []
+    if row.enrolled != row.enrolled_count:
+        problems.append(f"enrolled_count is {row.enrolled_count} but {row.enrolled} members are enrolled")
+    if row.enrolled > row.capacity:
+        problems.append(f"oversold: {row.enrolled} enrolled for {row.capacity} seats")
+    if row.waitlisted and row.enrolled < row.capacity:
+        problems.append(f"{row.capacity - row.enrolled} free seats while {row.waitlisted} members wait")
+    print(f"Class: {row.enrolled}/{row.capacity} enrolled, {row.waitlisted} on the waitlist")
+    for problem in problems:
+        print(f"  PROBLEM: {problem}")
+    return not problems
+
+
+def drop_class(class_id):
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM class_enrollments WHERE class_id = :id"), {"id": class_id})
+        conn.execute(text("DELETE FROM class_sessions WHERE id = :id"), {"id": class_id})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure class enrollment under a start-of-booking rush.")
+    parser.add_argument("--clients", type=int, default=300, help="members enrolling at the same moment")
+    parser.add_argument("--capacity", type=int, default=25)
+    parser.add_argument("--cancellations", type=int, default=10, help="seats cancelled at once afterwards")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="keep the test class instead of deleting it")
+    args = parser.parse_args()
+
+    low, high = id_range("members")
+    if low is None or high - low + 1 < args.clients:
+        raise SystemExit("Not enough members, run python -m app.generate_data first.")
+
+    rng = random.Random(args.seed)
+    class_id = create_rush_class(rng, args.capacity)
+    print(f"Test class {class_id}, {args.capacity} seats, pool {DB_POOL_SIZE}+{DB_MAX_OVERFLOW}\n")
+    ok = False
+    try:
+        member_ids = rng.sample(range(low, high + 1), args.clients)
+        warm_pool()
+        elapsed, latencies, waits, results = rush([enroll_call(class_id, m) for m in member_ids])
+        report("Enroll", elapsed, latencies, waits, results)
+
+        seats = [enrollment_id for outcome, enrollment_id in results if outcome == "enrolled"]
+        leaving = rng.sample(seats, min(args.cancellations, len(seats)))
+        if leaving:
+            elapsed, latencies, waits, results = rush([cancel_call(e) for e in leaving])
+            report("Cancel", elapsed, latencies, waits, results)
+        print()
+        ok = audit(class_id)
+    finally:
+        if args.keep:
+            print(f"Kept class {class_id}.")
+        else:
+            drop_class(class_id)
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from sqlalchemy import text
+
+from config import bulk_engine as engine
+from models.entities import BillingRun
+
+# Prepares a database created before the billing run existed (init_db.py does all of this
+# on a new database). Safe to run more than once.
+#   - invoices.billing_period and invoices.category
+#   - the unique (member_id, billing_period, category) constraint, built CONCURRENTLY first so
+#     a big invoices table stays writable while the index is made; it replaces the
+#     (member_id, billing_period) one from when the run made a single invoice per member
+#   - the billing_runs progress table
+
+CONSTRAINT_NAME = "uq_invoices_member_period_category"
+OLD_CONSTRAINT_NAME = "uq_invoices_member_period"
+
+
+def create_billing():
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ALTER TABLE invoices ADD COLUMN IF NOT EXISTS billing_period date"))
+        print("Column ready: invoices.billing_period")
+        conn.execute(text("ALTER TABLE invoices ADD COLUMN IF NOT EXISTS category varchar(30)"))
+        print("Column ready: invoices.category")
+
+        # billing run invoices from before the split had the fee and the PT charges in one
+        # amount, which isn't stored separately anywhere, so they stay under Membership
+        updated = conn.execute(text(
+            "UPDATE invoices SET category = 'Membership' WHERE billing_period IS NOT NULL AND category IS NULL"
+        )).rowcount
+        if updated:
+            print(f"Earlier billing run invoices marked as Membership: {updated:,}")
+
+        if conn.execute(text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": CONSTRAINT_NAME}).scalar():
+            print(f"Constraint already exists: {CONSTRAINT_NAME}")
+        else:
+            valid = conn.execute(
+                text("""
+                    SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = :name
+                """),
+                {"name": CONSTRAINT_NAME},
+            ).scalar()
+            if valid is False:
+                # left behind by an interrupted build
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {CONSTRAINT_NAME}"))
+            if not valid:
+                conn.execute(text(
+                    f"CREATE UNIQUE INDEX CONCURRENTLY {CONSTRAINT_NAME} ON invoices (member_id, billing_period, category)"
+                ))
+            conn.execute(text(
+                f"ALTER TABLE invoices ADD CONSTRAINT {CONSTRAINT_NAME} UNIQUE USING INDEX {CONSTRAINT_NAME}"
+            ))
+            print(f"Constraint created: {CONSTRAINT_NAME}")
+
+        conn.execute(text(f"ALTER TABLE invoices DROP CONSTRAINT IF EXISTS {OLD_CONSTRAINT_NAME}"))
+
+    BillingRun.__table__.create(bind=engine, checkfirst=True)
+    print("Table ready: billing_runs")
+
+
+if __name__ == "__main__":
+    create_billing()
@@ -0,0 +1,58 @@
+from config import bulk_engine as engine
+from sqlalchemy import text
+
+# Overlap rules enforced by the database itself with GiST exclusion constraints.
+# Each one is a single index probe inside the INSERT/UPDATE, so two clients can't
+# both pass a check and then both insert. Replaces the prevent_overlapping_pt trigger,
+# which only covered members and only ran on INSERT.
+# Set OVERLAP_MODE = "constraints" in config.py after running this.
+
+# the constraint names are mapped back to user-facing messages in services/availability.py
+constraint_sql = {
+    "pt_sessions_member_no_overlap": """
+        ALTER TABLE pt_sessions ADD CONSTRAINT pt_sessions_member_no_overlap
+        EXCLUDE USING gist (member_id WITH =, tsrange(start_time, end_time) WITH &&)
+        WHERE (status <> 'cancelled')
+    """,
+    "pt_sessions_trainer_no_overlap": """
+        ALTER TABLE pt_sessions ADD CONSTRAINT pt_sessions_trainer_no_overlap
+        EXCLUDE USING gist (trainer_id WITH =, tsrange(start_time, end_time) WITH &&)
+        WHERE (status <> 'cancelled')
+    """,
+    "pt_sessions_room_no_overlap": """
+        ALTER TABLE pt_sessions ADD CONSTRAINT pt_sessions_room_no_overlap
+        EXCLUDE USING gist (room_id WITH =, tsrange(start_time, end_time) WITH &&)
+        WHERE (status <> 'cancelled')
+    """,
+    "class_sessions_room_no_overlap": """
+        ALTER TABLE class_sessions ADD CONSTRAINT class_sessions_room_no_overlap
+        EXCLUDE USING gist (room_id WITH =, tsrange(start_time, end_time) WITH &&)
+    """,
+}
+
+
+def create_overlap_constraints():
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+
+        # the constraint covers what the trigger did (and more), so the trigger goes
+        conn.execute(text("DROP TRIGGER IF EXISTS prevent_overlap_trigger ON pt_sessions"))
+        conn.execute(text("DROP FUNCTION IF EXISTS prevent_overlapping_pt()"))
+
+        existing = set(
+            conn.execute(
+                text("SELECT conname FROM pg_constraint WHERE conname = ANY(:names)"),
+                {"names": list(constraint_sql)},
+            ).scalars()
+        )
+
+        for name, sql in constraint_sql.items():
+            if name in existing:
+                print(f"Constraint already exists: {name}")
+                continue
+            conn.execute(text(sql))
+            print(f"Constraint created: {name}")
+
+
+if __name__ == "__main__":
+    create_overlap_constraints()
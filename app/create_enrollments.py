@@ -0,0 +1,51 @@
+from sqlalchemy import text
+
+from config import bulk_engine as engine
+from models.entities import ClassEnrollment
+
+# Adds class enrollments to a database that was created before they existed (init_db.py
+# creates all of this on a fresh database). Safe to run more than once.
+#   - the class_enrollments table (with its "one live enrollment per member" index)
+#   - class_sessions.enrolled_count, backfilled from the enrollments
+#   - a CHECK that enrolled_count stays between 0 and capacity, the last line of defense
+#     against overselling a class
+# The waitlist index is in app/manage_indexes.py.
+
+CHECK_NAME = "class_sessions_enrolled_within_capacity"
+
+
+def create_enrollments():
+    ClassEnrollment.__table__.create(bind=engine, checkfirst=True)
+    print("Table ready: class_enrollments")
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "ALTER TABLE class_sessions ADD COLUMN IF NOT EXISTS enrolled_count integer NOT NULL DEFAULT 0"
+        ))
+        fixed = conn.execute(text("""
+            UPDATE class_sessions c
+            SET enrolled_count = counted.n
+            FROM (
+                SELECT c2.id, count(e.id) AS n
+                FROM class_sessions c2
+                LEFT JOIN class_enrollments e ON e.class_id = c2.id AND e.status = 'enrolled'
+                GROUP BY c2.id
+            ) counted
+            WHERE counted.id = c.id AND c.enrolled_count <> counted.n
+        """)).rowcount
+        print(f"Column ready: class_sessions.enrolled_count ({fixed} counts corrected)")
+
+        exists = conn.execute(
+            text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": CHECK_NAME}
+        ).scalar()
+        if exists:
+            print(f"Constraint already exists: {CHECK_NAME}")
+        else:
+            conn.execute(text(
+                f"ALTER TABLE class_sessions ADD CONSTRAINT {CHECK_NAME} CHECK (enrolled_count BETWEEN 0 AND capacity)"
+            ))
+            print(f"Constraint created: {CHECK_NAME}")
+
+
+if __name__ == "__main__":
+    create_enrollments()
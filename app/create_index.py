@@ -1,11 +1,6 @@
-from config import engine
-from sqlalchemy import text
+from app.manage_indexes import apply_indexes
 
-index_sql = """
-CREATE INDEX IF NOT EXISTS idx_ptsession_start
-ON pt_sessions(start_time);
-"""
+# The index list lives in app/manage_indexes.py now (together with the queries that need
+# them). This script is kept so the setup steps in the README still work.
 
-with engine.connect() as conn:
-    conn.execute(text(index_sql))
-    print("Index created: idx_ptsession_start")
+apply_indexes()
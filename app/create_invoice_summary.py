@@ -0,0 +1,187 @@
+from config import bulk_engine as engine
+from sqlalchemy import text
+
+# Aggregates behind the accounts receivable and revenue reports (services/receivables.py),
+# so the reports never scan invoices row by row.
+#
+#   invoice_daily_totals   count and amount per created day, status and category; revenue per
+#                          month and the aging buckets (unpaid by age) both add these up
+#   member_balances        open (unpaid) count, amount and oldest date per member, for debtors
+#
+# They're refreshed incrementally. Triggers on invoices only write down which days and
+# members a statement touched (invoice_summary_dirty, append only, so concurrent invoice
+# writers never wait on each other here), and refresh_invoice_summaries() recomputes just
+# those days and members. Reports call it first (in a short transaction of their own, and
+# not at all while another refresh is running), and a refresh after a normal day of
+# invoicing only looks at today's invoices.
+
+summary_sql = """
+CREATE TABLE IF NOT EXISTS invoice_daily_totals (
+    day DATE NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    category VARCHAR(30) NOT NULL,
+    invoice_count INTEGER NOT NULL,
+    amount NUMERIC(14, 2) NOT NULL,
+    PRIMARY KEY (day, status, category)
+);
+
+CREATE TABLE IF NOT EXISTS member_balances (
+    member_id INTEGER PRIMARY KEY REFERENCES members(id) ON DELETE CASCADE,
+    open_count INTEGER NOT NULL,
+    open_amount NUMERIC(14, 2) NOT NULL,
+    oldest_open_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_member_balances_open_amount ON member_balances (open_amount DESC);
+
+-- no key on purpose: duplicates are fine, refresh takes the distinct values
+CREATE TABLE IF NOT EXISTS invoice_summary_dirty (
+    day DATE NOT NULL,
+    member_id INTEGER NOT NULL
+);
+
+-- set by code that knows it (the billing run); the others are worked out from the description
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS category VARCHAR(30);
+
+-- report category from the free text description, for invoices without a category
+CREATE OR REPLACE FUNCTION invoice_category(description TEXT)
+RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN description ILIKE '%membership%' THEN 'Membership'
+        WHEN description ILIKE '%PT %' OR description ILIKE 'PT%' THEN 'Personal training'
+        WHEN description ILIKE '%class%' THEN 'Classes'
+        ELSE 'Other'
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION mark_invoice_summaries_dirty()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO invoice_summary_dirty (day, member_id)
+        SELECT DISTINCT created_at::date, member_id FROM new_rows;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO invoice_summary_dirty (day, member_id)
+        SELECT DISTINCT created_at::date, member_id FROM old_rows;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- TRUNCATE doesn't fire the row triggers (generate_data.py --truncate uses it)
+CREATE OR REPLACE FUNCTION clear_invoice_summaries()
+RETURNS TRIGGER AS $$
+BEGIN
+    TRUNCATE invoice_daily_totals, member_balances, invoice_summary_dirty;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- returns how many days and members it recomputed. One refresh at a time: with wait it
+-- queues behind a running one (which then leaves little to do), without it returns NULLs
+-- straight away so a report doesn't wait for another worker's refresh.
+DROP FUNCTION IF EXISTS refresh_invoice_summaries();
+
+CREATE OR REPLACE FUNCTION refresh_invoice_summaries(
+    wait BOOLEAN DEFAULT TRUE, OUT days INTEGER, OUT members INTEGER
+) AS $$
+DECLARE
+    dirty_days DATE[];
+    dirty_members INTEGER[];
+BEGIN
+    IF wait THEN
+        PERFORM pg_advisory_xact_lock(hashtext('refresh_invoice_summaries'));
+    ELSIF NOT pg_try_advisory_xact_lock(hashtext('refresh_invoice_summaries')) THEN
+        RETURN;
+    END IF;
+
+    -- take the dirty rows committed so far; anything committed after this stays for next time
+    WITH taken AS (
+        DELETE FROM invoice_summary_dirty RETURNING day, member_id
+    )
+    SELECT array_agg(DISTINCT day), array_agg(DISTINCT member_id)
+    INTO dirty_days, dirty_members
+    FROM taken;
+
+    days := coalesce(array_length(dirty_days, 1), 0);
+    members := coalesce(array_length(dirty_members, 1), 0);
+    IF days = 0 THEN
+        RETURN;
+    END IF;
+
+    DELETE FROM invoice_daily_totals WHERE day = ANY(dirty_days);
+
+    INSERT INTO invoice_daily_totals (day, status, category, invoice_count, amount)
+    SELECT d.day, i.status, coalesce(i.category, invoice_category(i.description)), COUNT(*), SUM(i.amount)
+    FROM unnest(dirty_days) AS d(day)
+    JOIN invoices i ON i.created_at >= d.day AND i.created_at < d.day + 1
+    GROUP BY 1, 2, 3;
+
+    DELETE FROM member_balances WHERE member_id = ANY(dirty_members);
+
+    INSERT INTO member_balances (member_id, open_count, open_amount, oldest_open_at)
+    SELECT member_id, COUNT(*), SUM(amount), MIN(created_at)
+    FROM invoices
+    WHERE member_id = ANY(dirty_members) AND status = 'unpaid'
+    GROUP BY member_id;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS invoice_summaries_insert_trigger ON invoices;
+DROP TRIGGER IF EXISTS invoice_summaries_update_trigger ON invoices;
+DROP TRIGGER IF EXISTS invoice_summaries_delete_trigger ON invoices;
+DROP TRIGGER IF EXISTS invoice_summaries_truncate_trigger ON invoices;
+
+CREATE TRIGGER invoice_summaries_insert_trigger
+AFTER INSERT ON invoices
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION mark_invoice_summaries_dirty();
+
+CREATE TRIGGER invoice_summaries_update_trigger
+AFTER UPDATE ON invoices
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION mark_invoice_summaries_dirty();
+
+CREATE TRIGGER invoice_summaries_delete_trigger
+AFTER DELETE ON invoices
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION mark_invoice_summaries_dirty();
+
+CREATE TRIGGER invoice_summaries_truncate_trigger
+AFTER TRUNCATE ON invoices
+FOR EACH STATEMENT
+EXECUTE FUNCTION clear_invoice_summaries();
+"""
+
+# full rebuild from invoices; writers are held off meanwhile so nothing slips between
+# the rebuild and the dirty list being cleared
+backfill_sql = """
+LOCK TABLE invoices IN SHARE MODE;
+TRUNCATE invoice_daily_totals, member_balances, invoice_summary_dirty;
+
+INSERT INTO invoice_daily_totals (day, status, category, invoice_count, amount)
+SELECT created_at::date, status, coalesce(category, invoice_category(description)), COUNT(*), SUM(amount)
+FROM invoices
+GROUP BY 1, 2, 3;
+
+INSERT INTO member_balances (member_id, open_count, open_amount, oldest_open_at)
+SELECT member_id, COUNT(*), SUM(amount), MIN(created_at)
+FROM invoices
+WHERE status = 'unpaid'
+GROUP BY member_id;
+"""
+
+
+def create_invoice_summary():
+    with engine.begin() as conn:
+        conn.execute(text(summary_sql))
+        conn.execute(text(backfill_sql))
+    print("Summary tables created: invoice_daily_totals, member_balances")
+
+
+if __name__ == "__main__":
+    create_invoice_summary()
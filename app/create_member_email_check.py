@@ -0,0 +1,50 @@
+from sqlalchemy import text
+
+from config import bulk_engine as engine
+
+# Member emails are stored lower-case: register_member and app/import_members.py both
+# lower-case them, because the unique constraint on email is case sensitive and
+# Ann@Example.com and ann@example.com would otherwise be two members. For a database
+# created before that (init_db.py creates all of this on a fresh one):
+#   - lower-cases the emails already stored
+#   - adds a CHECK that keeps it that way, whoever writes to members
+# Members whose emails only differ in case have to be merged by hand first; they're
+# listed and nothing is changed. Safe to run more than once.
+
+CHECK_NAME = "members_email_lowercase"
+
+duplicates_sql = """
+SELECT lower(email) AS email, array_agg(id ORDER BY id) AS ids
+FROM members
+GROUP BY lower(email)
+HAVING count(*) > 1
+ORDER BY 1
+"""
+
+
+def create_member_email_check():
+    with engine.begin() as conn:
+        # no new members while we look for duplicates and fix the rest
+        conn.execute(text("LOCK TABLE members IN SHARE ROW EXCLUSIVE MODE"))
+        duplicates = conn.execute(text(duplicates_sql)).all()
+        if duplicates:
+            print("These members only differ in the case of their email, merge them first:")
+            for row in duplicates:
+                print(f"  {row.email}: members {', '.join(str(i) for i in row.ids)}")
+            raise SystemExit(1)
+
+        fixed = conn.execute(text("UPDATE members SET email = lower(email) WHERE email <> lower(email)")).rowcount
+        print(f"Emails lower-cased: {fixed}")
+
+        exists = conn.execute(
+            text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": CHECK_NAME}
+        ).scalar()
+        if exists:
+            print(f"Constraint already exists: {CHECK_NAME}")
+        else:
+            conn.execute(text(f"ALTER TABLE members ADD CONSTRAINT {CHECK_NAME} CHECK (email = lower(email))"))
+            print(f"Constraint created: {CHECK_NAME}")
+
+
+if __name__ == "__main__":
+    create_member_email_check()
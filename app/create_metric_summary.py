@@ -0,0 +1,172 @@
+from config import bulk_engine as engine
+from sqlalchemy import text
+
+# Keeps one row per member with their latest health metric and a few rolling numbers,
+# so reading "latest metric for everyone" is a plain indexed scan instead of a LATERAL
+# subquery per member. The triggers are statement level with transition tables, so a
+# bulk COPY of thousands of readings updates the summary once per statement, not per row.
+#
+# avg_weight_30d is the average weight over the 30 days up to the member's latest reading.
+
+summary_sql = """
+CREATE TABLE IF NOT EXISTS member_metric_summary (
+    member_id INTEGER PRIMARY KEY REFERENCES members(id) ON DELETE CASCADE,
+    metric_count INTEGER NOT NULL DEFAULT 0,
+    latest_recorded_at TIMESTAMP,
+    latest_weight DOUBLE PRECISION,
+    latest_heart_rate INTEGER,
+    latest_body_fat_percentage DOUBLE PRECISION,
+    min_weight DOUBLE PRECISION,
+    max_weight DOUBLE PRECISION,
+    avg_weight_30d DOUBLE PRECISION
+);
+
+CREATE INDEX IF NOT EXISTS idx_health_metrics_member_recorded
+ON health_metrics(member_id, recorded_at DESC);
+
+-- full recompute for a set of members, used after updates/deletes and for the backfill
+CREATE OR REPLACE FUNCTION recompute_member_metric_summary(member_ids INTEGER[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM member_metric_summary WHERE member_id = ANY(member_ids);
+
+    INSERT INTO member_metric_summary (
+        member_id, metric_count, latest_recorded_at, latest_weight, latest_heart_rate,
+        latest_body_fat_percentage, min_weight, max_weight, avg_weight_30d
+    )
+    SELECT
+        agg.member_id,
+        agg.metric_count,
+        latest.recorded_at,
+        latest.weight,
+        latest.heart_rate,
+        latest.body_fat_percentage,
+        agg.min_weight,
+        agg.max_weight,
+        (
+            SELECT AVG(h.weight)
+            FROM health_metrics h
+            WHERE h.member_id = agg.member_id
+              AND h.recorded_at > latest.recorded_at - INTERVAL '30 days'
+        )
+    FROM (
+        SELECT member_id, COUNT(*) AS metric_count, MIN(weight) AS min_weight, MAX(weight) AS max_weight
+        FROM health_metrics
+        WHERE member_id = ANY(member_ids)
+        GROUP BY member_id
+    ) agg
+    CROSS JOIN LATERAL (
+        SELECT recorded_at, weight, heart_rate, body_fat_percentage
+        FROM health_metrics
+        WHERE health_metrics.member_id = agg.member_id
+        ORDER BY recorded_at DESC
+        LIMIT 1
+    ) latest;
+END;
+$$ LANGUAGE plpgsql;
+
+-- inserts only ever add to the summary, so they're merged in without rescanning history
+CREATE OR REPLACE FUNCTION member_metric_summary_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO member_metric_summary AS s (
+        member_id, metric_count, latest_recorded_at, latest_weight, latest_heart_rate,
+        latest_body_fat_percentage, min_weight, max_weight
+    )
+    SELECT
+        agg.member_id, agg.metric_count, latest.recorded_at, latest.weight, latest.heart_rate,
+        latest.body_fat_percentage, agg.min_weight, agg.max_weight
+    FROM (
+        SELECT member_id, COUNT(*) AS metric_count, MIN(weight) AS min_weight, MAX(weight) AS max_weight
+        FROM new_rows
+        GROUP BY member_id
+    ) agg
+    JOIN (
+        SELECT DISTINCT ON (member_id) member_id, recorded_at, weight, heart_rate, body_fat_percentage
+        FROM new_rows
+        ORDER BY member_id, recorded_at DESC
+    ) latest ON latest.member_id = agg.member_id
+    ON CONFLICT (member_id) DO UPDATE SET
+        metric_count = s.metric_count + EXCLUDED.metric_count,
+        min_weight = LEAST(s.min_weight, EXCLUDED.min_weight),
+        max_weight = GREATEST(s.max_weight, EXCLUDED.max_weight),
+        latest_recorded_at = CASE WHEN s.latest_recorded_at IS NULL OR EXCLUDED.latest_recorded_at >= s.latest_recorded_at
+            THEN EXCLUDED.latest_recorded_at ELSE s.latest_recorded_at END,
+        latest_weight = CASE WHEN s.latest_recorded_at IS NULL OR EXCLUDED.latest_recorded_at >= s.latest_recorded_at
+            THEN EXCLUDED.latest_weight ELSE s.latest_weight END,
+        latest_heart_rate = CASE WHEN s.latest_recorded_at IS NULL OR EXCLUDED.latest_recorded_at >= s.latest_recorded_at
+            THEN EXCLUDED.latest_heart_rate ELSE s.latest_heart_rate END,
+        latest_body_fat_percentage = CASE WHEN s.latest_recorded_at IS NULL OR EXCLUDED.latest_recorded_at >= s.latest_recorded_at
+            THEN EXCLUDED.latest_body_fat_percentage ELSE s.latest_body_fat_percentage END;
+
+    -- the 30 day window only covers recent readings, so this is a short index range scan
+    UPDATE member_metric_summary s
+    SET avg_weight_30d = (
+        SELECT AVG(h.weight)
+        FROM health_metrics h
+        WHERE h.member_id = s.member_id
+          AND h.recorded_at > s.latest_recorded_at - INTERVAL '30 days'
+    )
+    WHERE s.member_id IN (SELECT DISTINCT member_id FROM new_rows);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- updates and deletes can remove the latest/min/max row, so those members are recomputed
+CREATE OR REPLACE FUNCTION member_metric_summary_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM recompute_member_metric_summary(ARRAY(
+        SELECT member_id FROM old_rows UNION SELECT member_id FROM new_rows
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION member_metric_summary_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM recompute_member_metric_summary(ARRAY(SELECT DISTINCT member_id FROM old_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS member_metric_summary_insert_trigger ON health_metrics;
+DROP TRIGGER IF EXISTS member_metric_summary_update_trigger ON health_metrics;
+DROP TRIGGER IF EXISTS member_metric_summary_delete_trigger ON health_metrics;
+
+CREATE TRIGGER member_metric_summary_insert_trigger
+AFTER INSERT ON health_metrics
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION member_metric_summary_insert();
+
+CREATE TRIGGER member_metric_summary_update_trigger
+AFTER UPDATE ON health_metrics
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION member_metric_summary_update();
+
+CREATE TRIGGER member_metric_summary_delete_trigger
+AFTER DELETE ON health_metrics
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION member_metric_summary_delete();
+"""
+
+backfill_sql = """
+SELECT recompute_member_metric_summary(ARRAY(SELECT DISTINCT member_id FROM health_metrics));
+"""
+
+
+def create_metric_summary():
+    with engine.begin() as conn:
+        conn.execute(text(summary_sql))
+        # bring the table up to date with whatever is already in health_metrics
+        conn.execute(text(backfill_sql))
+    print("Summary table created: member_metric_summary")
+
+
+if __name__ == "__main__":
+    create_metric_summary()
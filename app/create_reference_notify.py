@@ -0,0 +1,70 @@
+from sqlalchemy import text
+
+from config import bulk_engine as engine
+
+# Tells every running process when a member, trainer or room changes, so their reference
+# caches (services/reference_cache.py) drop the row. Statement triggers with transition
+# tables send one NOTIFY reference_changed per statement, "members:4,8,15", or
+# "members:*" when a statement changes too many rows to list (a NOTIFY payload is
+# limited to 8000 bytes). Inserts don't need one, missing rows are never cached.
+# Safe to run more than once.
+
+TABLES = ("members", "trainers", "rooms")
+MAX_IDS = 500
+
+notify_sql = f"""
+CREATE OR REPLACE FUNCTION notify_reference_changed()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed INTEGER;
+    ids TEXT := '*';
+BEGIN
+    IF TG_OP <> 'TRUNCATE' THEN
+        SELECT count(*) INTO changed FROM old_rows;
+        IF changed = 0 THEN
+            RETURN NULL;
+        END IF;
+        IF changed <= {MAX_IDS} THEN
+            SELECT string_agg(DISTINCT id::text, ',') INTO ids FROM old_rows;
+        END IF;
+    END IF;
+    PERFORM pg_notify('reference_changed', TG_TABLE_NAME || ':' || ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+trigger_sql = """
+DROP TRIGGER IF EXISTS {table}_notify_update ON {table};
+DROP TRIGGER IF EXISTS {table}_notify_delete ON {table};
+DROP TRIGGER IF EXISTS {table}_notify_truncate ON {table};
+
+CREATE TRIGGER {table}_notify_update
+AFTER UPDATE ON {table}
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_reference_changed();
+
+CREATE TRIGGER {table}_notify_delete
+AFTER DELETE ON {table}
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_reference_changed();
+
+CREATE TRIGGER {table}_notify_truncate
+AFTER TRUNCATE ON {table}
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_reference_changed();
+"""
+
+
+def create_reference_notify():
+    with engine.begin() as conn:
+        conn.execute(text(notify_sql))
+        for table in TABLES:
+            conn.execute(text(trigger_sql.format(table=table)))
+    print(f"Change notifications created on: {', '.join(TABLES)}")
+
+
+if __name__ == "__main__":
+    create_reference_notify()
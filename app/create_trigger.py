@@ -28,6 +28,6 @@ FOR EACH ROW
 EXECUTE FUNCTION prevent_overlapping_pt();
 """
 
-with engine.connect() as conn:
+with engine.begin() as conn:
     conn.execute(text(trigger_sql))
     print("Trigger created: prevent_overlapping_pt")
@@ -1,25 +1,26 @@
 from config import engine
 from sqlalchemy import text
 
+# Reads from member_metric_summary (see create_metric_summary.py, run that first), which the
+# health_metrics triggers keep current. Listing every member is then a single join on the
+# summary's primary key instead of a LATERAL subquery per member.
 sql = """
 CREATE OR REPLACE VIEW member_latest_metric AS
 SELECT
     m.id AS member_id,
     m.full_name,
-    hm.recorded_at,
-    hm.weight,
-    hm.heart_rate,
-    hm.body_fat_percentage
+    s.latest_recorded_at AS recorded_at,
+    s.latest_weight AS weight,
+    s.latest_heart_rate AS heart_rate,
+    s.latest_body_fat_percentage AS body_fat_percentage,
+    COALESCE(s.metric_count, 0) AS metric_count,
+    s.min_weight,
+    s.max_weight,
+    s.avg_weight_30d
 FROM members m
-LEFT JOIN LATERAL (
-    SELECT *
-    FROM health_metrics
-    WHERE health_metrics.member_id = m.id
-    ORDER BY recorded_at DESC
-    LIMIT 1
-) hm ON true;
+LEFT JOIN member_metric_summary s ON s.member_id = m.id;
 """
 
-with engine.connect() as conn:
+with engine.begin() as conn:
     conn.execute(text(sql))
     print("View created: member_latest_metric")
@@ -0,0 +1,289 @@
+import argparse
+import bisect
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from sqlalchemy import select, func, true, Integer, Float, Numeric, Date, DateTime, Boolean
+
+from config import bulk_engine as engine
+from app.ingest_metrics import save_checkpoint
+from models.entities import Member, PTSession, ClassSession, HealthMetric, Invoice
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Parquet needs pip install pyarrow; without it the export writes CSV
+    pa = pq = None
+
+# Export for the analysts, so their ad-hoc queries run on files instead of against the club
+# database. Each table is streamed through a server-side cursor, --batch-size rows at a
+# time, into one Parquet (or CSV) file per table and run:
+#
+#   exports/health_metrics/health_metrics_20250301T020000.parquet
+#
+# Only the current batch is ever in memory, whatever the size of the table. Each table is
+# read in one REPEATABLE READ, READ ONLY transaction on the bulk engine (no statement
+# timeout), so the file is a consistent snapshot, and --workers exports tables in parallel
+# on separate connections.
+#
+# Exports are incremental by id: exports/export_state.json remembers the highest id each
+# table was exported up to, and the next run takes the rows above it. Ids are handed out
+# when a row is inserted, not when it commits, so a transaction still open during an
+# export can commit a lower id afterwards (created_at has the same problem, and a client
+# supplied time like health_metrics.recorded_at can be anything, a backdated reading would
+# never be exported). So each run also remembers the ids among the last LOOKBACK_IDS below
+# its watermark that it didn't see ("gaps": rolled back, deleted or not committed yet),
+# and the next run reads again from the oldest gap and exports whichever of them have
+# turned up since (rows already exported are skipped).
+# That catches new rows, not changes to old ones (a cancelled PT session, a paid invoice),
+# so run with --full now and then for a complete snapshot. A table's state only moves once
+# its file is complete; a failed table is simply exported again next time.
+#
+#   python -m app.export_data --out exports --workers 3
+#   python -m app.export_data --tables invoices health_metrics --format csv --full
+
+TABLES = {
+    "members": Member,
+    "pt_sessions": PTSession,
+    "class_sessions": ClassSession,
+    "health_metrics": HealthMetric,
+    "invoices": Invoice,
+}
+
+DEFAULT_BATCH_SIZE = 50_000
+# how far below the watermark a row can still commit late: inserts made while more than
+# this many newer ids were handed out are assumed to have been rolled back
+LOOKBACK_IDS = 100_000
+STATE_FILE = "export_state.json"
+
+
+#WRITERS
+
+
+def arrow_type(column):
+    kind = column.type
+    if isinstance(kind, Integer):
+        return pa.int64()
+    if isinstance(kind, Float):
+        return pa.float64()
+    if isinstance(kind, Numeric):
+        return pa.decimal128(kind.precision or 38, kind.scale or 0)
+    if isinstance(kind, DateTime):
+        return pa.timestamp("us")
+    if isinstance(kind, Date):
+        return pa.date32()
+    if isinstance(kind, Boolean):
+        return pa.bool_()
+    return pa.string()
+
+
+class ParquetFile:
+    # one row group per batch
+    extension = "parquet"
+
+    def __init__(self, path, columns):
+        self.schema = pa.schema([(c.name, arrow_type(c)) for c in columns])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="snappy")
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        arrays = [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)]
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class CsvFile:
+    extension = "csv"
+
+    def __init__(self, path, columns):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([c.name for c in columns])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+FORMATS = {"parquet": ParquetFile, "csv": CsvFile}
+
+
+#STATE
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def to_ranges(ids):
+    # sorted ids -> [[first, last], ...] of consecutive runs, how gaps are stored
+    ranges = []
+    for i in ids:
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ranges
+
+
+def in_ranges(ranges, i):
+    pos = bisect.bisect_right(ranges, [i, float("inf")]) - 1
+    return pos >= 0 and ranges[pos][0] <= i <= ranges[pos][1]
+
+
+def find_gaps(low, upper, seen, gaps):
+    # ranges to look for again next time: ids in (low, upper] that weren't exported, plus
+    # earlier gaps that still haven't turned up and aren't too far back yet
+    missing = {i for i in range(low + 1, upper + 1) if i not in seen}
+    for first, last in gaps:
+        missing.update(i for i in range(max(first, upper - LOOKBACK_IDS + 1), last + 1) if i not in seen)
+    return to_ranges(sorted(missing))
+
+
+#EXPORT
+
+
+def export_table(name, since, gaps, out_dir, file_class, batch_size, run_stamp):
+    # returns (rows, new watermark, gaps, file), file is None when there was nothing new
+    table = TABLES[name].__table__
+    folder = os.path.join(out_dir, name)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{name}_{run_stamp}.{file_class.extension}")
+    tmp = path + ".tmp"
+
+    options = dict(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+    with engine.connect().execution_options(**options) as conn:
+        # same snapshot as the rows below, anything above it is for next time
+        upper = conn.execute(select(func.max(table.c.id))).scalar()
+        if upper is None:
+            return 0, since, gaps, None
+
+        start_after = gaps[0][0] - 1 if gaps else since
+        wanted = table.c.id > start_after if start_after is not None else true()
+        query = select(table).where(wanted, table.c.id <= upper)
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+
+        # only the ids that can become gaps are remembered, at most LOOKBACK_IDS of them
+        low = max(since or 0, upper - LOOKBACK_IDS)
+        seen = set()
+        rows = 0
+        out = file_class(tmp, table.columns)
+        try:
+            for batch in result.partitions():
+                if since is not None:
+                    batch = [row for row in batch if row.id > since or in_ranges(gaps, row.id)]
+                if not batch:
+                    continue
+                out.write(batch)
+                rows += len(batch)
+                seen.update(row.id for row in batch if row.id > upper - LOOKBACK_IDS)
+        except Exception:
+            out.close()
+            os.remove(tmp)
+            raise
+        out.close()
+
+    if rows == 0:
+        os.remove(tmp)
+        return 0, since, gaps, None
+    # only a complete file gets its real name
+    os.replace(tmp, path)
+    return rows, max(since or 0, upper), find_gaps(low, upper, seen, gaps), path
+
+
+def export(tables, out_dir, fmt, batch_size=DEFAULT_BATCH_SIZE, workers=1, full=False):
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = os.path.join(out_dir, STATE_FILE)
+    state = load_state(state_path)
+    state_lock = threading.Lock()
+    run_stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    file_class = FORMATS[fmt]
+
+    def run(name):
+        previous = state.get(name, {})
+        since, gaps = None, []
+        # (state files from before the id watermarks get one full export)
+        if not full and previous.get("column") == "id":
+            since, gaps = previous["watermark"], previous.get("gaps", [])
+        start = time.perf_counter()
+        rows, watermark, new_gaps, path = export_table(
+            name, since, gaps, out_dir, file_class, batch_size, run_stamp
+        )
+        elapsed = time.perf_counter() - start
+        if path is not None:
+            with state_lock:
+                state[name] = {
+                    "column": "id",
+                    "watermark": watermark,
+                    "gaps": new_gaps,
+                    "rows": rows,
+                    "file": path,
+                    "exported_at": datetime.now().isoformat(timespec="seconds"),
+                }
+                save_checkpoint(state_path, state)
+        return rows, elapsed, since, gaps, path
+
+    failed = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run, name): name for name in tables}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                rows, elapsed, since, gaps, path = future.result()
+            except Exception as e:
+                failed.append(name)
+                print(f"  {name:<16} FAILED: {e.__class__.__name__}: {e}".splitlines()[0])
+                continue
+            after = f" after id {since:,}" if since is not None else ""
+            if gaps:
+                after += f" (+{sum(last - first + 1 for first, last in gaps):,} ids missing last time)"
+            if path is None:
+                print(f"  {name:<16} nothing new{after}")
+            else:
+                print(f"  {name:<16} {rows:>12,} rows{after} in {elapsed:.1f}s "
+                      f"({rows / max(elapsed, 1e-9):,.0f} rows/sec) -> {path}")
+
+    print(f"\nExport finished in {time.perf_counter() - start:.1f}s, state in {state_path}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream club tables to Parquet/CSV files for analytics.")
+    parser.add_argument("--tables", nargs="+", choices=list(TABLES), default=list(TABLES))
+    parser.add_argument("--out", default="exports", help="output folder (also holds the watermark state)")
+    parser.add_argument("--format", choices=list(FORMATS),
+                        help="default parquet, or csv when pyarrow isn't installed")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows fetched and written at a time")
+    parser.add_argument("--workers", type=int, default=1, help="tables exported at the same time")
+    parser.add_argument("--full", action="store_true", help="export everything, not just rows since the last export")
+    args = parser.parse_args()
+    if args.batch_size < 1 or args.workers < 1:
+        parser.error("--batch-size and --workers must be at least 1")
+
+    fmt = args.format or ("parquet" if pa is not None else "csv")
+    if fmt == "parquet" and pa is None:
+        parser.error("Parquet needs pyarrow (pip install pyarrow), or use --format csv")
+    if args.format is None and fmt == "csv":
+        print("pyarrow isn't installed, writing CSV")
+
+    failed = export(args.tables, args.out, fmt, args.batch_size, args.workers, args.full)
+    if failed:
+        raise SystemExit(f"Failed: {', '.join(failed)} (their watermarks were not moved)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from config import bulk_engine as engine
+
+# Generates a big synthetic dataset for capacity planning and benchmarks.
+# seed_data.py is fine for trying the app, but it only adds a handful of rows through the ORM.
+# Here every table is streamed straight into PostgreSQL with COPY, rows are produced lazily
+# so memory stays flat, and the same --seed (and --end-date) always gives the same data.
+#
+#   python -m app.generate_data --members 1000000 --pt-sessions 2000000 --metrics 10000000
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+    "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Ahmed", "Fatima",
+    "Omar", "Aisha", "Wei", "Mei", "Hiroshi", "Yuki", "Carlos", "Maria", "Luis", "Sofia",
+    "Ivan", "Olga", "Raj", "Priya", "Kwame", "Amara", "Liam", "Emma", "Noah", "Olivia",
+]
+
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee",
+    "Nguyen", "Chen", "Kim", "Patel", "Singh", "Khan", "Ali", "Haddad", "Tanaka", "Sato",
+    "Ivanov", "Petrov", "Okafor", "Mensah", "Tremblay", "Gagnon", "Roy", "Cote", "Bouchard", "Gauthier",
+]
+
+SPECIALTIES = ["Yoga", "Strength Training", "Cardio", "Pilates", "CrossFit", "Boxing", "Rehabilitation", "Nutrition"]
+
+CLASS_TITLES = {
+    "Yoga": ["Morning Yoga", "Power Yoga", "Yin Yoga"],
+    "Strength Training": ["Total Body Strength", "Barbell Basics"],
+    "Cardio": ["Spin", "HIIT", "Step Aerobics"],
+    "Pilates": ["Mat Pilates", "Core Pilates"],
+    "CrossFit": ["WOD", "Metcon"],
+    "Boxing": ["Boxing Fundamentals", "Cardio Kickboxing"],
+    "Rehabilitation": ["Mobility", "Back Care"],
+    "Nutrition": ["Healthy Habits Workshop"],
+}
+
+GOALS = [
+    "Lose weight", "Build muscle", "Improve endurance", "Stay active", "Train for a marathon",
+    "Improve flexibility", "Recover from injury", None,
+]
+
+# (description, amount, relative frequency)
+INVOICE_TYPES = [
+    ("Monthly membership", "49.99", 70),
+    ("PT session", "60.00", 15),
+    ("PT package (5 sessions)", "275.00", 8),
+    ("Class pass (10 classes)", "120.00", 5),
+    ("Locker rental", "10.00", 2),
+]
+
+# class_enrollments only exists once app/create_enrollments.py has run (or on a database
+# made by a newer init_db), see existing_tables
+TABLES = [
+    "members", "trainers", "rooms", "class_sessions", "class_enrollments", "pt_sessions", "health_metrics", "invoices",
+]
+
+OPEN_HOUR = 6
+CLOSE_HOUR = 22
+
+
+def format_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+    return str(value)
+
+
+class RowStream:
+    # File-like object that COPY reads from. Rows are only turned into text when
+    # psycopg2 asks for the next chunk, so a 10M row table never sits in memory.
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.leftover = ""
+        self.count = 0
+
+    def read(self, size=-1):
+        parts = [self.leftover]
+        length = len(self.leftover)
+        for row in self.rows:
+            line = "\t".join(format_value(v) for v in row) + "\n"
+            parts.append(line)
+            length += len(line)
+            self.count += 1
+            if 0 < size <= length:
+                break
+
+        data = "".join(parts)
+        if 0 < size < len(data):
+            data, self.leftover = data[:size], data[size:]
+        else:
+            self.leftover = ""
+        return data
+
+
+def copy_rows(cursor, table, columns, rows):
+    stream = RowStream(iter(rows))
+    start = time.perf_counter()
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", stream)
+    elapsed = time.perf_counter() - start
+    rate = stream.count / elapsed if elapsed > 0 else 0
+    print(f"  {table:<15} {stream.count:>12,} rows  {elapsed:8.1f}s  {rate:>12,.0f} rows/sec")
+    return {"table": table, "rows": stream.count, "seconds": round(elapsed, 3), "rows_per_sec": round(rate)}
+
+
+def person_name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+#ROW GENERATORS
+
+
+def member_rows(rng, count, first_id, end_date):
+    for member_id in range(first_id, first_id + count):
+        name = person_name(rng)
+        # age skews towards 20-45, which is most of a gym's membership
+        age = min(85, max(16, int(rng.gauss(34, 11))))
+        dob = end_date - timedelta(days=int(age * 365.25) + rng.randrange(365))
+        goal = rng.choice(GOALS)
+        target_weight = round(rng.gauss(72, 12), 1) if goal and rng.random() < 0.6 else None
+        yield (
+            member_id,
+            name,
+            f"{name.lower().replace(' ', '.')}.{member_id}@example.com",
+            dob,
+            rng.choices(["Male", "Female", None], weights=[47, 47, 6])[0],
+            f"{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+            goal,
+            target_weight,
+        )
+
+
+def trainer_rows(rng, count, first_id):
+    for trainer_id in range(first_id, first_id + count):
+        name = person_name(rng)
+        yield (
+            trainer_id,
+            name,
+            f"{name.lower().replace(' ', '.')}.{trainer_id}@club.com",
+            rng.choice(SPECIALTIES),
+        )
+
+
+def room_rows(count, first_id):
+    # roughly one in five rooms is a studio for group classes, the rest are small PT rooms
+    for room_id in range(first_id, first_id + count):
+        if is_studio(room_id, first_id, count):
+            yield (room_id, f"Studio {room_id}", 15 + (room_id * 7) % 26)
+        else:
+            yield (room_id, f"PT Room {room_id}", 2 + room_id % 4)
+
+
+def is_studio(room_id, first_id, count):
+    offset = room_id - first_id
+    return offset % 5 == 0 or count == 1
+
+
+def hourly_slots(start_day):
+    # every opening hour from start_day on, the callers stop when they have enough rows
+    day = start_day
+    while True:
+        for hour in range(OPEN_HOUR, CLOSE_HOUR):
+            yield datetime(day.year, day.month, day.day, hour)
+        day += timedelta(days=1)
+
+
+def start_day_for(total, per_slot, end_date):
+    # pick the first day so that roughly 90% of the sessions end up in the past
+    days_needed = -(-total // (per_slot * (CLOSE_HOUR - OPEN_HOUR)))
+    return end_date - timedelta(days=int(days_needed * 0.9))
+
+
+def class_session_rows(rng, count, first_id, studios, trainers, specialties, end_date):
+    # every studio hosts at most one class per hour and a trainer teaches one class at a time
+    per_slot = max(1, min(len(studios) // 2, len(trainers)))
+    class_id = first_id
+    for slot_start in hourly_slots(start_day_for(count, per_slot, end_date)):
+        n = min(per_slot, first_id + count - class_id)
+        if n <= 0:
+            return
+        for (room_id, capacity), trainer_id in zip(rng.sample(studios, n), rng.sample(trainers, n)):
+            title = rng.choice(CLASS_TITLES[specialties[trainer_id]])
+            length = 45 if rng.random() < 0.3 else 60
+            yield (
+                class_id,
+                title,
+                slot_start,
+                slot_start + timedelta(minutes=length),
+                capacity,
+                room_id,
+                trainer_id,
+            )
+            class_id += 1
+
+
+def pt_session_rows(rng, count, first_id, pt_rooms, trainers, members, end_date):
+    # One-hour slots on the hour. Within a slot every trainer, room and member is used
+    # at most once, so nothing overlaps (and the exclusion constraints are happy).
+    per_slot = max(1, min(len(pt_rooms), len(trainers), len(members)))
+    now = datetime.combine(end_date, datetime.min.time())
+    session_id = first_id
+    # slots are about 75% full on average, so start a bit earlier to compensate
+    for slot_start in hourly_slots(start_day_for(count * 4 // 3, per_slot, end_date)):
+        remaining = first_id + count - session_id
+        if remaining <= 0:
+            return
+        # busy and quiet hours: evenings and mornings fill up, midday is thinner
+        busy = 1.0 if slot_start.hour in (7, 8, 17, 18, 19) else rng.uniform(0.4, 0.9)
+        n = min(remaining, max(1, int(per_slot * busy)))
+        booked_members = rng.sample(members, n)
+        booked_trainers = rng.sample(trainers, n)
+        booked_rooms = rng.sample(pt_rooms, n)
+        for member_id, trainer_id, room_id in zip(booked_members, booked_trainers, booked_rooms):
+            if slot_start < now:
+                status = "cancelled" if rng.random() < 0.06 else "completed"
+            else:
+                status = "cancelled" if rng.random() < 0.03 else "scheduled"
+            yield (
+                session_id,
+                slot_start,
+                slot_start + timedelta(hours=1),
+                status,
+                member_id,
+                trainer_id,
+                room_id,
+            )
+            session_id += 1
+
+
+def health_metric_rows(rng, count, first_id, member_ids, end_date):
+    # A fifth of the members wear a tracker and produce most of the readings,
+    # everybody else has the odd reading from a check-in with their trainer.
+    if not member_ids:
+        return
+    heavy_count = len(member_ids[::5])
+    light_count = len(member_ids) - heavy_count
+    heavy_total = int(count * 0.8) if light_count else count
+    heavy_per, heavy_extra = divmod(heavy_total, heavy_count)
+    light_per, light_extra = divmod(count - heavy_total, light_count) if light_count else (0, 0)
+    end = datetime.combine(end_date, datetime.min.time())
+    metric_id = first_id
+
+    for i, member_id in enumerate(member_ids):
+        if i % 5 == 0:
+            readings = heavy_per + (1 if i // 5 < heavy_extra else 0)
+            span_days = 365
+        else:
+            readings = light_per + (1 if i - i // 5 - 1 < light_extra else 0)
+            span_days = 730
+        if readings == 0:
+            continue
+        weight = rng.gauss(80, 15)
+        drift = rng.uniform(-0.01, 0.004)  # kg per reading, most people slowly lose weight
+        resting_hr = rng.gauss(68, 8)
+        body_fat = rng.gauss(25, 7)
+        step = timedelta(days=span_days) / readings
+        recorded_at = end - timedelta(days=span_days)
+        for _ in range(readings):
+            # jitter stays inside the step so timestamps keep increasing per member
+            recorded_at += step
+            at = (recorded_at - step * rng.random() * 0.5).replace(microsecond=0)
+            weight += drift + rng.gauss(0, 0.15)
+            heart_rate = int(rng.gauss(resting_hr, 6))
+            if rng.random() < 0.002:
+                heart_rate += rng.randint(40, 90)  # the odd workout / anomaly
+            yield (
+                metric_id,
+                member_id,
+                at,
+                round(max(40.0, weight), 1),
+                max(35, heart_rate),
+                round(min(55.0, max(4.0, body_fat + rng.gauss(0, 0.3))), 1),
+            )
+            metric_id += 1
+
+
+def invoice_rows(rng, count, first_id, member_ids, end_date):
+    descriptions = [t[0] for t in INVOICE_TYPES]
+    amounts = {t[0]: t[1] for t in INVOICE_TYPES}
+    weights = [t[2] for t in INVOICE_TYPES]
+    end = datetime.combine(end_date, datetime.min.time())
+    for invoice_id in range(first_id, first_id + count):
+        description = rng.choices(descriptions, weights=weights)[0]
+        age_days = rng.expovariate(1 / 180)
+        created_at = end - timedelta(days=int(min(age_days, 1095)), seconds=rng.randrange(86400))
+        # the older an invoice is the more likely it's been paid
+        paid_chance = 0.55 if age_days < 30 else 0.85 if age_days < 90 else 0.97
+        yield (
+            invoice_id,
+            rng.choice(member_ids),
+            created_at,
+            amounts[description],
+            "paid" if rng.random() < paid_chance else "unpaid",
+            description,
+        )
+
+
+#DRIVER
+
+
+def next_id(cursor, table):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def existing_tables(cursor):
+    cursor.execute("SELECT t FROM unnest(%s) AS t WHERE to_regclass(t) IS NOT NULL", (TABLES,))
+    found = {row[0] for row in cursor.fetchall()}
+    return [table for table in TABLES if table in found]
+
+
+def reset_sequence(cursor, table):
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"
+    )
+
+
+def generate(
+    members=10_000,
+    trainers=50,
+    rooms=20,
+    class_sessions=5_000,
+    pt_sessions=50_000,
+    metrics=200_000,
+    invoices=100_000,
+    seed=42,
+    end_date=None,
+    truncate=False,
+):
+    end_date = end_date or date.today()
+    if trainers < 1 or rooms < 1 or members < 1:
+        raise ValueError("Need at least one member, trainer and room.")
+
+    # a separate generator per table so changing one count doesn't reshuffle the others
+    def rng_for(table):
+        return random.Random(f"{seed}:{table}")
+
+    conn = engine.raw_connection()
+    report = []
+    try:
+        cursor = conn.cursor()
+        tables = existing_tables(cursor)
+        if truncate:
+            cursor.execute(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE")
+
+        print(f"Generating data (seed={seed}, end date={end_date})")
+
+        first_member = next_id(cursor, "members")
+        report.append(copy_rows(
+            cursor, "members",
+            ["id", "full_name", "email", "date_of_birth", "gender", "phone", "fitness_goal", "target_weight"],
+            member_rows(rng_for("members"), members, first_member, end_date),
+        ))
+        member_ids = range(first_member, first_member + members)
+
+        first_trainer = next_id(cursor, "trainers")
+        trainer_rng = rng_for("trainers")
+        trainer_data = list(trainer_rows(trainer_rng, trainers, first_trainer))
+        report.append(copy_rows(cursor, "trainers", ["id", "full_name", "email", "specialty"], trainer_data))
+        specialties = {row[0]: row[3] for row in trainer_data}
+        trainer_ids = list(specialties)
+
+        first_room = next_id(cursor, "rooms")
+        room_data = list(room_rows(rooms, first_room))
+        report.append(copy_rows(cursor, "rooms", ["id", "name", "capacity"], room_data))
+        studios = [(r[0], r[2]) for r in room_data if is_studio(r[0], first_room, rooms)]
+        pt_rooms = [r[0] for r in room_data if not is_studio(r[0], first_room, rooms)] or [s[0] for s in studios]
+
+        report.append(copy_rows(
+            cursor, "class_sessions",
+            ["id", "title", "start_time", "end_time", "capacity", "room_id", "trainer_id"],
+            class_session_rows(
+                rng_for("class_sessions"), class_sessions, next_id(cursor, "class_sessions"),
+                studios, trainer_ids, specialties, end_date,
+            ),
+        ))
+
+        report.append(copy_rows(
+            cursor, "pt_sessions",
+            ["id", "start_time", "end_time", "status", "member_id", "trainer_id", "room_id"],
+            pt_session_rows(
+                rng_for("pt_sessions"), pt_sessions, next_id(cursor, "pt_sessions"),
+                pt_rooms, trainer_ids, member_ids, end_date,
+            ),
+        ))
+
+        report.append(copy_rows(
+            cursor, "health_metrics",
+            ["id", "member_id", "recorded_at", "weight", "heart_rate", "body_fat_percentage"],
+            health_metric_rows(rng_for("health_metrics"), metrics, next_id(cursor, "health_metrics"), member_ids, end_date),
+        ))
+
+        report.append(copy_rows(
+            cursor, "invoices",
+            ["id", "member_id", "created_at", "amount", "status", "description"],
+            invoice_rows(rng_for("invoices"), invoices, next_id(cursor, "invoices"), member_ids, end_date),
+        ))
+
+        # we wrote the ids ourselves, so move the sequences past them
+        for table in tables:
+            reset_sequence(cursor, table)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    total_rows = sum(r["rows"] for r in report)
+    total_seconds = sum(r["seconds"] for r in report)
+    if total_seconds:
+        print(f"  {'total':<15} {total_rows:>12,} rows  {total_seconds:8.1f}s  {total_rows / total_seconds:>12,.0f} rows/sec")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the database with synthetic data using COPY.")
+    parser.add_argument("--members", type=int, default=10_000)
+    parser.add_argument("--trainers", type=int, default=50)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--class-sessions", type=int, default=5_000)
+    parser.add_argument("--pt-sessions", type=int, default=50_000)
+    parser.add_argument("--metrics", type=int, default=200_000)
+    parser.add_argument("--invoices", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=None,
+                        help="last day of generated history (YYYY-MM-DD), defaults to today")
+    parser.add_argument("--truncate", action="store_true", help="empty all club tables first")
+    args = parser.parse_args()
+
+    generate(
+        members=args.members,
+        trainers=args.trainers,
+        rooms=args.rooms,
+        class_sessions=args.class_sessions,
+        pt_sessions=args.pt_sessions,
+        metrics=args.metrics,
+        invoices=args.invoices,
+        seed=args.seed,
+        end_date=args.end_date,
+        truncate=args.truncate,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+from datetime import date, datetime
+
+from config import bulk_engine as engine
+from app.create_member_email_check import CHECK_NAME as EMAIL_CHECK
+from app.generate_data import RowStream
+from app.ingest_metrics import batches, is_blank, load_checkpoint, save_checkpoint
+
+# Bulk member import, e.g. a partner club's roster.
+# Reads a CSV with the columns
+#   full_name, email, date_of_birth, gender, phone
+# in fixed size batches (memory doesn't depend on the file size), cleans every row up
+# (emails lower-cased, phones as 613-555-0142, dates as dates, gender as Male/Female),
+# COPYs the batch into a temp staging table and upserts it with one
+# INSERT ... ON CONFLICT (email) DO UPDATE: new emails become members, known ones get the
+# new details (empty cells keep what we have). Members' emails are all stored lower-case
+# (app/create_member_email_check.py), so Ann@Example.com in the file updates
+# ann@example.com. Rows that can't be cleaned up are counted by reason and can be written
+# to a rejects file.
+# Progress is checkpointed after every batch like app/ingest_metrics.py; importing a
+# file again ends in the same state (lines with the same email are applied in order), so
+# resuming is safe.
+#
+#   python -m app.import_members partner_roster.csv --batch-size 20000 --rejects rejected.csv
+
+COLUMNS = ["full_name", "email", "date_of_birth", "gender", "phone"]
+
+# tried in order; anything else needs --date-format (05/04/1990 could be either way round)
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%Y%m%d", "%d.%m.%Y"]
+EARLIEST_BIRTH = date(1900, 1, 1)
+GENDERS = {"m": "Male", "male": "Male", "man": "Male", "f": "Female", "female": "Female", "woman": "Female"}
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+NOT_DIGITS = re.compile(r"\D")
+SPACES = re.compile(r"\s+")
+
+staging_sql = """
+CREATE TEMP TABLE IF NOT EXISTS members_staging (
+    full_name VARCHAR(100),
+    email VARCHAR(100),
+    date_of_birth DATE,
+    gender VARCHAR(20),
+    phone VARCHAR(30)
+) ON COMMIT DELETE ROWS
+"""
+
+# one statement for the whole batch; xmax = 0 only on rows this statement inserted, and
+# rows whose details didn't change aren't touched (or returned) at all
+upsert_sql = """
+WITH upserted AS (
+    INSERT INTO members (full_name, email, date_of_birth, gender, phone)
+    SELECT full_name, email, date_of_birth, gender, phone FROM members_staging
+    ON CONFLICT (email) DO UPDATE SET
+        full_name = EXCLUDED.full_name,
+        date_of_birth = COALESCE(EXCLUDED.date_of_birth, members.date_of_birth),
+        gender = COALESCE(EXCLUDED.gender, members.gender),
+        phone = COALESCE(EXCLUDED.phone, members.phone)
+    WHERE (members.full_name, members.date_of_birth, members.gender, members.phone)
+          IS DISTINCT FROM (EXCLUDED.full_name,
+                            COALESCE(EXCLUDED.date_of_birth, members.date_of_birth),
+                            COALESCE(EXCLUDED.gender, members.gender),
+                            COALESCE(EXCLUDED.phone, members.phone))
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+"""
+
+
+#READING
+
+
+def read_rows(source):
+    # yields (line_number, [raw values in COLUMNS order]); line 1 is the header
+    reader = csv.DictReader(source)
+    missing = [c for c in ("full_name", "email") if c not in (reader.fieldnames or [])]
+    if missing:
+        raise SystemExit(f"The CSV needs the columns {', '.join(COLUMNS)} (missing {', '.join(missing)}).")
+    for line_no, row in enumerate(reader, start=2):
+        yield line_no, [row.get(c) for c in COLUMNS]
+
+
+#NORMALIZING
+
+
+class Rejected(Exception):
+    pass
+
+
+def clean_email(value):
+    email = (value or "").strip().lower()
+    if not email:
+        raise Rejected("missing email")
+    if len(email) > 100 or not EMAIL_RE.match(email):
+        raise Rejected("bad email")
+    return email
+
+
+def clean_name(value):
+    name = SPACES.sub(" ", value or "").strip()
+    if not name:
+        raise Rejected("missing name")
+    if len(name) > 100:
+        raise Rejected("name too long")
+    return name
+
+
+def clean_date(value, formats):
+    if is_blank(value):
+        return None
+    value = value.strip()
+    for fmt in formats:
+        try:
+            born = datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+        if not EARLIEST_BIRTH <= born <= date.today():
+            raise Rejected("bad date_of_birth")
+        return born
+    raise Rejected("bad date_of_birth")
+
+
+def clean_gender(value):
+    if is_blank(value):
+        return None
+    gender = value.strip()
+    return GENDERS.get(gender.lower(), gender.title()[:20])
+
+
+def clean_phone(value):
+    if is_blank(value):
+        return None
+    digits = NOT_DIGITS.sub("", value)
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    if len(digits) == 10:
+        return f"{digits[:3]}-{digits[3:6]}-{digits[6:]}"
+    if 7 <= len(digits) <= 15 and value.strip().startswith("+"):
+        # international, kept as +digits
+        return "+" + digits
+    raise Rejected("bad phone")
+
+
+def normalize(batch, date_formats):
+    # returns (rows to stage, [(line_no, raw values, reason)], duplicate emails in the batch)
+    by_email = {}
+    rejected = []
+    for line_no, values in batch:
+        full_name, email, date_of_birth, gender, phone = values
+        try:
+            row = (
+                clean_name(full_name), clean_email(email), clean_date(date_of_birth, date_formats),
+                clean_gender(gender), clean_phone(phone),
+            )
+        except Rejected as e:
+            rejected.append((line_no, values, str(e)))
+            continue
+        # ON CONFLICT can't touch the same row twice in one statement, so lines with the same
+        # email are merged the way the upsert would apply them one after the other: a later
+        # value wins, an empty cell keeps the earlier one (whatever the batch size)
+        earlier = by_email.get(row[1])
+        if earlier is not None:
+            row = tuple(earlier_value if value is None else value for value, earlier_value in zip(row, earlier))
+        by_email[row[1]] = row
+    return list(by_email.values()), rejected, len(batch) - len(rejected) - len(by_email)
+
+
+#IMPORT
+
+
+def numbered(rows):
+    # batches() wants (line_no, values) and passes them through as values
+    for line_no, values in rows:
+        yield line_no, (line_no, values)
+
+
+def import_members(source, source_name, batch_size=20_000, checkpoint_path=None, resume=True,
+                   date_formats=DATE_FORMATS, rejects_path=None):
+    checkpoint = load_checkpoint(checkpoint_path, source_name) if resume else None
+    totals = checkpoint or {
+        "source": source_name,
+        "line": 0,
+        "read": 0,
+        "inserted": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "duplicates": 0,
+        "rejected": {},
+    }
+    if checkpoint:
+        print(f"Resuming {source_name} after line {checkpoint['line']}")
+
+    rejects = None
+    if rejects_path:
+        rejects = open(rejects_path, "a" if checkpoint else "w", newline="")
+        rejects_writer = csv.writer(rejects)
+        if not checkpoint:
+            rejects_writer.writerow(["line", "reason"] + COLUMNS)
+
+    conn = engine.raw_connection()
+    start = time.perf_counter()
+    batch_rows = 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (EMAIL_CHECK,))
+        if cursor.fetchone() is None:
+            # stored emails may still be mixed case and wouldn't match the lower-cased ones
+            raise SystemExit("Run python -m app.create_member_email_check first.")
+        cursor.execute(staging_sql)
+        conn.commit()
+
+        for batch, last_line in batches(numbered(read_rows(source)), batch_size, totals["line"]):
+            batch_start = time.perf_counter()
+            rows, rejected, duplicates = normalize(batch, date_formats)
+
+            cursor.copy_expert(
+                f"COPY members_staging ({', '.join(COLUMNS)}) FROM STDIN", RowStream(iter(rows))
+            )
+            cursor.execute(upsert_sql)
+            inserted, updated = cursor.fetchone()
+            conn.commit()
+
+            totals["line"] = last_line
+            totals["read"] += len(batch)
+            totals["inserted"] += inserted
+            totals["updated"] += updated
+            totals["unchanged"] += len(rows) - inserted - updated
+            totals["duplicates"] += duplicates
+            for line_no, values, reason in rejected:
+                totals["rejected"][reason] = totals["rejected"].get(reason, 0) + 1
+                if rejects:
+                    rejects_writer.writerow([line_no, reason] + [v or "" for v in values])
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, totals)
+
+            batch_rows += len(batch)
+            elapsed = time.perf_counter() - batch_start
+            print(
+                f"  line {last_line:>10,}: {inserted:,} inserted, {updated:,} updated, "
+                f"{len(rejected):,} rejected ({len(batch) / elapsed:,.0f} rows/sec)"
+            )
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        if rejects:
+            rejects.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\nImport of {source_name} finished in {elapsed:.1f}s")
+    print(f"  {'read:':<20}{totals['read']:,}")
+    print(f"  {'inserted:':<20}{totals['inserted']:,}")
+    print(f"  {'updated:':<20}{totals['updated']:,}")
+    print(f"  {'unchanged:':<20}{totals['unchanged']:,}")
+    print(f"  {'same email again:':<20}{totals['duplicates']:,} (merged, later values win)")
+    for reason, count in totals["rejected"].items():
+        print(f"  {reason + ':':<20}{count:,}")
+    if elapsed > 0:
+        print(f"  {'throughput:':<20}{batch_rows / elapsed:,.0f} rows/sec this run")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Insert or update members from a CSV file, matched on email.")
+    parser.add_argument("source", help="CSV file, or - for stdin")
+    parser.add_argument("--batch-size", type=int, default=20_000)
+    parser.add_argument("--date-format", action="append",
+                        help=f"strptime format of date_of_birth, can be repeated (default: {', '.join(DATE_FORMATS)})")
+    parser.add_argument("--rejects", help="write rejected lines with the reason to this CSV")
+    parser.add_argument("--checkpoint", help="checkpoint file (defaults to <source>.checkpoint.json)")
+    parser.add_argument("--no-resume", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    options = dict(date_formats=args.date_format or DATE_FORMATS, rejects_path=args.rejects)
+    if args.source == "-":
+        import_members(sys.stdin, "stdin", args.batch_size, args.checkpoint, not args.no_resume, **options)
+    else:
+        checkpoint = args.checkpoint or args.source + ".checkpoint.json"
+        with open(args.source, newline="") as f:
+            import_members(f, os.path.abspath(args.source), args.batch_size, checkpoint, not args.no_resume, **options)
+
+
+if __name__ == "__main__":
+    main()
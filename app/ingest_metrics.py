@@ -0,0 +1,314 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from config import bulk_engine as engine
+from app.generate_data import RowStream
+
+# Bulk ingest for wearable health data.
+# Reads CSV or JSONL (a file, or "-" for stdin) with the columns
+#   member_id, recorded_at, weight, heart_rate, body_fat_percentage
+# in fixed size batches so memory doesn't grow with the file. Each batch is validated
+# with numpy masks, de-duplicated on (member_id, recorded_at), COPY'd into a temp staging
+# table and merged into health_metrics with one INSERT ... SELECT.
+# After every committed batch the line number goes into a checkpoint file, so a crashed
+# run picks up where it left off (re-running a batch is harmless, duplicates are skipped).
+#
+#   python -m app.ingest_metrics readings.csv --batch-size 50000
+#   cat readings.jsonl | python -m app.ingest_metrics - --format jsonl --checkpoint stdin.ckpt
+
+COLUMNS = ["member_id", "recorded_at", "weight", "heart_rate", "body_fat_percentage"]
+
+# anything outside these is treated as a sensor glitch / typo and rejected
+WEIGHT_RANGE = (20.0, 400.0)
+HEART_RATE_RANGE = (25.0, 250.0)
+BODY_FAT_RANGE = (2.0, 70.0)
+EARLIEST_READING = np.datetime64("2000-01-01T00:00:00", "s")
+# members.id is an INTEGER, a bigger id would fail the whole batch's COPY
+MAX_MEMBER_ID = 2**31 - 1
+
+staging_sql = """
+CREATE TEMP TABLE IF NOT EXISTS health_metrics_staging (
+    member_id INTEGER,
+    recorded_at TIMESTAMP,
+    weight DOUBLE PRECISION,
+    heart_rate INTEGER,
+    body_fat_percentage DOUBLE PRECISION
+) ON COMMIT DELETE ROWS
+"""
+
+# one statement: insert the new readings, and count how many pointed at unknown members
+merge_sql = """
+WITH inserted AS (
+    INSERT INTO health_metrics (member_id, recorded_at, weight, heart_rate, body_fat_percentage)
+    SELECT s.member_id, s.recorded_at, s.weight, s.heart_rate, s.body_fat_percentage
+    FROM health_metrics_staging s
+    JOIN members m ON m.id = s.member_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM health_metrics h
+        WHERE h.member_id = s.member_id AND h.recorded_at = s.recorded_at
+    )
+    RETURNING 1
+)
+SELECT
+    (SELECT COUNT(*) FROM inserted),
+    (SELECT COUNT(*) FROM health_metrics_staging s
+     WHERE NOT EXISTS (SELECT 1 FROM members m WHERE m.id = s.member_id))
+"""
+
+
+#READING
+
+
+def read_records(source, fmt):
+    # yields (line_number, [raw values in COLUMNS order])
+    if fmt == "csv":
+        reader = csv.DictReader(source)
+        for line_no, row in enumerate(reader, start=1):
+            yield line_no, [row.get(c) for c in COLUMNS]
+    else:
+        for line_no, line in enumerate(source, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = {}
+            if not isinstance(row, dict):
+                row = {}
+            yield line_no, [row.get(c) for c in COLUMNS]
+
+
+def batches(records, batch_size, skip_until):
+    batch = []
+    last_line = skip_until
+    for line_no, values in records:
+        if line_no <= skip_until:
+            continue
+        batch.append(values)
+        last_line = line_no
+        if len(batch) >= batch_size:
+            yield batch, last_line
+            batch = []
+    if batch:
+        yield batch, last_line
+
+
+#VALIDATION
+
+
+def is_blank(value):
+    return value is None or (isinstance(value, str) and value.strip() == "")
+
+
+def parse_numbers(values):
+    # returns (float array with NaN for blanks, mask of values that were present but not numbers)
+    cleaned = ["nan" if is_blank(v) else v for v in values]
+    try:
+        return np.array(cleaned, dtype=np.float64), np.zeros(len(values), dtype=bool)
+    except (ValueError, TypeError):
+        pass
+
+    # something in the batch isn't a number, fall back to one at a time for this column
+    parsed = np.empty(len(values), dtype=np.float64)
+    invalid = np.zeros(len(values), dtype=bool)
+    for i, v in enumerate(cleaned):
+        try:
+            parsed[i] = float(v)
+        except (ValueError, TypeError):
+            parsed[i] = np.nan
+            invalid[i] = True
+    return parsed, invalid
+
+
+def parse_timestamps(values):
+    cleaned = ["NaT" if is_blank(v) else str(v).strip().replace(" ", "T", 1) for v in values]
+    try:
+        return np.array(cleaned, dtype="datetime64[s]")
+    except ValueError:
+        pass
+
+    parsed = np.empty(len(values), dtype="datetime64[s]")
+    for i, v in enumerate(cleaned):
+        try:
+            parsed[i] = np.datetime64(v, "s")
+        except ValueError:
+            parsed[i] = np.datetime64("NaT")
+    return parsed
+
+
+def out_of_range(values, bounds):
+    # NaN (missing) is allowed, it just isn't stored
+    low, high = bounds
+    return ~np.isnan(values) & ((values < low) | (values > high))
+
+
+def validate(batch):
+    columns = list(zip(*batch))
+    member_ids, bad_member = parse_numbers(columns[0])
+    recorded_at = parse_timestamps(columns[1])
+    weight, bad_weight = parse_numbers(columns[2])
+    heart_rate, bad_hr = parse_numbers(columns[3])
+    body_fat, bad_bf = parse_numbers(columns[4])
+
+    latest_allowed = np.datetime64(datetime.now() + timedelta(days=1), "s")
+    reasons = {
+        "bad member_id": bad_member | np.isnan(member_ids) | (member_ids <= 0) | (member_ids > MAX_MEMBER_ID)
+                         | (member_ids != np.floor(member_ids)),
+        "bad recorded_at": np.isnat(recorded_at) | (recorded_at < EARLIEST_READING) | (recorded_at > latest_allowed),
+        "bad weight": bad_weight | out_of_range(weight, WEIGHT_RANGE),
+        "bad heart_rate": bad_hr | out_of_range(heart_rate, HEART_RATE_RANGE),
+        "bad body_fat_percentage": bad_bf | out_of_range(body_fat, BODY_FAT_RANGE),
+        "no measurements": np.isnan(weight) & np.isnan(heart_rate) & np.isnan(body_fat),
+    }
+
+    rejected = np.zeros(len(batch), dtype=bool)
+    rejected_by_reason = {}
+    for reason, mask in reasons.items():
+        # count each row once, under the first reason it failed
+        new = mask & ~rejected
+        if new.any():
+            rejected_by_reason[reason] = int(new.sum())
+        rejected |= mask
+
+    keep = np.flatnonzero(~rejected)
+    # duplicates inside the batch: keep the first reading for each (member_id, recorded_at)
+    keys = np.empty(len(keep), dtype=[("member_id", np.int64), ("recorded_at", np.int64)])
+    keys["member_id"] = member_ids[keep].astype(np.int64)
+    keys["recorded_at"] = recorded_at[keep].astype(np.int64)
+    _, first = np.unique(keys, return_index=True)
+    keep = np.sort(keep[first])
+
+    rows = zip(
+        member_ids[keep].astype(np.int64).tolist(),
+        recorded_at[keep].tolist(),
+        [None if np.isnan(v) else round(v, 2) for v in weight[keep].tolist()],
+        [None if np.isnan(v) else int(round(v)) for v in heart_rate[keep].tolist()],
+        [None if np.isnan(v) else round(v, 2) for v in body_fat[keep].tolist()],
+    )
+    return list(rows), rejected_by_reason, int((~rejected).sum()) - len(keep)
+
+
+#CHECKPOINTS
+
+
+def load_checkpoint(path, source_name):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("source") != source_name:
+        raise SystemExit(f"Checkpoint {path} belongs to {checkpoint.get('source')}, not {source_name}.")
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    # write then rename, so a crash never leaves half a checkpoint behind
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+#INGEST
+
+
+def ingest(source, source_name, fmt, batch_size=50_000, checkpoint_path=None, resume=True):
+    checkpoint = load_checkpoint(checkpoint_path, source_name) if resume else None
+    totals = checkpoint or {
+        "source": source_name,
+        "line": 0,
+        "read": 0,
+        "inserted": 0,
+        "duplicates": 0,
+        "unknown_member": 0,
+        "rejected": {},
+    }
+    if checkpoint:
+        print(f"Resuming {source_name} after line {checkpoint['line']}")
+
+    conn = engine.raw_connection()
+    start = time.perf_counter()
+    batch_rows = 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute(staging_sql)
+        conn.commit()
+
+        for batch, last_line in batches(read_records(source, fmt), batch_size, totals["line"]):
+            batch_start = time.perf_counter()
+            rows, rejected, in_batch_duplicates = validate(batch)
+
+            cursor.copy_expert(
+                f"COPY health_metrics_staging ({', '.join(COLUMNS)}) FROM STDIN", RowStream(iter(rows))
+            )
+            cursor.execute(merge_sql)
+            inserted, unknown_member = cursor.fetchone()
+            conn.commit()
+
+            totals["line"] = last_line
+            totals["read"] += len(batch)
+            totals["inserted"] += inserted
+            totals["unknown_member"] += unknown_member
+            totals["duplicates"] += in_batch_duplicates + len(rows) - inserted - unknown_member
+            for reason, count in rejected.items():
+                totals["rejected"][reason] = totals["rejected"].get(reason, 0) + count
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, totals)
+
+            batch_rows += len(batch)
+            elapsed = time.perf_counter() - batch_start
+            print(
+                f"  line {last_line:>12,}: {len(batch):,} read, {inserted:,} inserted "
+                f"({len(batch) / elapsed:,.0f} rows/sec)"
+            )
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\nIngest of {source_name} finished in {elapsed:.1f}s")
+    print(f"  read:           {totals['read']:,}")
+    print(f"  inserted:       {totals['inserted']:,}")
+    print(f"  duplicates:     {totals['duplicates']:,}")
+    print(f"  unknown member: {totals['unknown_member']:,}")
+    for reason, count in totals["rejected"].items():
+        print(f"  {reason + ':':<16}{count:,}")
+    if elapsed > 0:
+        print(f"  throughput:     {batch_rows / elapsed:,.0f} rows/sec this run")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream wearable health metrics into health_metrics.")
+    parser.add_argument("source", help="CSV/JSONL file, or - for stdin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--checkpoint", help="checkpoint file (defaults to <source>.checkpoint.json)")
+    parser.add_argument("--no-resume", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if not fmt:
+        fmt = "jsonl" if args.source.endswith((".jsonl", ".json")) else "csv"
+
+    if args.source == "-":
+        checkpoint = args.checkpoint
+        ingest(sys.stdin, "stdin", fmt, args.batch_size, checkpoint, not args.no_resume)
+    else:
+        checkpoint = args.checkpoint or args.source + ".checkpoint.json"
+        with open(args.source, newline="") as f:
+            ingest(f, os.path.abspath(args.source), fmt, args.batch_size, checkpoint, not args.no_resume)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,29 @@
-from config import engine
+import argparse
+
+from config import bulk_engine as engine
 from models.base import Base
 from models import entities  # importing models so SQLAlchemy knows about them when creating tables
+from app.manage_partitions import create_partitioned_table, ensure_partitions
 
 
-def init_db():
+def init_db(partitioned_metrics=False):
     print("Creating tables...")
-    Base.metadata.create_all(bind=engine)
+    if not partitioned_metrics:
+        Base.metadata.create_all(bind=engine)
+    else:
+        # everything else the normal way, then health_metrics as a table partitioned by month
+        # (create_all would make it a plain table, so it's left out here)
+        tables = [t for t in Base.metadata.sorted_tables if t.name != entities.HealthMetric.__tablename__]
+        Base.metadata.create_all(bind=engine, tables=tables)
+        with engine.begin() as conn:
+            create_partitioned_table(conn)
+            ensure_partitions(conn, months_back=12, months_ahead=3)
     print("Done.")
 
 
 if __name__ == "__main__":
-    init_db()
+    parser = argparse.ArgumentParser(description="Create the health club tables.")
+    parser.add_argument("--partitioned-metrics", action="store_true",
+                        help="create health_metrics range-partitioned by month on recorded_at")
+    args = parser.parse_args()
+    init_db(partitioned_metrics=args.partitioned_metrics)
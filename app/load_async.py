@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, session_scope
+from app.benchmark import id_range, percentile, schedule_window
+from services import ServiceError, members, trainers, admin
+
+# Many simultaneous clients running a mix of bookings, schedules, health metrics and
+# invoices, either as coroutines on services/async_ops.py or as one thread per client on
+# the normal sync services, so the two can be compared at the same client count.
+#
+#   python -m app.load_async --clients 500 --requests 20
+#   python -m app.load_async --clients 500 --requests 20 --mode threads
+
+OPERATIONS = ["book_pt_session", "view_trainer_schedule", "add_health_metric", "create_invoice"]
+
+
+def future_slot(rng):
+    # spread over decades so clients rarely collide with each other or with earlier runs
+    start = datetime(2040, 1, 1) + timedelta(minutes=15 * rng.randrange(50 * 365 * 24 * 4))
+    return start, start + timedelta(hours=1)
+
+
+def make_call(rng, ids, name):
+    # (function name, arguments after the session), the same for both modes
+    member = rng.randint(*ids["members"])
+    trainer = rng.randint(*ids["trainers"])
+    room = rng.randint(*ids["rooms"])
+    if name == "book_pt_session":
+        return "book_pt_session", (member, trainer, room, *future_slot(rng))
+    if name == "view_trainer_schedule":
+        return "trainer_schedule", (trainer, *schedule_window(rng))
+    if name == "add_health_metric":
+        return "add_health_metric", (member, None, round(rng.uniform(55, 110), 1), rng.randint(50, 100), None)
+    return "create_invoice", (member, "49.99", "Load test")
+
+
+def merge(results):
+    # [(latencies, outcomes)] per client -> the totals
+    latencies = []
+    outcomes = Counter(ok=0, refused=0, errors=0)
+    for client_latencies, client_outcomes in results:
+        latencies.extend(client_latencies)
+        outcomes.update(client_outcomes)
+    return latencies, outcomes
+
+
+#ASYNC CLIENTS
+
+
+async def async_client(ops, rng, ids, requests):
+    latencies = []
+    outcomes = Counter()
+    for _ in range(requests):
+        func_name, args = make_call(rng, ids, rng.choice(OPERATIONS))
+        start = time.perf_counter()
+        try:
+            async with ops.async_session_scope() as db:
+                await getattr(ops, func_name)(db, *args)
+            outcomes["ok"] += 1
+        except ServiceError:
+            outcomes["refused"] += 1
+        except Exception:
+            outcomes["errors"] += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, outcomes
+
+
+async def run_async(clients, requests, ids, seed):
+    from services import async_ops
+
+    results = await asyncio.gather(*(
+        async_client(async_ops, random.Random(f"{seed}:{i}"), ids, requests)
+        for i in range(clients)
+    ))
+    await async_ops.async_engine.dispose()
+    return merge(results)
+
+
+#THREAD CLIENTS
+
+
+SYNC_FUNCTIONS = {
+    "book_pt_session": members.book_pt_session,
+    "trainer_schedule": trainers.trainer_schedule,
+    "add_health_metric": members.add_health_metric,
+    "create_invoice": admin.create_invoice,
+}
+
+
+def thread_client(rng, ids, requests):
+    # own latencies and counts, merged once every client is done
+    latencies = []
+    outcomes = Counter()
+    for _ in range(requests):
+        func_name, args = make_call(rng, ids, rng.choice(OPERATIONS))
+        start = time.perf_counter()
+        try:
+            with session_scope() as db:
+                SYNC_FUNCTIONS[func_name](db, *args)
+            outcomes["ok"] += 1
+        except ServiceError:
+            outcomes["refused"] += 1
+        except Exception:
+            outcomes["errors"] += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, outcomes
+
+
+def run_threads(clients, requests, ids, seed):
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        futures = [
+            pool.submit(thread_client, random.Random(f"{seed}:{i}"), ids, requests)
+            for i in range(clients)
+        ]
+        return merge(future.result() for future in futures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simultaneous clients against the async or sync services.")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20, help="operations per client")
+    parser.add_argument("--mode", choices=["async", "threads"], default="async")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    ids = {table: id_range(table) for table in ("members", "trainers", "rooms")}
+    if any(low is None for low, high in ids.values()):
+        raise SystemExit("Database is empty, run python -m app.generate_data first.")
+
+    start = time.perf_counter()
+    if args.mode == "async":
+        latencies, outcomes = asyncio.run(run_async(args.clients, args.requests, ids, args.seed))
+    else:
+        latencies, outcomes = run_threads(args.clients, args.requests, ids, args.seed)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{args.mode}: {args.clients} clients, pool {DB_POOL_SIZE}+{DB_MAX_OVERFLOW}")
+    print(f"  operations: {len(latencies):,} in {elapsed:.2f}s ({len(latencies) / elapsed:,.0f} ops/sec)")
+    print(f"  ok {outcomes['ok']:,}, refused {outcomes['refused']:,}, errors {outcomes['errors']:,}")
+    print(
+        f"  latency p50 {percentile(latencies, 50) * 1000:.1f}ms  "
+        f"p95 {percentile(latencies, 95) * 1000:.1f}ms  p99 {percentile(latencies, 99) * 1000:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
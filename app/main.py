@@ -1,16 +1,26 @@
-from datetime import datetime, date
-from config import SessionLocal
-from models.entities import Member, Trainer, Room, ClassSession, PTSession, HealthMetric, Invoice
+import argparse
+from datetime import datetime, date, time, timedelta
+from config import session_scope
+from services import ServiceError, members, trainers, admin, metric_analytics, scheduling, enrollments, profiling
+from app import batch
 
 
-# I’m using one shared session per run. For a bigger app I’d manage this differently,
-# but for this project and the demo it keeps things simple.
-db = SessionLocal()
+# The menu only asks questions and prints answers. The actual work happens in the
+# services package, and every operation gets its own short session (session_scope),
+# so nothing piles up in one long-lived session while the CLI is open.
+#
+#   python -m app.main --profile profile.json --slow-ms 50
+# profiles the SQL of every menu function (see services/profiling.py) and writes the
+# result when you exit.
+#
+#   python -m app.main --batch operations.jsonl --output results.jsonl
+# runs operations from a JSONL file without the menu (see app/batch.py).
 
 
 #MEMBER FUNCTIONS
 
 
+@profiling.profiled
 def register_member():
     print("\n=== Register New Member ===")
     full_name = input("Full name: ").strip()
@@ -27,23 +37,17 @@ def register_member():
             print("Invalid date format, saving without date of birth.")
             dob = None
 
-    member = Member(
-        full_name=full_name,
-        email=email,
-        date_of_birth=dob,
-        gender=gender if gender else None,
-        phone=phone if phone else None
-    )
-
     try:
-        db.add(member)
-        db.commit()
+        with session_scope() as db:
+            member = members.register_member(db, full_name, email, dob, gender, phone)
         print(f"Member created with id: {member.id}")
+    except ServiceError as e:
+        print(e)
     except Exception as e:
-        db.rollback()
         print("Error creating member:", e)
 
 
+@profiling.profiled
 def update_member_goal():
     print("\n=== Update Member Fitness Goal ===")
     member_id_str = input("Member id: ").strip()
@@ -51,9 +55,11 @@ def update_member_goal():
         print("Member id must be a number.")
         return
 
-    member = db.get(Member, int(member_id_str))
-    if not member:
-        print("Member not found.")
+    try:
+        with session_scope() as db:
+            member = members.get_member(db, int(member_id_str))
+    except ServiceError as e:
+        print(e)
         return
 
     print(f"Current goal: {member.fitness_goal}")
@@ -61,23 +67,24 @@ def update_member_goal():
     new_goal = input("New goal description (leave empty to keep current): ").strip()
     target_weight_str = input("New target weight (kg, optional): ").strip()
 
-    if new_goal:
-        member.fitness_goal = new_goal
-
+    target_weight = None
     if target_weight_str:
         try:
-            member.target_weight = float(target_weight_str)
+            target_weight = float(target_weight_str)
         except ValueError:
             print("Invalid number for target weight, keeping old value.")
 
     try:
-        db.commit()
+        with session_scope() as db:
+            members.update_member_goal(db, member.id, new_goal, target_weight)
         print("Member goal updated.")
+    except ServiceError as e:
+        print(e)
     except Exception as e:
-        db.rollback()
         print("Error updating goal:", e)
 
 
+@profiling.profiled
 def add_health_metric():
     print("\n=== Add Health Metric ===")
     member_id_str = input("Member id: ").strip()
@@ -85,11 +92,6 @@ def add_health_metric():
         print("Member id must be a number.")
         return
 
-    member = db.get(Member, int(member_id_str))
-    if not member:
-        print("Member not found.")
-        return
-
     time_str = input("Recorded at (YYYY-MM-DD HH:MM) or leave empty for now: ").strip()
     if time_str:
         try:
@@ -104,27 +106,25 @@ def add_health_metric():
     heart_rate_str = input("Heart rate (bpm, optional): ").strip()
     body_fat_str = input("Body fat % (optional): ").strip()
 
-    weight = float(weight_str) if weight_str else None
-    heart_rate = int(heart_rate_str) if heart_rate_str else None
-    body_fat = float(body_fat_str) if body_fat_str else None
-
-    metric = HealthMetric(
-        member_id=member.id,
-        recorded_at=recorded_at,
-        weight=weight,
-        heart_rate=heart_rate,
-        body_fat_percentage=body_fat
-    )
+    try:
+        weight = float(weight_str) if weight_str else None
+        heart_rate = int(heart_rate_str) if heart_rate_str else None
+        body_fat = float(body_fat_str) if body_fat_str else None
+    except ValueError:
+        print("Weight, heart rate and body fat must be numbers.")
+        return
 
     try:
-        db.add(metric)
-        db.commit()
+        with session_scope() as db:
+            members.add_health_metric(db, int(member_id_str), recorded_at, weight, heart_rate, body_fat)
         print("Health metric saved.")
+    except ServiceError as e:
+        print(e)
     except Exception as e:
-        db.rollback()
         print("Error saving health metric:", e)
 
 
+@profiling.profiled
 def book_pt_session():
     print("\n=== Book Personal Training Session ===")
     member_id_str = input("Member id: ").strip()
@@ -145,76 +145,142 @@ def book_pt_session():
         print("Invalid date/time format.")
         return
 
-    if end_time <= start_time:
-        print("End time must be after start time.")
-        return
+    try:
+        with session_scope() as db:
+            session = members.book_pt_session(
+                db, int(member_id_str), int(trainer_id_str), int(room_id_str), start_time, end_time
+            )
+        print(f"PT session booked with id: {session.id}")
+    except ServiceError as e:
+        print(e)
+    except Exception as e:
+        print("Error booking PT session:", e)
+
 
-    member = db.get(Member, int(member_id_str))
-    trainer = db.get(Trainer, int(trainer_id_str))
-    room = db.get(Room, int(room_id_str))
+@profiling.profiled
+def find_pt_slots():
+    print("\n=== Find Available PT Slots ===")
+    member_id_str = input("Member id: ").strip()
+    trainer_id_str = input("Trainer id (optional): ").strip()
+    specialty = input("Trainer specialty (optional, ignored if a trainer is given): ").strip()
+    room_id_str = input("Room id (optional): ").strip()
+    from_str = input("From date (YYYY-MM-DD) or leave empty for today: ").strip()
+    days_str = input("Number of days to search (default 30): ").strip()
+    duration_str = input("Session length in minutes (default 60): ").strip()
+    hours_str = input(f"Opening hours as HH-HH (default {scheduling.OPEN_HOUR}-{scheduling.CLOSE_HOUR}): ").strip()
 
-    if not member:
-        print("Member not found.")
+    if not member_id_str.isdigit():
+        print("Member id must be a number.")
         return
-    if not trainer:
-        print("Trainer not found.")
+    for value in (trainer_id_str, room_id_str, days_str, duration_str):
+        if value and not value.isdigit():
+            print("Ids, days and minutes must be numbers.")
+            return
+
+    try:
+        range_start = datetime.strptime(from_str, "%Y-%m-%d") if from_str else datetime.now().replace(second=0, microsecond=0)
+        open_hour, close_hour = (
+            (int(h) for h in hours_str.split("-")) if hours_str else (scheduling.OPEN_HOUR, scheduling.CLOSE_HOUR)
+        )
+    except ValueError:
+        print("Invalid date or opening hours format.")
         return
-    if not room:
-        print("Room not found.")
+    range_end = range_start + timedelta(days=int(days_str) if days_str else 30)
+
+    try:
+        with session_scope() as db:
+            slots = scheduling.find_free_slots(
+                db,
+                int(member_id_str),
+                range_start,
+                range_end,
+                timedelta(minutes=int(duration_str) if duration_str else 60),
+                trainer_id=int(trainer_id_str) if trainer_id_str else None,
+                specialty=specialty or None,
+                room_id=int(room_id_str) if room_id_str else None,
+                open_hour=open_hour,
+                close_hour=close_hour,
+            )
+    except ServiceError as e:
+        print(e)
         return
 
-    # very simple overlap check for trainer and room
-    overlapping_pt = (
-        db.query(PTSession)
-        .filter(
-            PTSession.trainer_id == trainer.id,
-            PTSession.start_time < end_time,
-            PTSession.end_time > start_time,
-            PTSession.status != "cancelled",
-        )
-        .all()
-    )
-
-    overlapping_room = (
-        db.query(PTSession)
-        .filter(
-            PTSession.room_id == room.id,
-            PTSession.start_time < end_time,
-            PTSession.end_time > start_time,
-            PTSession.status != "cancelled",
+    if not slots:
+        print("No free slots in that range.")
+        return
+    print("\nEarliest free slots:")
+    for slot in slots:
+        print(
+            f"  {slot['start_time']:%Y-%m-%d %H:%M} -> {slot['end_time']:%H:%M} | "
+            f"trainer {slot['trainer_id']} ({slot['trainer_name']}) | room {slot['room_id']} ({slot['room_name']})"
         )
-        .all()
-    )
 
-    if overlapping_pt:
-        print("Trainer already has a session at that time.")
+
+@profiling.profiled
+def cancel_pt_session():
+    print("\n=== Cancel Personal Training Session ===")
+    session_id_str = input("PT session id: ").strip()
+    if not session_id_str.isdigit():
+        print("Session id must be a number.")
         return
 
-    if overlapping_room:
-        print("Room is already booked at that time.")
+    try:
+        with session_scope() as db:
+            members.cancel_pt_session(db, int(session_id_str))
+        print("PT session cancelled.")
+    except ServiceError as e:
+        print(e)
+    except Exception as e:
+        print("Error cancelling PT session:", e)
+
+
+@profiling.profiled
+def enroll_in_class():
+    print("\n=== Enroll Member in Class ===")
+    member_id_str = input("Member id: ").strip()
+    class_id_str = input("Class id: ").strip()
+    if not (member_id_str.isdigit() and class_id_str.isdigit()):
+        print("Member id and class id must be numbers.")
         return
 
-    session = PTSession(
-        member_id=member.id,
-        trainer_id=trainer.id,
-        room_id=room.id,
-        start_time=start_time,
-        end_time=end_time,
-        status="scheduled",
-    )
+    try:
+        with session_scope() as db:
+            enrollment = enrollments.enroll(db, int(class_id_str), int(member_id_str))
+            position = enrollments.waitlist_position(db, enrollment)
+        if position is None:
+            print(f"Enrolled, enrollment id: {enrollment.id}")
+        else:
+            print(f"Class is full, member is number {position} on the waitlist (enrollment id: {enrollment.id}).")
+    except ServiceError as e:
+        print(e)
+    except Exception as e:
+        print("Error enrolling in class:", e)
+
+
+@profiling.profiled
+def cancel_class_enrollment():
+    print("\n=== Cancel Class Enrollment ===")
+    enrollment_id_str = input("Enrollment id: ").strip()
+    if not enrollment_id_str.isdigit():
+        print("Enrollment id must be a number.")
+        return
 
     try:
-        db.add(session)
-        db.commit()
-        print(f"PT session booked with id: {session.id}")
+        with session_scope() as db:
+            _, promoted = enrollments.cancel_enrollment(db, int(enrollment_id_str))
+        print("Enrollment cancelled.")
+        if promoted:
+            print(f"Member {promoted.member_id} moved up from the waitlist and got the seat.")
+    except ServiceError as e:
+        print(e)
     except Exception as e:
-        db.rollback()
-        print("Error booking PT session:", e)
+        print("Error cancelling enrollment:", e)
 
 
 #TRAINER FUNCTIONS
 
 
+@profiling.profiled
 def view_trainer_schedule():
     print("\n=== Trainer Schedule ===")
     trainer_id_str = input("Trainer id: ").strip()
@@ -222,80 +288,147 @@ def view_trainer_schedule():
         print("Trainer id must be a number.")
         return
 
-    trainer = db.get(Trainer, int(trainer_id_str))
-    if not trainer:
-        print("Trainer not found.")
+    from_str = input("From date (YYYY-MM-DD) or leave empty for today: ").strip()
+    days_str = input(f"Number of days (default {trainers.SCHEDULE_DAYS}): ").strip()
+    try:
+        window_start = datetime.strptime(from_str, "%Y-%m-%d") if from_str else datetime.combine(date.today(), time())
+    except ValueError:
+        print("Invalid date format.")
         return
+    if days_str and not days_str.isdigit():
+        print("Number of days must be a number.")
+        return
+    window_end = window_start + timedelta(days=int(days_str) if days_str else trainers.SCHEDULE_DAYS)
 
-    print(f"\nSchedule for {trainer.full_name}:")
-
-    pt_sessions = (
-        db.query(PTSession)
-        .filter(PTSession.trainer_id == trainer.id)
-        .order_by(PTSession.start_time)
-        .all()
-    )
-
-    class_sessions = (
-        db.query(ClassSession)
-        .filter(ClassSession.trainer_id == trainer.id)
-        .order_by(ClassSession.start_time)
-        .all()
-    )
-
-    print("\nPersonal training sessions:")
-    if not pt_sessions:
-        print("  none")
-    else:
-        for s in pt_sessions:
-            print(f"  PT {s.id}: {s.start_time} -> {s.end_time} | member_id={s.member_id} | status={s.status}")
-
-    print("\nGroup classes:")
-    if not class_sessions:
-        print("  none")
-    else:
-        for c in class_sessions:
-            print(f"  Class {c.id}: {c.title} at {c.start_time} in room {c.room_id}")
-
-
+    after = None
+    first_page = True
+    while True:
+        try:
+            with session_scope() as db:
+                trainer, rows, after = trainers.trainer_schedule(
+                    db, int(trainer_id_str), window_start, window_end, after
+                )
+        except ServiceError as e:
+            print(e)
+            return
+
+        if first_page:
+            print(f"\nSchedule for {trainer.full_name} from {window_start.date()} to {window_end.date()}:")
+            if not rows:
+                print("  nothing scheduled")
+            first_page = False
+
+        for row in rows:
+            if row.kind == "pt":
+                print(
+                    f"  {row.start_time} -> {row.end_time} | PT {row.id} with {row.member_name} "
+                    f"in {row.room_name} | status={row.status}"
+                )
+            else:
+                print(
+                    f"  {row.start_time} -> {row.end_time} | Class {row.id}: {row.title} "
+                    f"in {row.room_name} | capacity={row.capacity}"
+                )
+
+        if after is None:
+            return
+        if input("\nShow more? (y/n): ").strip().lower() != "y":
+            return
+
+
+@profiling.profiled
 def trainer_lookup_member():
     print("\n=== Trainer Member Lookup ===")
     name_part = input("Enter part of member name (case-insensitive): ").strip()
 
-    members = (
-        db.query(Member)
-        .filter(Member.full_name.ilike(f"%{name_part}%"))
-        .all()
-    )
+    page_size = trainers.LOOKUP_PAGE_SIZE
+    offset = 0
+    while True:
+        shown = 0
+        try:
+            with session_scope() as db:
+                for row in trainers.search_members(db, name_part, page_size, offset):
+                    shown += 1
+                    print(f"\nMember id: {row.id} | Name: {row.full_name} | Goal: {row.fitness_goal}")
+
+                    if row.recorded_at:
+                        print(
+                            f"  Last metric at {row.recorded_at}: "
+                            f"weight={row.weight}, "
+                            f"heart_rate={row.heart_rate}, "
+                            f"body_fat={row.body_fat_percentage}"
+                        )
+                    else:
+                        print("  No health metrics recorded yet.")
+        except ServiceError as e:
+            print(e)
+            return
+        except Exception as e:
+            print("Error looking up members:", e)
+            return
+
+        if shown == 0 and offset == 0:
+            print("No members found.")
+            return
+        if shown < page_size:
+            return
+
+        offset += page_size
+        if input("\nShow more? (y/n): ").strip().lower() != "y":
+            return
+
+
+@profiling.profiled
+def view_member_trend():
+    print("\n=== Member Health Trend ===")
+    member_id_str = input("Member id: ").strip()
+    if not member_id_str.isdigit():
+        print("Member id must be a number.")
+        return
+
+    try:
+        with session_scope() as db:
+            member, report = trainers.member_trend(db, int(member_id_str))
+    except ServiceError as e:
+        print(e)
+        return
 
-    if not members:
-        print("No members found.")
+    if not report:
+        print(f"No health metrics in the last {trainers.TREND_DAYS} days.")
         return
 
-    for m in members:
-        print(f"\nMember id: {m.id} | Name: {m.full_name} | Goal: {m.fitness_goal}")
+    print(f"\n{member.full_name}: {report['readings']} readings from {report['first']} to {report['last']}")
 
-        last_metric = (
-            db.query(HealthMetric)
-            .filter(HealthMetric.member_id == m.id)
-            .order_by(HealthMetric.recorded_at.desc())
-            .first()
+    rollup = report["rollup"]
+    print("\nWeekly averages (last 12 weeks):")
+    for i in range(max(0, len(rollup["bucket_start"]) - 12), len(rollup["bucket_start"])):
+        week = metric_analytics.to_datetime(rollup["bucket_start"][i]).date()
+        print(
+            f"  week of {week}: weight={rollup['weight_mean'][i]:.1f} "
+            f"heart_rate={rollup['heart_rate_mean'][i]:.0f} "
+            f"body_fat={rollup['body_fat_mean'][i]:.1f} ({rollup['readings'][i]} readings)"
         )
 
-        if last_metric:
-            print(
-                f"  Last metric at {last_metric.recorded_at}: "
-                f"weight={last_metric.weight}, "
-                f"heart_rate={last_metric.heart_rate}, "
-                f"body_fat={last_metric.body_fat_percentage}"
-            )
+    print(f"\n7 day average weight: {report['weight_7d_mean']:.1f}")
+    trend = report["trend"]
+    if trend:
+        print(f"Weight trend: {trend['slope_kg_per_week']:+.2f} kg/week (last 90 days)")
+        if member.target_weight is None:
+            print("No target weight set.")
+        elif trend["projected_goal_date"]:
+            print(f"Projected to reach {member.target_weight} kg around {trend['projected_goal_date']}")
         else:
-            print("  No health metrics recorded yet.")
+            print(f"Not currently trending towards the {member.target_weight} kg target.")
+
+    print(f"Heart rate anomalies: {report['anomaly_count']}")
+    for at, heart_rate in report["anomalies"]:
+        print(f"  {at}: {heart_rate:.0f} bpm")
 
 
 #ADMIN FUNCTIONS
 
 
+@profiling.profiled
 def create_class_session():
     print("\n=== Create New Class Session (Admin) ===")
     title = input("Class title: ").strip()
@@ -316,53 +449,19 @@ def create_class_session():
         print("Invalid date/time format.")
         return
 
-    if end_time <= start_time:
-        print("End time must be after start time.")
-        return
-
-    room = db.get(Room, int(room_id_str))
-    trainer = db.get(Trainer, int(trainer_id_str))
-
-    if not room:
-        print("Room not found.")
-        return
-    if not trainer:
-        print("Trainer not found.")
-        return
-
-    # rough double booking check for room
-    overlapping_class = (
-        db.query(ClassSession)
-        .filter(
-            ClassSession.room_id == room.id,
-            ClassSession.start_time < end_time,
-            ClassSession.end_time > start_time,
-        )
-        .all()
-    )
-
-    if overlapping_class:
-        print("Room already has a class at that time.")
-        return
-
-    new_class = ClassSession(
-        title=title,
-        start_time=start_time,
-        end_time=end_time,
-        capacity=int(capacity_str),
-        room_id=room.id,
-        trainer_id=trainer.id,
-    )
-
     try:
-        db.add(new_class)
-        db.commit()
+        with session_scope() as db:
+            new_class = admin.create_class_session(
+                db, title, int(room_id_str), int(trainer_id_str), int(capacity_str), start_time, end_time
+            )
         print(f"Class created with id: {new_class.id}")
+    except ServiceError as e:
+        print(e)
     except Exception as e:
-        db.rollback()
         print("Error creating class:", e)
 
 
+@profiling.profiled
 def create_invoice():
     print("\n=== Create Invoice (Admin) ===")
     member_id_str = input("Member id: ").strip()
@@ -374,30 +473,12 @@ def create_invoice():
         return
 
     try:
-        amount = float(amount_str)
-    except ValueError:
-        print("Amount must be a number.")
-        return
-
-    member = db.get(Member, int(member_id_str))
-    if not member:
-        print("Member not found.")
-        return
-
-    invoice = Invoice(
-        member_id=member.id,
-        created_at=datetime.now(),
-        amount=amount,
-        status="unpaid",
-        description=description if description else None,
-    )
-
-    try:
-        db.add(invoice)
-        db.commit()
+        with session_scope() as db:
+            invoice = admin.create_invoice(db, int(member_id_str), amount_str, description)
         print(f"Invoice created with id: {invoice.id}")
+    except ServiceError as e:
+        print(e)
     except Exception as e:
-        db.rollback()
         print("Error creating invoice:", e)
 
 
@@ -417,7 +498,12 @@ def main_menu():
         print("6. Trainer member lookup")
         print("7. Create class session (admin)")
         print("8. Create invoice (admin)")
-        print("9. Exit")
+        print("9. Cancel PT session")
+        print("10. Member health trend (trainer)")
+        print("11. Find available PT slots")
+        print("12. Enroll in class")
+        print("13. Cancel class enrollment")
+        print("14. Exit")
         choice = input("Choose an option: ").strip()
 
         if choice == "1":
@@ -437,14 +523,53 @@ def main_menu():
         elif choice == "8":
             create_invoice()
         elif choice == "9":
+            cancel_pt_session()
+        elif choice == "10":
+            view_member_trend()
+        elif choice == "11":
+            find_pt_slots()
+        elif choice == "12":
+            enroll_in_class()
+        elif choice == "13":
+            cancel_class_enrollment()
+        elif choice == "14":
             print("Goodbye.")
             break
         else:
             print("Invalid choice, try again.")
 
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description="Health club management CLI.")
+    parser.add_argument("--profile", nargs="?", const="profile.json", metavar="FILE",
+                        help="profile the SQL of every operation, written to FILE on exit (default profile.json)")
+    parser.add_argument("--slow-ms", type=float, help="slow-query log threshold in ms (with --profile)")
+    parser.add_argument("--slow-log", help="slow-query log file (with --profile)")
+    parser.add_argument("--batch", metavar="FILE", help="run the operations in a JSONL file (- for stdin) instead of the menu")
+    parser.add_argument("--output", metavar="FILE", help="per-record results of --batch (default stdout)")
+    parser.add_argument("--commit-every", type=int, default=batch.DEFAULT_COMMIT_EVERY,
+                        help="records per transaction in --batch mode")
+    args = parser.parse_args()
+    if args.commit_every < 1:
+        parser.error("--commit-every must be at least 1")
+
+    if args.profile:
+        profiling.enable(args.slow_ms, args.slow_log)
     try:
-        main_menu()
+        if args.batch:
+            with profiling.operation("batch"):
+                batch.main_batch(args.batch, args.output, args.commit_every)
+        else:
+            main_menu()
+    except (KeyboardInterrupt, EOFError):
+        print()
     finally:
-        db.close()
+        if args.profile:
+            print("\nSQL per operation:")
+            profiling.print_summary()
+            profiling.export_json(args.profile)
+            print(f"Profile written to {args.profile}, slow statements in {profiling.slow_log}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import argparse
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from config import bulk_engine as engine
+from services.receivables import member_aging_sql
+from services.scheduling import busy_intervals_sql
+from services.trainers import LOOKUP_PAGE_SIZE, member_lookup_sql, trainer_schedule_sql
+
+# Declares the indexes each query path needs, applies them, and checks the plans.
+#
+#   python -m app.manage_indexes apply     create anything missing (CONCURRENTLY where possible)
+#   python -m app.manage_indexes verify    EXPLAIN (ANALYZE, BUFFERS) every hot query and fail
+#                                          if one of them seq scans a big table
+#
+# New query paths should register their query in HOT_QUERIES and the index they rely on
+# in INDEXES, so "verify" catches it when a change makes the planner fall back to a scan.
+
+# name -> (table, index definition, extension it needs)
+INDEXES = {
+    "idx_ptsession_start": ("pt_sessions", "(start_time)", None),
+    "idx_pt_sessions_trainer_time": ("pt_sessions", "(trainer_id, start_time, end_time)", None),
+    "idx_pt_sessions_room_time": ("pt_sessions", "(room_id, start_time, end_time)", None),
+    "idx_pt_sessions_member_time": ("pt_sessions", "(member_id, start_time, end_time)", None),
+    "idx_class_sessions_trainer_time": ("class_sessions", "(trainer_id, start_time, end_time)", None),
+    "idx_class_sessions_room_time": ("class_sessions", "(room_id, start_time, end_time)", None),
+    "idx_class_sessions_start": ("class_sessions", "(start_time)", None),
+    "idx_class_enrollments_waitlist": (
+        "class_enrollments", "(class_id, requested_at, id) WHERE status = 'waitlisted'", None,
+    ),
+    "idx_health_metrics_member_recorded": ("health_metrics", "(member_id, recorded_at DESC)", None),
+    "idx_invoices_member_status": ("invoices", "(member_id, status)", None),
+    "idx_invoices_created_at": ("invoices", "(created_at)", None),
+    "idx_invoices_open_member": ("invoices", "(member_id, created_at) INCLUDE (amount) WHERE status = 'unpaid'", None),
+    "idx_members_full_name_trgm": ("members", "USING gin (full_name gin_trgm_ops)", "pg_trgm"),
+}
+
+# name -> (query, query that picks realistic parameters for it)
+HOT_QUERIES = {
+    "book_pt_session: availability load": (
+        """
+        SELECT id, trainer_id, room_id, member_id, start_time, end_time
+        FROM pt_sessions
+        WHERE status != 'cancelled' AND end_time > :now
+          AND (trainer_id = :trainer_id OR room_id = :room_id OR member_id = :member_id)
+        """,
+        "SELECT trainer_id, room_id, member_id, LOCALTIMESTAMP AS now FROM pt_sessions ORDER BY id DESC LIMIT 1",
+    ),
+    "book_pt_session: conflict check": (
+        """
+        SELECT 1
+        FROM pt_sessions
+        WHERE status != 'cancelled'
+          AND start_time < :end_time AND end_time > :start_time
+          AND (trainer_id = :trainer_id OR room_id = :room_id OR member_id = :member_id)
+        LIMIT 1
+        """,
+        "SELECT trainer_id, room_id, member_id, start_time, end_time FROM pt_sessions ORDER BY id DESC LIMIT 1",
+    ),
+    "view_trainer_schedule: one week": (
+        trainer_schedule_sql.text,
+        """
+        SELECT trainer_id, start_time AS after_start, start_time + interval '7 days' AS window_end,
+               '' AS after_kind, 0 AS after_id, 50 AS "limit"
+        FROM pt_sessions ORDER BY id DESC LIMIT 1
+        """,
+    ),
+    "find_pt_slots: busy intervals": (
+        busy_intervals_sql.text,
+        """
+        SELECT start_time AS range_start, start_time + interval '30 days' AS range_end,
+               start_time - interval '1 day' AS earliest_start,
+               NULL::integer[] AS trainer_ids, NULL::integer[] AS room_ids, ARRAY[member_id] AS member_ids
+        FROM pt_sessions ORDER BY id DESC LIMIT 1
+        """,
+    ),
+    "create_class_session: room overlap": (
+        """
+        SELECT id FROM class_sessions
+        WHERE room_id = :room_id AND start_time < :end_time AND end_time > :start_time
+        LIMIT 1
+        """,
+        "SELECT room_id, start_time, end_time FROM class_sessions ORDER BY id DESC LIMIT 1",
+    ),
+    "enroll_in_class: existing enrollment": (
+        """
+        SELECT status FROM class_enrollments
+        WHERE class_id = :class_id AND member_id = :member_id AND status != 'cancelled'
+        """,
+        "SELECT class_id, member_id FROM class_enrollments ORDER BY id DESC LIMIT 1",
+    ),
+    "cancel_enrollment: next on the waitlist": (
+        """
+        SELECT id FROM class_enrollments
+        WHERE class_id = :class_id AND status = 'waitlisted'
+        ORDER BY requested_at, id
+        LIMIT 1
+        """,
+        "SELECT class_id FROM class_enrollments ORDER BY id DESC LIMIT 1",
+    ),
+    # the real lookup: substring (ILIKE) or fuzzy (pg_trgm %) matches, both on the trigram index
+    "trainer_lookup_member: name search": (
+        member_lookup_sql.text,
+        f"""
+        SELECT split_part(full_name, ' ', 2) AS name, '%' || split_part(full_name, ' ', 2) || '%' AS pattern,
+               {LOOKUP_PAGE_SIZE} AS "limit", 0 AS "offset"
+        FROM members ORDER BY id DESC LIMIT 1
+        """,
+    ),
+    "trainer_lookup_member: misspelled name": (
+        member_lookup_sql.text,
+        f"""
+        SELECT left(full_name, -1) || 'x' AS name, '%' || left(full_name, -1) || 'x%' AS pattern,
+               {LOOKUP_PAGE_SIZE} AS "limit", 0 AS "offset"
+        FROM members ORDER BY id DESC LIMIT 1
+        """,
+    ),
+    "latest health metric": (
+        "SELECT * FROM health_metrics WHERE member_id = :member_id ORDER BY recorded_at DESC LIMIT 1",
+        "SELECT member_id FROM health_metrics ORDER BY id DESC LIMIT 1",
+    ),
+    "unpaid invoices for member": (
+        "SELECT * FROM invoices WHERE member_id = :member_id AND status = 'unpaid'",
+        "SELECT member_id FROM invoices ORDER BY id DESC LIMIT 1",
+    ),
+    "refresh_invoice_summaries: one day": (
+        """
+        SELECT status, coalesce(category, invoice_category(description)), COUNT(*), SUM(amount)
+        FROM invoices
+        WHERE created_at >= :day AND created_at < :day + 1
+        GROUP BY 1, 2
+        """,
+        "SELECT created_at::date AS day FROM invoices ORDER BY id DESC LIMIT 1",
+    ),
+    "top_debtors: aging of the listed members": (
+        member_aging_sql.text,
+        "SELECT CURRENT_DATE AS today, ARRAY(SELECT member_id FROM member_balances LIMIT 20) AS member_ids",
+    ),
+}
+
+DEFAULT_MAX_SEQ_SCAN_ROWS = 10_000
+
+
+#APPLY
+
+
+def apply_indexes():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, (table, definition, extension) in INDEXES.items():
+            if extension:
+                try:
+                    conn.execute(text(f"CREATE EXTENSION IF NOT EXISTS {extension}"))
+                except Exception as e:
+                    print(f"Skipping {name}: extension {extension} isn't available ({e.__class__.__name__})")
+                    continue
+
+            state = conn.execute(
+                text("""
+                    SELECT i.indisvalid
+                    FROM pg_index i
+                    JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = :name
+                """),
+                {"name": name},
+            ).scalar()
+            if state is True:
+                print(f"Index exists: {name}")
+                continue
+            if state is False:
+                # left behind by an interrupted CONCURRENTLY build, it has to be rebuilt
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+            # partitioned tables don't support CONCURRENTLY
+            partitioned = conn.execute(
+                text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+            ).scalar()
+            concurrently = "" if partitioned else "CONCURRENTLY "
+            conn.execute(text(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} {definition}"))
+            print(f"Index created: {name}")
+
+
+#VERIFY
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def table_rows(conn, table, cache):
+    if table not in cache:
+        cache[table] = conn.execute(
+            text("SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = to_regclass(:t)"), {"t": table}
+        ).scalar() or 0
+    return cache[table]
+
+
+def verify_queries(max_seq_scan_rows=DEFAULT_MAX_SEQ_SCAN_ROWS):
+    failures = []
+    sizes = {}
+    with engine.connect() as conn:
+        for name, (query, params_query) in HOT_QUERIES.items():
+            # in a savepoint, so a failure here doesn't abort the queries after it
+            try:
+                with conn.begin_nested():
+                    row = conn.execute(text(params_query)).mappings().first()
+            except DBAPIError as e:
+                # e.g. an optional table (member_balances, class_enrollments) that hasn't been created
+                reason = f"{e.orig}".splitlines()[0]
+                print(f"  {name:<40} skipped (can't pick parameters: {reason})")
+                continue
+            if row is None:
+                print(f"  {name:<40} skipped (no data to pick parameters from)")
+                continue
+
+            try:
+                with conn.begin_nested():
+                    explained = conn.execute(
+                        text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}"), dict(row)
+                    ).scalar()
+            except DBAPIError as e:
+                # e.g. pg_trgm isn't installed, so the query the app runs can't run either
+                problem = f"query failed: {e.orig}".splitlines()[0]
+                print(f"  {name:<40} FAIL\n      {problem}")
+                failures.append((name, problem))
+                continue
+            top = explained[0]
+            plan = top["Plan"]
+
+            problems = []
+            for node in plan_nodes(plan):
+                if node["Node Type"] != "Seq Scan":
+                    continue
+                relation = node.get("Relation Name")
+                rows = table_rows(conn, relation, sizes)
+                if rows > max_seq_scan_rows:
+                    problems.append(f"seq scan on {relation} ({rows:,} rows)")
+
+            scans = sorted({node["Node Type"] for node in plan_nodes(plan) if "Scan" in node["Node Type"]})
+            buffers = plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+            status = "FAIL" if problems else "ok"
+            print(
+                f"  {name:<40} {status:<4} {top['Execution Time']:>9.2f}ms  "
+                f"{buffers:>7} buffers  {', '.join(scans)}"
+            )
+            for problem in problems:
+                print(f"      {problem}")
+                failures.append((name, problem))
+        conn.rollback()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply declared indexes and verify hot query plans.")
+    parser.add_argument("command", nargs="?", choices=["apply", "verify", "all"], default="all")
+    parser.add_argument("--max-seq-scan-rows", type=int, default=DEFAULT_MAX_SEQ_SCAN_ROWS,
+                        help="a seq scan on a table bigger than this fails verification")
+    args = parser.parse_args()
+
+    if args.command in ("apply", "all"):
+        apply_indexes()
+    if args.command in ("verify", "all"):
+        print("\nVerifying hot queries:")
+        failures = verify_queries(args.max_seq_scan_rows)
+        if failures:
+            print(f"\n{len(failures)} problem(s) in the hot query plans (sequential scans or failed queries).")
+            sys.exit(1)
+        print("\nAll hot queries use indexes.")
+
+
+if __name__ == "__main__":
+    main()
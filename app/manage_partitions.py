@@ -0,0 +1,155 @@
+import argparse
+from datetime import date
+
+from sqlalchemy import text
+
+from config import bulk_engine as engine
+
+# Monthly partitions for health_metrics (only when init_db was run with --partitioned-metrics).
+# Run this regularly (e.g. from cron at the start of every month): it makes sure the next few
+# months already have a partition, and can detach (and archive or drop) months we no longer
+# want to keep online. Queries that filter on recorded_at only touch the months they need.
+#
+#   python -m app.manage_partitions --ahead 3
+#   python -m app.manage_partitions --back 36            # split old rows out of the default partition
+#   python -m app.manage_partitions --retain-months 24 --archive-schema archive
+
+PARENT = "health_metrics"
+DEFAULT_PARTITION = "health_metrics_default"
+
+# Same columns as HealthMetric in models/entities.py. The primary key has to include the
+# partition key, the ORM doesn't care since it still identifies rows by id.
+partitioned_table_sql = """
+CREATE TABLE IF NOT EXISTS health_metrics (
+    id SERIAL,
+    member_id INTEGER NOT NULL REFERENCES members(id),
+    recorded_at TIMESTAMP NOT NULL,
+    weight DOUBLE PRECISION,
+    heart_rate INTEGER,
+    body_fat_percentage DOUBLE PRECISION,
+    PRIMARY KEY (id, recorded_at)
+) PARTITION BY RANGE (recorded_at);
+
+CREATE TABLE IF NOT EXISTS health_metrics_default PARTITION OF health_metrics DEFAULT;
+"""
+
+
+def add_months(month, n):
+    years, month_index = divmod(month.month - 1 + n, 12)
+    return date(month.year + years, month_index + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARENT}_{month:%Y_%m}"
+
+
+def is_partitioned(conn):
+    return conn.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:name)"), {"name": PARENT}
+    ).scalar() or False
+
+
+def existing_partitions(conn):
+    return set(
+        conn.execute(
+            text("""
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = to_regclass(:name)
+            """),
+            {"name": PARENT},
+        ).scalars()
+    )
+
+
+def create_partitioned_table(conn):
+    conn.execute(text(partitioned_table_sql))
+
+
+def create_partition(conn, month):
+    # Built as a normal table and attached afterwards, because readings for this month
+    # may already be sitting in the default partition and have to be moved over first.
+    name = partition_name(month)
+    start, end = month, add_months(month, 1)
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = conn.execute(
+        text(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE recorded_at >= :start AND recorded_at < :end
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """),
+        {"start": start, "end": end},
+    ).rowcount
+    conn.execute(text(
+        f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    return moved
+
+
+def ensure_partitions(conn, months_back=0, months_ahead=3, today=None):
+    this_month = (today or date.today()).replace(day=1)
+    existing = existing_partitions(conn)
+    for offset in range(-months_back, months_ahead + 1):
+        month = add_months(this_month, offset)
+        if partition_name(month) in existing:
+            continue
+        moved = create_partition(conn, month)
+        note = f" (moved {moved:,} rows from the default partition)" if moved else ""
+        print(f"Partition created: {partition_name(month)}{note}")
+
+
+def detach_old_partitions(conn, retain_months, archive_schema=None, drop=False, today=None):
+    cutoff = add_months((today or date.today()).replace(day=1), -retain_months)
+    has_summary = conn.execute(
+        text("SELECT to_regprocedure('recompute_member_metric_summary(integer[])') IS NOT NULL")
+    ).scalar()
+
+    for name in sorted(existing_partitions(conn)):
+        if name == DEFAULT_PARTITION:
+            continue
+        year, month = name[len(PARENT) + 1:].split("_")
+        if date(int(year), int(month), 1) >= cutoff:
+            continue
+
+        conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        if has_summary:
+            # counts/min/max in member_metric_summary only cover what's still online
+            conn.execute(text(
+                f"SELECT recompute_member_metric_summary(ARRAY(SELECT DISTINCT member_id FROM {name}))"
+            ))
+
+        if drop:
+            conn.execute(text(f"DROP TABLE {name}"))
+            print(f"Partition dropped: {name}")
+        elif archive_schema:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}"))
+            conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {archive_schema}"))
+            print(f"Partition archived: {archive_schema}.{name}")
+        else:
+            print(f"Partition detached: {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the monthly health_metrics partitions.")
+    parser.add_argument("--ahead", type=int, default=3, help="months to pre-create after the current one")
+    parser.add_argument("--back", type=int, default=0, help="past months to make sure exist")
+    parser.add_argument("--retain-months", type=int, help="detach partitions older than this many months")
+    parser.add_argument("--archive-schema", help="move detached partitions into this schema")
+    parser.add_argument("--drop", action="store_true", help="drop detached partitions instead of keeping them")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            raise SystemExit("health_metrics isn't partitioned (run init_db with --partitioned-metrics).")
+        ensure_partitions(conn, args.back, args.ahead)
+        if args.retain_months is not None:
+            detach_old_partitions(conn, args.retain_months, args.archive_schema, args.drop)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -8,6 +10,69 @@ DB_PORT = "5432"
 DB_NAME = "health_club"
 
 DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# used by services/async_ops.py (needs pip install asyncpg)
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# "trigger": overlaps are checked by the app (plus the prevent_overlapping_pt trigger)
+# "constraints": overlaps are enforced by the exclusion constraints from app/create_constraints.py
+OVERLAP_MODE = "trigger"
+
+# Connection pool for the app. Every operation borrows a connection for one short session,
+# so pool size is roughly "how many operations can hit the database at the same time".
+DB_ECHO = False                 # True prints every SQL statement (slow; --profile is usually the better tool)
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 20
+DB_POOL_TIMEOUT = 30            # seconds to wait for a free connection before giving up
+DB_POOL_RECYCLE = 1800          # reconnect connections older than this (seconds)
+DB_STATEMENT_TIMEOUT_MS = 5000  # a single statement from the app is cancelled after this, 0 = no limit
+
+# SQL profiling (services/profiling.py), off unless something turns it on (python -m app.main --profile)
+DB_SLOW_QUERY_MS = 200          # statements at least this slow go to the slow-query log
+DB_SLOW_QUERY_LOG = "slow_queries.log"
+DB_N_PLUS_ONE_REPEATS = 5       # same statement shape this often in one operation = N+1 suspect
+
+# Members, trainers and rooms looked up by id are cached per process (services/reference_cache.py),
+# kept in sync across processes by the NOTIFY triggers from app/create_reference_notify.py
+REFERENCE_CACHE = True
+REFERENCE_CACHE_SIZE = 50_000   # rows kept, least recently used go first
+REFERENCE_CACHE_TTL = 300       # seconds, a backstop in case a notification is ever lost
+
+# Upcoming PT sessions of recently booked trainers, rooms and members are indexed per process
+# (services/availability.py); this many of them at most, least recently used go first
+AVAILABILITY_INDEX_SIZE = 10_000
+# seconds a resource's schedule is used before it's loaded again (cancellations made by other
+# processes show up by then), and how recent a load has to be for a "free" answer to be
+# trusted without asking the database again
+AVAILABILITY_INDEX_TTL = 60
+AVAILABILITY_INDEX_FRESH = 1.0
+
+engine = create_engine(
+    DATABASE_URL,
+    echo=DB_ECHO,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"},
+)
+# objects stay usable after their session is closed, the CLI prints them afterwards
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+# Bulk loads and schema maintenance (COPY, backfills, CREATE INDEX CONCURRENTLY) are
+# supposed to run for a long time, so they get their own engine without the timeout.
+bulk_engine = create_engine(DATABASE_URL, echo=DB_ECHO, pool_pre_ping=True)
+
 
-engine = create_engine(DATABASE_URL, echo=True)
-SessionLocal = sessionmaker(bind=engine)
+@contextmanager
+def session_scope():
+    # one short-lived session per operation: commit if it worked, roll back if it didn't
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -7,7 +7,11 @@ from sqlalchemy import (
     Float,
     Boolean,
     ForeignKey,
-    Numeric
+    Numeric,
+    CheckConstraint,
+    Index,
+    UniqueConstraint,
+    text,
 )
 from sqlalchemy.orm import relationship
 from .base import Base
@@ -29,6 +33,11 @@ class Member(Base):
     health_metrics = relationship("HealthMetric", back_populates="member")
     pt_sessions = relationship("PTSession", back_populates="member")
     invoices = relationship("Invoice", back_populates="member")
+    class_enrollments = relationship("ClassEnrollment", back_populates="member")
+
+    __table_args__ = (
+        CheckConstraint("email = lower(email)", name="members_email_lowercase"),
+    )
 
 
 class Trainer(Base):
@@ -62,12 +71,42 @@ class ClassSession(Base):
     start_time = Column(DateTime, nullable=False)
     end_time = Column(DateTime, nullable=False)
     capacity = Column(Integer, nullable=False)
+    # seats taken, kept up to date by services/enrollments.py in the same transaction as
+    # the enrollment rows, so checking for a free seat is one row instead of a COUNT
+    enrolled_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
     trainer_id = Column(Integer, ForeignKey("trainers.id"), nullable=False)
 
     room = relationship("Room", back_populates="class_sessions")
     trainer = relationship("Trainer", back_populates="class_sessions")
+    enrollments = relationship("ClassEnrollment", back_populates="class_session")
+
+    __table_args__ = (
+        CheckConstraint("enrolled_count BETWEEN 0 AND capacity", name="class_sessions_enrolled_within_capacity"),
+    )
+
+
+class ClassEnrollment(Base):
+    __tablename__ = "class_enrollments"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    class_id = Column(Integer, ForeignKey("class_sessions.id"), nullable=False)
+    member_id = Column(Integer, ForeignKey("members.id"), nullable=False)
+    status = Column(String(20), nullable=False, default="enrolled")  # enrolled, waitlisted, cancelled
+    requested_at = Column(DateTime, nullable=False)  # waitlist order
+    updated_at = Column(DateTime, nullable=True)  # last promotion/cancellation
+
+    class_session = relationship("ClassSession", back_populates="enrollments")
+    member = relationship("Member", back_populates="class_enrollments")
+
+    __table_args__ = (
+        # a member has at most one live enrollment per class, cancelled ones are kept as history
+        Index(
+            "uq_class_enrollments_member_active", "class_id", "member_id",
+            unique=True, postgresql_where=text("status <> 'cancelled'"),
+        ),
+    )
 
 
 class PTSession(Base):
@@ -109,5 +148,27 @@ class Invoice(Base):
     amount = Column(Numeric(10, 2), nullable=False)
     status = Column(String(20), nullable=False, default="unpaid")
     description = Column(String(255), nullable=True)
+    # first day of the month for invoices made by the billing run (app/billing_run.py), NULL otherwise
+    billing_period = Column(Date, nullable=True)
+    # report category (Membership, Personal training, ...) when the code that made the invoice
+    # knows it; NULL means the reports work it out from the description
+    category = Column(String(30), nullable=True)
 
     member = relationship("Member", back_populates="invoices")
+
+    __table_args__ = (
+        # one billing run invoice per member, month and category, what makes re-running a period harmless
+        UniqueConstraint("member_id", "billing_period", "category", name="uq_invoices_member_period_category"),
+    )
+
+
+class BillingRun(Base):
+    __tablename__ = "billing_runs"
+
+    # progress of the monthly billing run, committed together with each chunk of invoices
+    billing_period = Column(Date, primary_key=True)
+    last_member_id = Column(Integer, nullable=False, default=0)
+    invoices = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
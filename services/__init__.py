@@ -0,0 +1,2 @@
+from .base import ServiceError, NotFound, Conflict
+from . import members, trainers, admin, scheduling, enrollments
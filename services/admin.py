@@ -0,0 +1,78 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy.exc import IntegrityError
+
+from config import OVERLAP_MODE
+from models.entities import ClassSession, Invoice
+from services import reference_cache
+from services.availability import CONFLICT_MESSAGES, overlap_violation
+from services.base import ServiceError, Conflict
+
+
+def create_class_session(db, title, room_id, trainer_id, capacity, start_time, end_time):
+    if end_time <= start_time:
+        raise ServiceError("End time must be after start time.")
+    if capacity <= 0:
+        raise ServiceError("Capacity must be a positive number.")
+
+    room = reference_cache.room(db, room_id)
+    trainer = reference_cache.trainer(db, trainer_id)
+
+    # rough double booking check for room (the exclusion constraint does this for us)
+    if OVERLAP_MODE != "constraints":
+        overlapping_class = (
+            db.query(ClassSession.id)
+            .filter(
+                ClassSession.room_id == room.id,
+                ClassSession.start_time < end_time,
+                ClassSession.end_time > start_time,
+            )
+            .first()
+        )
+
+        if overlapping_class:
+            raise Conflict(CONFLICT_MESSAGES["class_room"])
+
+    new_class = ClassSession(
+        title=title,
+        start_time=start_time,
+        end_time=end_time,
+        capacity=capacity,
+        room_id=room.id,
+        trainer_id=trainer.id,
+    )
+    db.add(new_class)
+    try:
+        db.flush()
+    except IntegrityError as e:
+        if overlap_violation(e) != "class_room":
+            raise
+        raise Conflict(CONFLICT_MESSAGES["class_room"])
+    return new_class
+
+
+def parse_amount(amount):
+    try:
+        amount = Decimal(str(amount)).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ServiceError("Amount must be a number.")
+    if amount < 0:
+        raise ServiceError("Amount can't be negative.")
+    return amount
+
+
+def create_invoice(db, member_id, amount, description=None):
+    amount = parse_amount(amount)
+    member = reference_cache.member(db, member_id)
+
+    invoice = Invoice(
+        member_id=member.id,
+        created_at=datetime.now(),
+        amount=amount,
+        status="unpaid",
+        description=description or None,
+    )
+    db.add(invoice)
+    db.flush()
+    return invoice
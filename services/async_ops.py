@@ -0,0 +1,193 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from config import (
+    ASYNC_DATABASE_URL, DB_ECHO, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE, DB_STATEMENT_TIMEOUT_MS, OVERLAP_MODE,
+)
+from models.entities import PTSession, HealthMetric, Invoice
+from services import reference_cache
+from services.admin import parse_amount
+from services.availability import pt_availability, CONFLICT_MESSAGES, overlap_violation
+from services.base import ServiceError, NotFound, Conflict, after_commit
+from services.trainers import (
+    LOOKUP_PAGE_SIZE, member_lookup_sql, lookup_params,
+    SCHEDULE_PAGE_SIZE, trainer_schedule_sql, schedule_params, next_key,
+)
+
+# Async versions of the busiest operations, on SQLAlchemy's asyncio extension + asyncpg.
+# They behave like the ones in members.py / trainers.py / admin.py (same checks, same
+# messages, flush but never commit), but a slow query only parks its own coroutine, so one
+# process can serve hundreds of clients and is limited by the pool size, not by threads.
+#
+#   async with async_session_scope() as db:
+#       session = await async_ops.book_pt_session(db, member_id, trainer_id, room_id, start, end)
+#
+# Not imported by services/__init__.py so the sync app doesn't need asyncpg installed.
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=DB_ECHO,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}},
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+@asynccontextmanager
+async def async_session_scope():
+    # same as config.session_scope: commit if it worked, roll back if it didn't
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+
+async def in_own_session(query):
+    async with AsyncSessionLocal() as db:
+        return await query(db)
+
+
+async def concurrently(*queries):
+    # A session can only run one statement at a time, so independent read-only lookups
+    # each get their own session (and pooled connection) and are awaited together.
+    # Call it before the caller's session has a connection checked out: a coroutine that
+    # holds one connection while waiting for more can starve the pool under load.
+    return await asyncio.gather(*(in_own_session(query) for query in queries))
+
+
+def cached(lookup, object_id):
+    # a reference_cache lookup (sync code) on its own session; a cache hit never checks out
+    # a connection. None instead of NotFound, so check_found reports them in order
+    def fetch(sync_db):
+        try:
+            return lookup(sync_db, object_id)
+        except NotFound:
+            return None
+    return lambda db: db.run_sync(fetch)
+
+
+def check_found(*pairs):
+    # pairs of (object, message), raises for the first one that wasn't found
+    for obj, message in pairs:
+        if obj is None:
+            raise NotFound(message)
+
+
+#MEMBER OPERATIONS
+
+
+async def book_pt_session(db, member_id, trainer_id, room_id, start_time, end_time):
+    if end_time <= start_time:
+        raise ServiceError("End time must be after start time.")
+
+    member, trainer, room = await concurrently(
+        cached(reference_cache.member, member_id),
+        cached(reference_cache.trainer, trainer_id),
+        cached(reference_cache.room, room_id),
+    )
+    check_found(
+        (member, "Member not found."), (trainer, "Trainer not found."), (room, "Room not found."),
+    )
+
+    # the availability index is plain sync code, run_sync lets it use this session's connection
+    conflict = await db.run_sync(
+        lambda sync_db: pt_availability.find_conflict(
+            sync_db, member.id, trainer.id, room.id, start_time, end_time,
+            confirm=OVERLAP_MODE != "constraints",
+        )
+    )
+    if conflict:
+        raise Conflict(CONFLICT_MESSAGES[conflict])
+
+    session = PTSession(
+        member_id=member.id,
+        trainer_id=trainer.id,
+        room_id=room.id,
+        start_time=start_time,
+        end_time=end_time,
+        status="scheduled",
+    )
+    db.add(session)
+    try:
+        await db.flush()
+    except IntegrityError as e:
+        conflict = overlap_violation(e)
+        if not conflict:
+            raise
+        pt_availability.invalidate(conflict, getattr(session, f"{conflict}_id"))
+        raise Conflict(CONFLICT_MESSAGES[conflict])
+
+    after_commit(db, lambda: pt_availability.add(session))
+    return session
+
+
+async def add_health_metric(db, member_id, recorded_at=None, weight=None, heart_rate=None, body_fat_percentage=None):
+    member = await db.run_sync(reference_cache.member, member_id)
+
+    metric = HealthMetric(
+        member_id=member.id,
+        recorded_at=recorded_at or datetime.now(),
+        weight=weight,
+        heart_rate=heart_rate,
+        body_fat_percentage=body_fat_percentage,
+    )
+    db.add(metric)
+    await db.flush()
+    return metric
+
+
+#TRAINER OPERATIONS
+
+
+async def trainer_schedule(db, trainer_id, window_start, window_end, after=None, limit=SCHEDULE_PAGE_SIZE):
+    # the trainer and the schedule page only depend on the id, so both go out at once
+    # (read only, so the caller's session isn't needed)
+    async def schedule(session):
+        result = await session.execute(
+            trainer_schedule_sql, schedule_params(trainer_id, window_start, window_end, after, limit)
+        )
+        return result.all()
+
+    trainer, rows = await concurrently(cached(reference_cache.trainer, trainer_id), schedule)
+    check_found((trainer, "Trainer not found."))
+    return trainer, rows, next_key(rows, limit)
+
+
+async def search_members(db, name_part, limit=LOOKUP_PAGE_SIZE, offset=0):
+    # async generator, rows are handed out as asyncpg delivers them
+    result = await db.stream(
+        member_lookup_sql.execution_options(max_row_buffer=limit), lookup_params(name_part, limit, offset)
+    )
+    async for row in result:
+        yield row
+
+
+#ADMIN OPERATIONS
+
+
+async def create_invoice(db, member_id, amount, description=None):
+    amount = parse_amount(amount)
+    member = await db.run_sync(reference_cache.member, member_id)
+
+    invoice = Invoice(
+        member_id=member.id,
+        created_at=datetime.now(),
+        amount=amount,
+        status="unpaid",
+        description=description or None,
+    )
+    db.add(invoice)
+    await db.flush()
+    return invoice
@@ -0,0 +1,194 @@
+import bisect
+from datetime import timedelta
+
+from sqlalchemy import insert, text
+from sqlalchemy.exc import IntegrityError
+
+from models.entities import PTSession
+from services.availability import pt_availability, overlap_violation
+from services.base import ServiceError, Conflict, after_commit
+from services.scheduling import (
+    OPEN_HOUR, CLOSE_HOUR, SLOT_STEP,
+    load_busy, earliest_slots, opening_windows, free_intervals, merge_intervals, intersect, to_datetime,
+)
+
+# Batch scheduling for program launches: a few hundred PT requests arrive at once, each with
+# a member, a trainer specialty, a window the session has to fit in, a length and how many
+# people come along. The engine picks a trainer, a room and a time for as many as it can.
+#
+# Greedy placement, most constrained request first (fewest trainer/time options, then the
+# earliest deadline), each one at the earliest time where the member, a matching trainer and
+# a room are free. Among trainers the least loaded one goes first, among rooms the smallest
+# one that still fits, so the flexible requests leave the scarce trainers/rooms for others.
+# Busy times are loaded in one query and updated in memory as sessions are placed; all new
+# sessions go in with one bulk INSERT in the caller's transaction.
+#
+# A request is a dict: member_id, specialty (None for any), earliest, latest (datetimes),
+# duration (timedelta) and participants (defaults to 1).
+
+members_sql = text("SELECT id FROM members WHERE id = ANY(:ids)")
+trainers_sql = text("SELECT id, full_name, specialty FROM trainers ORDER BY id")
+rooms_sql = text("SELECT id, name, capacity FROM rooms ORDER BY capacity, id")
+
+
+def request_problem(request):
+    # problems that don't need the database
+    if request["duration"] <= timedelta(0):
+        return "Duration must be positive."
+    if request["latest"] - request["earliest"] < request["duration"]:
+        return "Window is shorter than the session."
+    if request.get("participants", 1) < 1:
+        return "Participants must be at least 1."
+    return None
+
+
+def matches_specialty(trainer, specialty):
+    return not specialty or (trainer.specialty or "").lower().find(specialty.lower()) >= 0
+
+
+def add_busy(busy, key, start, end):
+    starts, ends = busy.setdefault(key, ([], []))
+    pos = bisect.bisect_right(starts, start)
+    starts.insert(pos, start)
+    ends.insert(pos, end)
+
+
+def free_time(busy, windows, key, length):
+    starts, ends = busy.get(key, ((), ()))
+    return free_intervals(windows, merge_intervals(starts, ends), length)
+
+
+def why_unplaced(busy, windows, request, trainers, rooms, length):
+    # narrows down which resource ran out, for the report
+    if not windows:
+        return "No opening hours inside the window."
+    member_free = list(free_time(busy, windows, ("member", request["member_id"]), length))
+    if not member_free:
+        return "Member is busy for the whole window."
+    for trainer in trainers:
+        if next(intersect(iter(member_free), free_time(busy, windows, ("trainer", trainer.id), length), length), None):
+            break
+    else:
+        return "No matching trainer is free when the member is."
+    return f"No room for {request.get('participants', 1)} is free when the member and a trainer are."
+
+
+def schedule_requests(
+    db, requests, open_hour=OPEN_HOUR, close_hour=CLOSE_HOUR, step=SLOT_STEP, dry_run=False,
+):
+    # returns (placed, unplaced); placed are dicts with the request index and the chosen
+    # trainer/room/time (plus the new session id unless dry_run), unplaced are
+    # (request index, reason)
+    if not 0 <= open_hour < close_hour <= 24:
+        raise ServiceError("Opening hours must be between 0 and 24, opening before closing.")
+    placed = []
+    unplaced = []
+    pending = []
+    for index, request in enumerate(requests):
+        problem = request_problem(request)
+        if problem:
+            unplaced.append((index, problem))
+        else:
+            pending.append(index)
+    if not pending:
+        return placed, unplaced
+
+    known_members = set(db.execute(members_sql, {"ids": list({requests[i]["member_id"] for i in pending})}).scalars())
+    all_trainers = db.execute(trainers_sql).all()
+    all_rooms = db.execute(rooms_sql).all()
+
+    # candidates for every request, and how much room to manoeuvre it has
+    options = {}
+    for index in list(pending):
+        request = requests[index]
+        trainers = [t for t in all_trainers if matches_specialty(t, request.get("specialty"))]
+        rooms = [r for r in all_rooms if r.capacity >= request.get("participants", 1)]
+        if request["member_id"] not in known_members:
+            reason = "Member not found."
+        elif not trainers:
+            reason = f"No trainer with specialty {request.get('specialty')}."
+        elif not rooms:
+            reason = f"No room holds {request.get('participants', 1)} people."
+        else:
+            reason = None
+        if reason:
+            unplaced.append((index, reason))
+            pending.remove(index)
+            continue
+        slack = (request["latest"] - request["earliest"] - request["duration"]) / step + 1
+        options[index] = (trainers, rooms, len(trainers) * slack)
+
+    if pending:
+        range_start = min(requests[i]["earliest"] for i in pending)
+        range_end = max(requests[i]["latest"] for i in pending)
+        trainer_ids = sorted({t.id for i in pending for t in options[i][0]})
+        busy = load_busy(
+            db, range_start, range_end,
+            None if len(trainer_ids) == len(all_trainers) else trainer_ids,
+            None,
+            list({requests[i]["member_id"] for i in pending}),
+        )
+    pending.sort(key=lambda i: (options[i][2], requests[i]["latest"], requests[i]["earliest"]))
+
+    load = {t.id: 0 for t in all_trainers}
+    step_seconds = int(step.total_seconds())
+    for index in pending:
+        request = requests[index]
+        trainers, rooms, _ = options[index]
+        trainers = sorted(trainers, key=lambda t: (load[t.id], t.id))
+        windows = opening_windows(request["earliest"], request["latest"], open_hour, close_hour)
+        length = int(request["duration"].total_seconds())
+        slot = earliest_slots(busy, windows, request["member_id"], trainers, rooms, length, step_seconds, 1)
+        if not slot:
+            unplaced.append((index, why_unplaced(busy, windows, request, trainers, rooms, length)))
+            continue
+
+        start, trainer, room = slot[0]
+        end = start + length
+        for key in (("trainer", trainer.id), ("room", room.id), ("member", request["member_id"])):
+            add_busy(busy, key, start, end)
+        load[trainer.id] += 1
+        placed.append({
+            "request": index,
+            "member_id": request["member_id"],
+            "trainer_id": trainer.id,
+            "trainer_name": trainer.full_name,
+            "room_id": room.id,
+            "room_name": room.name,
+            "start_time": to_datetime(start),
+            "end_time": to_datetime(end),
+        })
+
+    placed.sort(key=lambda p: p["request"])
+    unplaced.sort()
+    if dry_run or not placed:
+        return placed, unplaced
+
+    rows = [
+        {
+            "member_id": p["member_id"],
+            "trainer_id": p["trainer_id"],
+            "room_id": p["room_id"],
+            "start_time": p["start_time"],
+            "end_time": p["end_time"],
+            "status": "scheduled",
+        }
+        for p in placed
+    ]
+    try:
+        ids = db.scalars(insert(PTSession).returning(PTSession.id, sort_by_parameter_order=True), rows).all()
+    except IntegrityError as e:
+        if not overlap_violation(e):
+            raise
+        raise Conflict("Someone else booked one of these slots while the batch was running, run it again.")
+    for p, session_id in zip(placed, ids):
+        p["session_id"] = session_id
+
+    def forget_schedules():
+        # the availability index reloads these on their next booking
+        for p in placed:
+            for resource in ("trainer", "room", "member"):
+                pt_availability.invalidate(resource, p[f"{resource}_id"])
+
+    after_commit(db, forget_schedules)
+    return placed, unplaced
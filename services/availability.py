@@ -0,0 +1,239 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, or_
+
+from config import AVAILABILITY_INDEX_SIZE, AVAILABILITY_INDEX_TTL, AVAILABILITY_INDEX_FRESH
+from models.entities import PTSession
+
+# In-memory availability index for PT bookings.
+# For the trainers, rooms and members recently booked in this process we keep their
+# upcoming non-cancelled PT sessions sorted by start time (sessions drop out once they're
+# over, and the least recently used resources once there are AVAILABILITY_INDEX_SIZE).
+# book_pt_session asks this first. A "busy" answer is final, a "free" one only when the
+# schedules were loaded in the last AVAILABILITY_INDEX_FRESH seconds, otherwise the
+# database is asked (see find_conflict). Schedules are reloaded every AVAILABILITY_INDEX_TTL.
+
+CONFLICT_MESSAGES = {
+    "trainer": "Trainer already has a session at that time.",
+    "room": "Room is already booked at that time.",
+    "member": "Member already has a PT session during this time.",
+    "class_room": "Room already has a class at that time.",
+}
+
+# exclusion constraint name (see app/create_constraints.py) -> which resource it protects
+OVERLAP_CONSTRAINTS = {
+    "pt_sessions_member_no_overlap": "member",
+    "pt_sessions_trainer_no_overlap": "trainer",
+    "pt_sessions_room_no_overlap": "room",
+    "class_sessions_room_no_overlap": "class_room",
+}
+
+# order the checks happen in (same order the old queries ran in)
+RESOURCES = ("trainer", "room", "member")
+
+RESOURCE_COLUMNS = {
+    "trainer": PTSession.trainer_id,
+    "room": PTSession.room_id,
+    "member": PTSession.member_id,
+}
+
+
+def overlap_violation(error):
+    # returns the resource name if the error came from one of our exclusion constraints.
+    # psycopg2 has the constraint on orig.diag; asyncpg (async_ops) on the asyncpg exception
+    # that SQLAlchemy's adapted orig was raised from
+    orig = getattr(error, "orig", None)
+    for source in (getattr(orig, "diag", None), getattr(orig, "__cause__", None)):
+        resource = OVERLAP_CONSTRAINTS.get(getattr(source, "constraint_name", None))
+        if resource:
+            return resource
+    return None
+
+
+class ResourceSchedule:
+    __slots__ = ("starts", "intervals", "max_length", "loaded_at")
+
+    def __init__(self, loaded_at=None):
+        self.starts = []
+        self.intervals = []  # (start, end, session_id), same order as starts
+        # longest session we've seen, so a lookup knows how far back it has to look
+        self.max_length = timedelta(0)
+        # time.monotonic() when the query it was loaded from started
+        self.loaded_at = time.monotonic() if loaded_at is None else loaded_at
+
+    def add(self, start_time, end_time, session_id):
+        pos = bisect.bisect_right(self.starts, start_time)
+        self.starts.insert(pos, start_time)
+        self.intervals.insert(pos, (start_time, end_time, session_id))
+        if end_time - start_time > self.max_length:
+            self.max_length = end_time - start_time
+
+    def remove(self, session_id):
+        for i, interval in enumerate(self.intervals):
+            if interval[2] == session_id:
+                del self.starts[i]
+                del self.intervals[i]
+                return True
+        return False
+
+    def prune(self, before):
+        # drop sessions that were over by `before`, earliest start first. A long session can
+        # keep a few shorter ones behind it that have ended too, they're gone next time.
+        ended = 0
+        while ended < len(self.intervals) and self.intervals[ended][1] <= before:
+            ended += 1
+        if ended:
+            del self.starts[:ended]
+            del self.intervals[:ended]
+
+    def find_overlap(self, start_time, end_time):
+        # everything from pos onwards starts at or after end_time, so it can't overlap.
+        # Walking backwards we can stop once a session starts so early that even the
+        # longest one we know about would already be over.
+        pos = bisect.bisect_left(self.starts, end_time)
+        earliest = start_time - self.max_length
+        i = pos - 1
+        while i >= 0 and self.starts[i] > earliest:
+            if self.intervals[i][1] > start_time:
+                return self.intervals[i][2]
+            i -= 1
+        return None
+
+
+class PTAvailabilityIndex:
+    def __init__(self, max_size=AVAILABILITY_INDEX_SIZE, ttl=AVAILABILITY_INDEX_TTL, fresh=AVAILABILITY_INDEX_FRESH):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fresh = fresh
+        self._schedules = OrderedDict()  # (resource, id) -> ResourceSchedule, least recently used first
+        self._lock = threading.Lock()
+
+    def _load(self, db, missing, now):
+        # one query for every resource we haven't seen yet, sessions that are already over
+        # can't clash with a new booking
+        columns = [RESOURCE_COLUMNS[resource] == resource_id for resource, resource_id in missing]
+        started = time.monotonic()
+        rows = (
+            db.query(
+                PTSession.id,
+                PTSession.trainer_id,
+                PTSession.room_id,
+                PTSession.member_id,
+                PTSession.start_time,
+                PTSession.end_time,
+            )
+            .filter(PTSession.status != "cancelled", PTSession.end_time > now, or_(*columns))
+            .all()
+        )
+
+        loaded = {key: ResourceSchedule(started) for key in missing}
+        for session_id, trainer_id, room_id, member_id, start_time, end_time in rows:
+            for key in (("trainer", trainer_id), ("room", room_id), ("member", member_id)):
+                schedule = loaded.get(key)
+                if schedule is not None:
+                    schedule.add(start_time, end_time, session_id)
+
+        with self._lock:
+            for key, schedule in loaded.items():
+                # another thread may have loaded a newer one while we were querying
+                current = self._schedules.get(key)
+                if current is None or current.loaded_at < started:
+                    self._schedules[key] = schedule
+                self._schedules.move_to_end(key)
+            while len(self._schedules) > self.max_size:
+                self._schedules.popitem(last=False)
+
+    def _conflict_in_db(self, db, keys, start_time, end_time):
+        # single "any conflict?" query that also tells us which resource it was
+        which = case(
+            *[(RESOURCE_COLUMNS[resource] == keys[resource], resource) for resource in RESOURCES[:-1]],
+            else_=RESOURCES[-1],
+        )
+        return (
+            db.query(which)
+            .filter(
+                PTSession.status != "cancelled",
+                PTSession.start_time < end_time,
+                PTSession.end_time > start_time,
+                or_(*[RESOURCE_COLUMNS[resource] == keys[resource] for resource in RESOURCES]),
+            )
+            .limit(1)
+            .scalar()
+        )
+
+    def find_conflict(self, db, member_id, trainer_id, room_id, start_time, end_time, confirm=True):
+        keys = {"trainer": trainer_id, "room": room_id, "member": member_id}
+
+        now = datetime.now()
+        clock = time.monotonic()
+
+        with self._lock:
+            missing = [
+                (r, keys[r]) for r in RESOURCES
+                if (r, keys[r]) not in self._schedules or self._schedules[(r, keys[r])].loaded_at < clock - self.ttl
+            ]
+        if missing:
+            self._load(db, missing, now)
+
+        hit = None
+        fresh = True
+        with self._lock:
+            for resource in RESOURCES:
+                schedule = self._schedules.get((resource, keys[resource]))
+                if schedule is None:
+                    # evicted by other threads' loads in the meantime
+                    fresh = False
+                    continue
+                self._schedules.move_to_end((resource, keys[resource]))
+                schedule.prune(now)
+                if schedule.loaded_at < clock - self.fresh:
+                    fresh = False
+                if hit is None and schedule.find_overlap(start_time, end_time) is not None:
+                    hit = resource
+
+        # The index knows about changes made through this process plus whatever was there
+        # when it loaded. A cancellation made elsewhere (another API worker, direct SQL) can
+        # only make a "busy" answer wrong in the safe direction, for at most the TTL, so it
+        # stands. A "free" answer can miss a booking made elsewhere since the load, so unless
+        # the load was just now (typically by this very call) the database has the last word.
+        # With the exclusion constraints in place the insert itself checks a free answer.
+        if hit is not None:
+            return hit
+        if fresh or not confirm:
+            return None
+
+        resource = self._conflict_in_db(db, keys, start_time, end_time)
+        if resource is not None:
+            # booked elsewhere since we loaded it, reload next time
+            self.invalidate(resource, keys[resource])
+        return resource
+
+    def add(self, session):
+        with self._lock:
+            for resource in RESOURCES:
+                schedule = self._schedules.get((resource, getattr(session, f"{resource}_id")))
+                if schedule is not None:
+                    schedule.add(session.start_time, session.end_time, session.id)
+
+    def remove(self, session):
+        with self._lock:
+            for resource in RESOURCES:
+                schedule = self._schedules.get((resource, getattr(session, f"{resource}_id")))
+                if schedule is not None:
+                    schedule.remove(session.id)
+
+    def invalidate(self, resource, resource_id):
+        with self._lock:
+            self._schedules.pop((resource, resource_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._schedules.clear()
+
+
+# shared by everything in this process
+pt_availability = PTAvailabilityIndex()
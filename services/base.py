@@ -0,0 +1,86 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Shared bits for the service modules.
+# Service functions take an open session as their first argument, check their inputs,
+# do the work and flush, but never commit: the caller decides where the transaction ends
+# (config.session_scope for one operation, a savepoint per record in batch mode, ...).
+
+
+class ServiceError(Exception):
+    # the operation was refused, the message is meant to be shown to the user as-is
+    pass
+
+
+class NotFound(ServiceError):
+    pass
+
+
+class Conflict(ServiceError):
+    # clashes with existing data (double booking, duplicate email, ...)
+    pass
+
+
+def get_or_fail(db, model, object_id, message):
+    obj = db.get(model, object_id)
+    if obj is None:
+        raise NotFound(message)
+    return obj
+
+
+def contains_pattern(value):
+    # LIKE/ILIKE pattern for "contains value"; % and _ typed by a user are matched literally
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def after_commit(db, callback):
+    # runs callback once the session's outermost transaction actually commits, used for
+    # in-memory state like the availability index that must match the database. Queued
+    # inside a savepoint it's dropped if that savepoint rolls back, and otherwise still
+    # waits for the real COMMIT (releasing a savepoint doesn't make anything permanent).
+    db.info.setdefault("after_commit", []).append([db.get_nested_transaction(), callback])
+
+
+def _enclosing_savepoint(transaction):
+    parent = transaction.parent
+    while parent is not None and not parent.nested:
+        parent = parent.parent
+    return parent
+
+
+def _queued_inside(owner, savepoint):
+    while owner is not None:
+        if owner is savepoint:
+            return True
+        owner = owner.parent
+    return False
+
+
+# registered on Session itself so the async sessions (services/async_ops.py) get it too.
+# SQLAlchemy fires both events for savepoints as well; while they run the savepoint is
+# still the session's nested transaction.
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session):
+    savepoint = session.get_nested_transaction()
+    if savepoint is not None:
+        # savepoint released: its callbacks now belong to the transaction around it
+        outer = _enclosing_savepoint(savepoint)
+        for entry in session.info.get("after_commit", []):
+            if entry[0] is savepoint:
+                entry[0] = outer
+        return
+    for _, callback in session.info.pop("after_commit", []):
+        callback()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_commit(session):
+    savepoint = session.get_nested_transaction()
+    if savepoint is None:
+        session.info.pop("after_commit", None)
+        return
+    # only what was queued in this savepoint (or ones inside it) is gone
+    queued = session.info.get("after_commit")
+    if queued:
+        queued[:] = [entry for entry in queued if not _queued_inside(entry[0], savepoint)]
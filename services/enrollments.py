@@ -0,0 +1,169 @@
+from datetime import datetime
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
+
+from models.entities import ClassSession, ClassEnrollment
+from services import reference_cache
+from services.base import ServiceError, NotFound, Conflict, get_or_fail
+
+# Class enrollment with a capacity limit and a waitlist.
+#
+# The seat count lives on the class row (class_sessions.enrolled_count). Taking a seat is
+# one conditional UPDATE ... WHERE enrolled_count < capacity, so the check and the increment
+# can't be split by another client: concurrent enrollments into the same class queue on that
+# one row lock (never a table lock, other classes aren't affected), and the enrollment row is
+# inserted in the same statement so the lock is only held for that statement and the commit.
+# The CHECK on enrolled_count (app/create_enrollments.py) backs it up.
+#
+# A full class puts the member on the waitlist. That path locks the class row as well, and so
+# does cancelling, so a cancellation either sees the new waitlist entry and promotes it, or has
+# already given the seat back and the enrollment takes it. The promoted member is picked with
+# FOR UPDATE SKIP LOCKED so we don't wait on someone who is leaving the waitlist right now.
+
+UNIQUE_ACTIVE = "uq_class_enrollments_member_active"
+
+take_seat_sql = text("""
+WITH seat AS (
+    UPDATE class_sessions
+    SET enrolled_count = enrolled_count + 1
+    WHERE id = :class_id AND enrolled_count < capacity
+    RETURNING id
+)
+INSERT INTO class_enrollments (class_id, member_id, status, requested_at)
+SELECT id, :member_id, 'enrolled', :now FROM seat
+RETURNING *
+""")
+
+# full class: lock it and join the waitlist in one go, unless a seat was given back meanwhile
+join_waitlist_sql = text("""
+WITH full_class AS (
+    SELECT id, enrolled_count >= capacity AS is_full
+    FROM class_sessions
+    WHERE id = :class_id
+    FOR UPDATE
+)
+INSERT INTO class_enrollments (class_id, member_id, status, requested_at)
+SELECT id, :member_id, 'waitlisted', :now FROM full_class WHERE is_full
+RETURNING *
+""")
+
+lock_class_sql = text("SELECT 1 FROM class_sessions WHERE id = :class_id FOR UPDATE")
+
+promote_sql = text("""
+WITH next AS (
+    SELECT id FROM class_enrollments
+    WHERE class_id = :class_id AND status = 'waitlisted'
+    ORDER BY requested_at, id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE class_enrollments e
+SET status = 'enrolled', updated_at = :now
+FROM next
+WHERE e.id = next.id
+RETURNING e.*
+""")
+
+give_back_seat_sql = text("UPDATE class_sessions SET enrolled_count = enrolled_count - 1 WHERE id = :class_id")
+
+waitlist_position_sql = text("""
+SELECT count(*) + 1
+FROM class_enrollments
+WHERE class_id = :class_id AND status = 'waitlisted' AND (requested_at, id) < (:requested_at, :id)
+""")
+
+roster_sql = text("""
+SELECT e.id, e.member_id, m.full_name, e.status, e.requested_at
+FROM class_enrollments e
+JOIN members m ON m.id = e.member_id
+WHERE e.class_id = :class_id AND e.status <> 'cancelled'
+ORDER BY e.status, e.requested_at, e.id
+""")
+
+
+def enrollment_from(db, sql, params):
+    # maps the RETURNING row of a text statement onto a ClassEnrollment
+    return db.scalars(select(ClassEnrollment).from_statement(sql), params).first()
+
+
+def enroll(db, class_id, member_id):
+    # returns the new enrollment, status "enrolled" or "waitlisted"
+    member = reference_cache.member(db, member_id)
+    class_session = get_or_fail(db, ClassSession, class_id, "Class not found.")
+    now = datetime.now()
+    if class_session.start_time <= now:
+        raise ServiceError("That class has already started.")
+
+    existing = (
+        db.query(ClassEnrollment.status)
+        .filter(
+            ClassEnrollment.class_id == class_session.id,
+            ClassEnrollment.member_id == member.id,
+            ClassEnrollment.status != "cancelled",
+        )
+        .scalar()
+    )
+    if existing == "enrolled":
+        raise Conflict("Member is already enrolled in this class.")
+    if existing == "waitlisted":
+        raise Conflict("Member is already on the waitlist for this class.")
+
+    params = {"class_id": class_session.id, "member_id": member.id, "now": now}
+    try:
+        enrollment = enrollment_from(db, take_seat_sql, params)
+        if enrollment is None:
+            enrollment = enrollment_from(db, join_waitlist_sql, params)
+        if enrollment is None:
+            # a seat was given back between the two statements, and we hold the class lock now
+            enrollment = enrollment_from(db, take_seat_sql, params)
+    except IntegrityError as e:
+        if getattr(getattr(e.orig, "diag", None), "constraint_name", None) != UNIQUE_ACTIVE:
+            raise
+        raise Conflict("Member is already enrolled in this class.")
+
+    # the counter was changed behind the ORM's back
+    db.expire(class_session, ["enrolled_count"])
+    return enrollment
+
+
+def waitlist_position(db, enrollment):
+    if enrollment.status != "waitlisted":
+        return None
+    return db.execute(
+        waitlist_position_sql,
+        {"class_id": enrollment.class_id, "requested_at": enrollment.requested_at, "id": enrollment.id},
+    ).scalar()
+
+
+def cancel_enrollment(db, enrollment_id):
+    # returns (cancelled enrollment, enrollment promoted off the waitlist or None)
+    enrollment = db.get(ClassEnrollment, enrollment_id, with_for_update=True)
+    if enrollment is None:
+        raise NotFound("Enrollment not found.")
+    if enrollment.status == "cancelled":
+        raise Conflict("That enrollment is already cancelled.")
+    class_session = get_or_fail(db, ClassSession, enrollment.class_id, "Class not found.")
+    now = datetime.now()
+    if class_session.start_time <= now:
+        raise ServiceError("That class has already started.")
+
+    promoted = None
+    if enrollment.status == "enrolled":
+        params = {"class_id": enrollment.class_id, "now": now}
+        db.execute(lock_class_sql, params)
+        promoted = enrollment_from(db, promote_sql, params)
+        if promoted is None:
+            db.execute(give_back_seat_sql, params)
+            db.expire(class_session, ["enrolled_count"])
+
+    enrollment.status = "cancelled"
+    enrollment.updated_at = now
+    db.flush()
+    return enrollment, promoted
+
+
+def class_roster(db, class_id):
+    # (class, rows of enrolled members then the waitlist in order)
+    class_session = get_or_fail(db, ClassSession, class_id, "Class not found.")
+    return class_session, db.execute(roster_sql, {"class_id": class_session.id}).all()
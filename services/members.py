@@ -0,0 +1,121 @@
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from config import OVERLAP_MODE
+from models.entities import Member, PTSession, HealthMetric
+from services import reference_cache
+from services.availability import pt_availability, CONFLICT_MESSAGES, overlap_violation
+from services.base import ServiceError, NotFound, Conflict, get_or_fail, after_commit
+
+
+def register_member(db, full_name, email, date_of_birth=None, gender=None, phone=None):
+    # emails are stored lower-case (see app/create_member_email_check.py), so the unique
+    # constraint catches Ann@Example.com when ann@example.com is already a member
+    email = (email or "").strip().lower()
+    if not full_name or not email:
+        raise ServiceError("Full name and email are required.")
+
+    member = Member(
+        full_name=full_name,
+        email=email,
+        date_of_birth=date_of_birth,
+        gender=gender or None,
+        phone=phone or None,
+    )
+    db.add(member)
+    try:
+        db.flush()
+    except IntegrityError:
+        raise Conflict("A member with that email already exists.")
+    return member
+
+
+def get_member(db, member_id):
+    return get_or_fail(db, Member, member_id, "Member not found.")
+
+
+def update_member_goal(db, member_id, fitness_goal=None, target_weight=None):
+    values = {}
+    if fitness_goal:
+        values["fitness_goal"] = fitness_goal
+    if target_weight is not None:
+        values["target_weight"] = target_weight
+    if not values:
+        return get_or_fail(db, Member, member_id, "Member not found.")
+
+    # one UPDATE ... RETURNING instead of loading the member first; no row means no member
+    member = db.scalars(
+        update(Member).where(Member.id == member_id).values(**values).returning(Member),
+        execution_options={"synchronize_session": False},
+    ).first()
+    if member is None:
+        raise NotFound("Member not found.")
+    return member
+
+
+def add_health_metric(db, member_id, recorded_at=None, weight=None, heart_rate=None, body_fat_percentage=None):
+    member = reference_cache.member(db, member_id)
+
+    metric = HealthMetric(
+        member_id=member.id,
+        recorded_at=recorded_at or datetime.now(),
+        weight=weight,
+        heart_rate=heart_rate,
+        body_fat_percentage=body_fat_percentage,
+    )
+    db.add(metric)
+    db.flush()
+    return metric
+
+
+def book_pt_session(db, member_id, trainer_id, room_id, start_time, end_time):
+    if end_time <= start_time:
+        raise ServiceError("End time must be after start time.")
+
+    member = reference_cache.member(db, member_id)
+    trainer = reference_cache.trainer(db, trainer_id)
+    room = reference_cache.room(db, room_id)
+
+    # check the in-memory availability index first, it only goes to the database
+    # for resources it hasn't loaded yet plus one combined conflict query
+    conflict = pt_availability.find_conflict(
+        db, member.id, trainer.id, room.id, start_time, end_time,
+        confirm=OVERLAP_MODE != "constraints",
+    )
+    if conflict:
+        raise Conflict(CONFLICT_MESSAGES[conflict])
+
+    session = PTSession(
+        member_id=member.id,
+        trainer_id=trainer.id,
+        room_id=room.id,
+        start_time=start_time,
+        end_time=end_time,
+        status="scheduled",
+    )
+    db.add(session)
+    try:
+        db.flush()
+    except IntegrityError as e:
+        conflict = overlap_violation(e)
+        if not conflict:
+            raise
+        # the database knows about a booking our index doesn't, reload it next time
+        pt_availability.invalidate(conflict, getattr(session, f"{conflict}_id"))
+        raise Conflict(CONFLICT_MESSAGES[conflict])
+
+    after_commit(db, lambda: pt_availability.add(session))
+    return session
+
+
+def cancel_pt_session(db, session_id):
+    session = get_or_fail(db, PTSession, session_id, "PT session not found.")
+    if session.status == "cancelled":
+        raise Conflict("That session is already cancelled.")
+
+    session.status = "cancelled"
+    db.flush()
+    after_commit(db, lambda: pt_availability.remove(session))
+    return session
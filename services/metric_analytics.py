@@ -0,0 +1,209 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from config import engine
+
+# Health metric analytics on numpy arrays.
+# A member's (or a cohort's) readings are pulled in one binary COPY and mapped straight
+# into a 2D array, so years of minute-level data never turn into ORM objects or text.
+# Everything after that (time buckets, rolling means, trend line, anomaly flags) is done
+# with array operations instead of Python loops.
+
+BUCKETS = {
+    "hour": 3600,
+    "day": 86400,
+    "week": 7 * 86400,
+}
+# 1970-01-01 was a Thursday, shifting by 3 days makes weekly buckets start on Monday
+WEEK_OFFSET = 3 * 86400
+
+# columns of the array fetch_series returns
+MEMBER, TIME, WEIGHT, HEART_RATE, BODY_FAT = range(5)
+
+# Binary COPY with every column as a non-null float8, so each row has the exact same
+# layout and the whole result can be viewed as a numpy record array without parsing text.
+# Rows come back unordered and are sorted by (member_id, recorded_at) in fetch_series.
+series_sql = """
+COPY (
+    SELECT
+        member_id::float8,
+        EXTRACT(EPOCH FROM recorded_at)::float8,
+        COALESCE(weight, 'NaN'),
+        COALESCE(heart_rate::float8, 'NaN'),
+        COALESCE(body_fat_percentage, 'NaN')
+    FROM health_metrics
+    WHERE member_id IN ({ids}) {since}
+) TO STDOUT WITH (FORMAT binary)
+"""
+
+# each row: field count (int16), then for every field its length (int32) and the value
+ROW_DTYPE = np.dtype(
+    [("fields", ">i2")] + [item for i in range(5) for item in ((f"len{i}", ">i4"), (f"col{i}", ">f8"))]
+)
+# "PGCOPY\n\377\r\n\0" signature, flags and header extension length
+HEADER_SIZE = 19
+TRAILER_SIZE = 2
+
+
+def fetch_series(member_ids, since=None):
+    # rows are (member_id, epoch seconds, weight, heart_rate, body_fat), NaN where missing
+    ids = ",".join(str(int(m)) for m in member_ids)
+    if not ids:
+        return np.empty((0, 5))
+    since_sql = f"AND recorded_at >= '{since.isoformat(' ')}'" if since else ""
+
+    buffer = io.BytesIO()
+    conn = engine.raw_connection()
+    try:
+        conn.cursor().copy_expert(series_sql.format(ids=ids, since=since_sql), buffer)
+        conn.commit()
+    finally:
+        conn.close()
+
+    rows = np.frombuffer(buffer.getbuffer()[HEADER_SIZE:-TRAILER_SIZE], dtype=ROW_DTYPE)
+    series = np.empty((len(rows), 5))
+    for i in range(5):
+        series[:, i] = rows[f"col{i}"]
+    # sorting here is cheaper than asking the server to sort (and maybe spill) big series
+    return series[np.lexsort((series[:, TIME], series[:, MEMBER]))]
+
+
+def to_datetime(epoch_seconds):
+    # recorded_at is stored without a timezone, so the epoch values are really "naive UTC"
+    return datetime.fromtimestamp(float(epoch_seconds), tz=timezone.utc).replace(tzinfo=None)
+
+
+#ROLLUPS
+
+
+def rollup(series, bucket="day", per_member=True):
+    # mean/min/max for each time bucket (per member, or across the whole cohort)
+    if len(series) == 0:
+        return {}
+    size = BUCKETS[bucket]
+    offset = WEEK_OFFSET if bucket == "week" else 0
+    buckets = np.floor_divide(series[:, TIME] + offset, size).astype(np.int64)
+
+    if per_member:
+        members = series[:, MEMBER].astype(np.int64)
+        order = np.lexsort((buckets, members))
+    else:
+        members = np.zeros(len(series), dtype=np.int64)
+        order = np.argsort(buckets, kind="stable")
+    members, buckets, values = members[order], buckets[order], series[order]
+
+    change = (np.diff(members) != 0) | (np.diff(buckets) != 0)
+    starts = np.concatenate(([0], np.flatnonzero(change) + 1))
+
+    result = {
+        "member_id": members[starts],
+        "bucket_start": buckets[starts] * size - offset,
+        "readings": np.diff(np.append(starts, len(values))),
+    }
+    for name, column in (("weight", WEIGHT), ("heart_rate", HEART_RATE), ("body_fat", BODY_FAT)):
+        column_values = values[:, column]
+        present = ~np.isnan(column_values)
+        count = np.add.reduceat(present, starts)
+        total = np.add.reduceat(np.where(present, column_values, 0.0), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[f"{name}_mean"] = np.where(count > 0, total / count, np.nan)
+        result[f"{name}_min"] = np.fmin.reduceat(column_values, starts)
+        result[f"{name}_max"] = np.fmax.reduceat(column_values, starts)
+    return result
+
+
+def rolling_mean(times, values, window_seconds):
+    # time based window: each point averages everything in the window_seconds before it
+    present = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(present)))
+    left = np.searchsorted(times, times - window_seconds, side="right")
+    right = np.arange(1, len(times) + 1)
+    n = counts[right] - counts[left]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n > 0, (sums[right] - sums[left]) / n, np.nan)
+
+
+def rolling_std(times, values, window_seconds):
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    sums = np.concatenate(([0.0], np.cumsum(filled)))
+    squares = np.concatenate(([0.0], np.cumsum(filled * filled)))
+    counts = np.concatenate(([0], np.cumsum(present)))
+    left = np.searchsorted(times, times - window_seconds, side="right")
+    right = np.arange(1, len(times) + 1)
+    n = counts[right] - counts[left]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (sums[right] - sums[left]) / n
+        variance = (squares[right] - squares[left]) / n - mean * mean
+        return np.where(n > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+
+
+#TRENDS
+
+
+def weight_trend(times, weights, target_weight=None, lookback_days=90):
+    # least squares line through the last lookback_days of weight readings
+    present = ~np.isnan(weights)
+    if not present.any():
+        return None
+    t, w = times[present], weights[present]
+    recent = t >= t[-1] - lookback_days * 86400
+    t, w = t[recent], w[recent]
+    if len(t) < 2 or t[-1] == t[0]:
+        return None
+
+    days = (t - t[-1]) / 86400.0
+    slope, intercept = np.polyfit(days, w, 1)
+    trend = {
+        "slope_kg_per_week": slope * 7,
+        "current_weight": intercept,  # the fitted value at the latest reading
+        "readings": len(t),
+        "target_weight": target_weight,
+        "projected_goal_date": None,
+    }
+    if target_weight is not None and slope != 0:
+        days_to_goal = (target_weight - intercept) / slope
+        # only meaningful if the trend is actually heading towards the target
+        if 0 <= days_to_goal < 3650:
+            trend["projected_goal_date"] = (to_datetime(t[-1]) + timedelta(days=float(days_to_goal))).date()
+    return trend
+
+
+def heart_rate_anomalies(times, heart_rates, window_seconds=7 * 86400, z_threshold=3.0, low=35, high=200):
+    # flags readings far from the member's own recent normal, plus physiologically odd values
+    mean = rolling_mean(times, heart_rates, window_seconds)
+    std = rolling_std(times, heart_rates, window_seconds)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.where(std > 0, (heart_rates - mean) / std, 0.0)
+    present = ~np.isnan(heart_rates)
+    return present & ((np.abs(z) > z_threshold) | (heart_rates < low) | (heart_rates > high))
+
+
+def member_trend(member_id, target_weight=None, days=180, bucket="week"):
+    since = datetime.now() - timedelta(days=days) if days else None
+    series = fetch_series([member_id], since)
+    if len(series) == 0:
+        return None
+
+    times = series[:, TIME]
+    flags = heart_rate_anomalies(times, series[:, HEART_RATE])
+    return {
+        "readings": len(series),
+        "first": to_datetime(times[0]),
+        "last": to_datetime(times[-1]),
+        "rollup": rollup(series, bucket),
+        "weight_7d_mean": rolling_mean(times, series[:, WEIGHT], 7 * 86400)[-1],
+        "trend": weight_trend(times, series[:, WEIGHT], target_weight),
+        "anomaly_count": int(flags.sum()),
+        "anomalies": [
+            (to_datetime(times[i]), series[i, HEART_RATE]) for i in np.flatnonzero(flags)[-5:]
+        ],
+    }
+
+
+def cohort_rollup(member_ids, bucket="week", days=365):
+    since = datetime.now() - timedelta(days=days) if days else None
+    return rollup(fetch_series(member_ids, since), bucket, per_member=False)
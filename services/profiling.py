@@ -0,0 +1,225 @@
+import heapq
+import json
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import config
+
+# SQL profiling per logical operation (a main.py menu function, a benchmark call, ...),
+# instead of echo=True. While enabled, engine events count every statement, its time on
+# the database and the rows it returned, and charge them to the operation running in the
+# current context (contextvars, so threads and asyncio tasks each have their own).
+# Per operation it keeps the slowest statements and flags statements of the same shape
+# (same SQL once the parameters are taken out) repeated within one call as N+1 suspects.
+# Statements slower than the threshold also go to the slow-query log, one JSON per line.
+#
+# Disabled (the default) there are no listeners on the engines at all, and profiled
+# functions cost one flag check.
+#
+#   profiling.enable(slow_ms=100)
+#   with profiling.operation("book_pt_session"):
+#       ...
+#   profiling.export_json("profile.json")
+
+SLOWEST_KEPT = 5
+
+enabled = False
+slow_ms = config.DB_SLOW_QUERY_MS
+slow_log = config.DB_SLOW_QUERY_LOG
+n_plus_one_repeats = config.DB_N_PLUS_ONE_REPEATS
+
+current = ContextVar("sql_profile", default=None)
+_lock = threading.Lock()
+_totals = {}
+
+_params = re.compile(r"%\(\w+\)s|\$\d+|\?")
+_in_list = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_spaces = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    # the statement with parameters, literals and IN lists of any length collapsed
+    shape = _params.sub("?", statement)
+    shape = _literals.sub("?", shape)
+    shape = _in_list.sub("(...)", shape)
+    return _spaces.sub(" ", shape).strip()
+
+
+class OperationProfile:
+    def __init__(self, name):
+        self.name = name
+        self.statements = 0
+        self.db_ms = 0.0
+        self.rows = 0
+        self.shapes = Counter()
+        self.slowest = []  # heap of (ms, statement)
+
+    def add(self, statement, ms, rows):
+        self.statements += 1
+        self.db_ms += ms
+        self.rows += rows
+        self.shapes[statement_shape(statement)] += 1
+        if len(self.slowest) < SLOWEST_KEPT:
+            heapq.heappush(self.slowest, (ms, statement))
+        elif ms > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (ms, statement))
+
+    def n_plus_one(self):
+        # shape -> times it ran, for shapes repeated often enough to look like a loop
+        return {shape: n for shape, n in self.shapes.items() if n >= n_plus_one_repeats}
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    # statements on one connection never overlap, so a single slot is enough
+    conn.info["profile_start"] = time.perf_counter()
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("profile_start", None)
+    if start is None:
+        return
+    ms = (time.perf_counter() - start) * 1000
+    rows = cursor.rowcount if cursor.description is not None and cursor.rowcount > 0 else 0
+    profile = current.get()
+    if profile is not None:
+        profile.add(statement, ms, rows)
+    if ms >= slow_ms and slow_log:
+        log_slow(profile.name if profile else None, statement, ms, rows)
+
+
+def log_slow(operation_name, statement, ms, rows):
+    line = json.dumps({
+        "at": datetime.now().isoformat(timespec="milliseconds"),
+        "operation": operation_name,
+        "ms": round(ms, 3),
+        "rows": rows,
+        "statement": _spaces.sub(" ", statement).strip(),
+    })
+    with _lock:
+        with open(slow_log, "a") as f:
+            f.write(line + "\n")
+
+
+def enable(slow_query_ms=None, slow_query_log=None, repeats=None):
+    # listens on Engine itself, so the app, bulk and async engines are all covered
+    global enabled, slow_ms, slow_log, n_plus_one_repeats
+    if slow_query_ms is not None:
+        slow_ms = slow_query_ms
+    if slow_query_log is not None:
+        slow_log = slow_query_log
+    if repeats is not None:
+        n_plus_one_repeats = repeats
+    if not enabled:
+        event.listen(Engine, "before_cursor_execute", _before)
+        event.listen(Engine, "after_cursor_execute", _after)
+        enabled = True
+
+
+def disable():
+    global enabled
+    if enabled:
+        event.remove(Engine, "before_cursor_execute", _before)
+        event.remove(Engine, "after_cursor_execute", _after)
+        enabled = False
+
+
+@contextmanager
+def operation(name):
+    # yields the profile of this one call (None while profiling is off); nested
+    # operations are charged to the outermost one
+    if not enabled or current.get() is not None:
+        yield current.get()
+        return
+    profile = OperationProfile(name)
+    token = current.set(profile)
+    try:
+        yield profile
+    finally:
+        current.reset(token)
+        record(profile)
+
+
+def profiled(func):
+    # decorator: every call of func is one operation named after it
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return func(*args, **kwargs)
+        with operation(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def record(profile):
+    with _lock:
+        totals = _totals.get(profile.name)
+        if totals is None:
+            totals = _totals[profile.name] = {
+                "calls": 0, "statements": 0, "db_ms": 0.0, "rows": 0, "slowest": [], "n_plus_one": {},
+            }
+        totals["calls"] += 1
+        totals["statements"] += profile.statements
+        totals["db_ms"] += profile.db_ms
+        totals["rows"] += profile.rows
+        totals["slowest"] = heapq.nlargest(SLOWEST_KEPT, totals["slowest"] + profile.slowest)
+        for shape, n in profile.n_plus_one().items():
+            suspect = totals["n_plus_one"].setdefault(shape, {"calls": 0, "max_repeats": 0})
+            suspect["calls"] += 1
+            suspect["max_repeats"] = max(suspect["max_repeats"], n)
+
+
+def summary():
+    # operation name -> totals and per-call averages, ready for json.dump
+    with _lock:
+        result = {}
+        for name, t in sorted(_totals.items()):
+            result[name] = {
+                "calls": t["calls"],
+                "statements": t["statements"],
+                "db_ms": round(t["db_ms"], 3),
+                "rows": t["rows"],
+                "statements_per_call": round(t["statements"] / t["calls"], 2),
+                "db_ms_per_call": round(t["db_ms"] / t["calls"], 3),
+                "rows_per_call": round(t["rows"] / t["calls"], 2),
+                "slowest": [{"ms": round(ms, 3), "statement": statement} for ms, statement in t["slowest"]],
+                "n_plus_one": [
+                    dict(suspect, statement=shape)
+                    for shape, suspect in sorted(t["n_plus_one"].items(), key=lambda s: -s[1]["max_repeats"])
+                ],
+            }
+        return result
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+
+def export_json(path):
+    with open(path, "w") as f:
+        json.dump({
+            "exported_at": datetime.now().isoformat(timespec="seconds"),
+            "slow_query_ms": slow_ms,
+            "n_plus_one_repeats": n_plus_one_repeats,
+            "operations": summary(),
+        }, f, indent=2)
+
+
+def print_summary():
+    for name, s in summary().items():
+        print(
+            f"  {name:<26} {s['calls']:>5} calls  {s['statements_per_call']:>6.1f} stmts  "
+            f"{s['db_ms_per_call']:>9.2f}ms db  {s['rows_per_call']:>9.1f} rows  (per call)"
+        )
+        for suspect in s["n_plus_one"]:
+            print(f"      N+1? {suspect['max_repeats']}x in one call: {suspect['statement'][:100]}")
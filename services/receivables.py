@@ -0,0 +1,120 @@
+from datetime import date
+
+from sqlalchemy import text
+
+from models.entities import Member
+from services.base import ServiceError, get_or_fail
+
+# Accounts receivable and revenue reports. They read the aggregate tables from
+# app/create_invoice_summary.py, never invoices as a whole: aging and revenue add up
+# daily totals (a few rows per day, however many invoices there are) and debtors come
+# from member_balances, with the aging split only worked out for the members shown.
+# Every report refreshes the aggregates first, which only recomputes the days and
+# members that changed since the last refresh. That happens in its own short transaction,
+# so the refresh lock is never held while a report reads, and is skipped when another
+# worker is refreshing right now (the report is then at most that refresh behind).
+
+# (label, oldest age in days that still counts, None for "anything older")
+AGING_BUCKETS = [("0-30", 30), ("31-60", 60), ("61-90", 90), ("90+", None)]
+REVENUE_MONTHS = 12
+DEBTORS_LIMIT = 20
+
+refresh_sql = text("SELECT days, members FROM refresh_invoice_summaries()")
+try_refresh_sql = text("SELECT days, members FROM refresh_invoice_summaries(wait => false)")
+
+bucket_case = "CASE " + " ".join(
+    f"WHEN :today - {{day}} <= {days} THEN '{label}'" for label, days in AGING_BUCKETS if days is not None
+) + f" ELSE '{AGING_BUCKETS[-1][0]}' END"
+
+aging_totals_sql = text(f"""
+SELECT {bucket_case.format(day="day")} AS bucket, SUM(invoice_count) AS invoices, SUM(amount) AS amount
+FROM invoice_daily_totals
+WHERE status = 'unpaid'
+GROUP BY 1
+""")
+
+member_aging_sql = text(f"""
+SELECT member_id, {bucket_case.format(day="created_at::date")} AS bucket, COUNT(*) AS invoices, SUM(amount) AS amount
+FROM invoices
+WHERE status = 'unpaid' AND member_id = ANY(:member_ids)
+GROUP BY 1, 2
+""")
+
+revenue_sql = text("""
+SELECT date_trunc('month', day)::date AS month, status, category,
+       SUM(invoice_count) AS invoices, SUM(amount) AS amount
+FROM invoice_daily_totals
+WHERE day >= :since
+GROUP BY 1, 2, 3
+ORDER BY 1, 3, 2
+""")
+
+debtors_sql = text("""
+SELECT b.member_id, m.full_name, b.open_count, b.open_amount, b.oldest_open_at
+FROM member_balances b
+JOIN members m ON m.id = b.member_id
+ORDER BY b.open_amount DESC, b.member_id
+LIMIT :limit
+""")
+
+
+def refresh(db):
+    # (days, members) recomputed
+    row = db.execute(refresh_sql).one()
+    return row.days, row.members
+
+
+def refresh_for_report(db):
+    # (days, members) recomputed, or None if another refresh was running
+    with db.get_bind().connect() as conn:
+        row = conn.execute(try_refresh_sql).one()
+        conn.commit()
+    return None if row.days is None else (row.days, row.members)
+
+
+def empty_buckets():
+    return {label: {"invoices": 0, "amount": 0} for label, _ in AGING_BUCKETS}
+
+
+def aging_totals(db, today=None):
+    refresh_for_report(db)
+    buckets = empty_buckets()
+    for row in db.execute(aging_totals_sql, {"today": today or date.today()}):
+        buckets[row.bucket] = {"invoices": row.invoices, "amount": row.amount}
+    return buckets
+
+
+def aging_by_member(db, member_ids, today=None):
+    # member_id -> buckets, for a handful of members (uses the open invoices index)
+    result = {member_id: empty_buckets() for member_id in member_ids}
+    rows = db.execute(member_aging_sql, {"member_ids": list(member_ids), "today": today or date.today()})
+    for row in rows:
+        result[row.member_id][row.bucket] = {"invoices": row.invoices, "amount": row.amount}
+    return result
+
+
+def member_aging(db, member_id, today=None):
+    member = get_or_fail(db, Member, member_id, "Member not found.")
+    return member, aging_by_member(db, [member.id], today)[member.id]
+
+
+def top_debtors(db, limit=DEBTORS_LIMIT, today=None):
+    if limit < 1:
+        raise ServiceError("Limit must be at least 1.")
+    refresh_for_report(db)
+    debtors = [dict(row._mapping) for row in db.execute(debtors_sql, {"limit": limit})]
+    aging = aging_by_member(db, [d["member_id"] for d in debtors], today)
+    for debtor in debtors:
+        debtor["aging"] = aging[debtor["member_id"]]
+    return debtors
+
+
+def monthly_revenue(db, months=REVENUE_MONTHS, today=None):
+    # rows of (month, status, category, invoices, amount) for the last `months` months
+    if months < 1:
+        raise ServiceError("Months must be at least 1.")
+    refresh_for_report(db)
+    first = (today or date.today()).replace(day=1)
+    for _ in range(months - 1):
+        first = (first.replace(day=1) - date.resolution).replace(day=1)
+    return [dict(row._mapping) for row in db.execute(revenue_sql, {"since": first})]
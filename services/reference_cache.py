@@ -0,0 +1,231 @@
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select as sql_select
+
+import config
+from models.entities import Member, Trainer, Room
+from services.base import NotFound
+
+# Process-local cache of the reference rows every booking, class, metric and invoice
+# checks before it writes: members, trainers and rooms. They hardly ever change, so
+# instead of a db.get per id per call we keep a small read-only snapshot of each row
+# (LRU, bounded, with a TTL as a backstop) shared by everything in the process.
+#
+# Other processes are kept consistent with LISTEN/NOTIFY: app/create_reference_notify.py
+# adds triggers that NOTIFY reference_changed with the ids of every updated or deleted
+# row, and a listener thread here drops those entries. The cache only answers while that
+# listener is connected (and the triggers exist); otherwise lookups go to the database
+# like before, so a missed notification can never serve a stale row.
+#
+#   member = reference_cache.member(db, member_id)    # MemberRef, or NotFound
+
+
+class MemberRef:
+    __slots__ = ("id", "full_name", "email")
+
+    def __init__(self, id, full_name, email):
+        self.id = id
+        self.full_name = full_name
+        self.email = email
+
+
+class TrainerRef:
+    __slots__ = ("id", "full_name", "email", "specialty")
+
+    def __init__(self, id, full_name, email, specialty):
+        self.id = id
+        self.full_name = full_name
+        self.email = email
+        self.specialty = specialty
+
+
+class RoomRef:
+    __slots__ = ("id", "name", "capacity")
+
+    def __init__(self, id, name, capacity):
+        self.id = id
+        self.name = name
+        self.capacity = capacity
+
+
+# table name (as sent in the notifications) -> (snapshot class, model, "not found" message)
+KINDS = {
+    "members": (MemberRef, Member, "Member not found."),
+    "trainers": (TrainerRef, Trainer, "Trainer not found."),
+    "rooms": (RoomRef, Room, "Room not found."),
+}
+
+CHANNEL = "reference_changed"
+RECONNECT_SECONDS = 5
+
+
+class ReferenceCache:
+    def __init__(self, max_size=config.REFERENCE_CACHE_SIZE, ttl=config.REFERENCE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (table, id) -> (expires, snapshot), least recently used first
+        self._lock = threading.Lock()
+        # bumped by every invalidation, so a row read before one isn't stored after it
+        self._version = 0
+        self._listener = None
+        self.listening = False
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, db, table, object_id):
+        snapshot_class, model, message = KINDS[table]
+        if self.listening:
+            with self._lock:
+                entry = self._entries.get((table, object_id))
+                if entry is not None and entry[0] > time.monotonic():
+                    self._entries.move_to_end((table, object_id))
+                    self.hits += 1
+                    return entry[1]
+                self.misses += 1
+                version = self._version
+        else:
+            self._start_listener()
+            version = None
+
+        columns = [getattr(model, name) for name in snapshot_class.__slots__]
+        row = db.execute(sql_select(*columns).where(model.id == object_id)).first()
+        if row is None:
+            # not cached, a member registered a moment ago must be found straight away
+            raise NotFound(message)
+        snapshot = snapshot_class(*row)
+        if version is not None:
+            self._put((table, object_id), snapshot, version)
+        return snapshot
+
+    def _put(self, key, snapshot, version):
+        with self._lock:
+            if version != self._version or not self.listening:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, table, object_id):
+        with self._lock:
+            self._version += 1
+            if self._entries.pop((table, object_id), None) is not None:
+                self.invalidations += 1
+
+    def clear(self, table=None):
+        with self._lock:
+            self._version += 1
+            keys = [key for key in self._entries if table is None or key[0] == table]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "listening": self.listening,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    # --- cross-process invalidation ---
+
+    def _start_listener(self):
+        if not config.REFERENCE_CACHE or self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="reference-cache", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                conn = config.bulk_engine.raw_connection()
+            except Exception:
+                time.sleep(RECONNECT_SECONDS)
+                continue
+            try:
+                if not self._listen_on(conn.driver_connection):
+                    # no triggers (app/create_reference_notify.py not run): nobody would
+                    # tell us about changes, so this process keeps going to the database
+                    return
+            except Exception:
+                pass
+            finally:
+                self._stop_serving()
+                try:
+                    conn.invalidate()
+                except Exception:
+                    pass
+            time.sleep(RECONNECT_SECONDS)
+
+    def _listen_on(self, conn):
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regproc('notify_reference_changed') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                return False
+            cur.execute(f"LISTEN {CHANNEL}")
+        # anything cached before this point may have missed a notification
+        self.clear()
+        self.listening = True
+        while True:
+            if select.select([conn], [], [], RECONNECT_SECONDS) == ([], [], []):
+                # nothing for a while, make sure the connection is still there
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            conn.poll()
+            while conn.notifies:
+                self.apply(conn.notifies.pop(0).payload)
+
+    def _stop_serving(self):
+        self.listening = False
+        self.clear()
+
+    def apply(self, payload):
+        # "members:1,2,3" drops those rows, "members:*" the whole table, "*" everything
+        table, _, ids = payload.partition(":")
+        if table == "*":
+            self.clear()
+        elif table in KINDS:
+            if ids == "*":
+                self.clear(table)
+            else:
+                for object_id in ids.split(","):
+                    self.invalidate(table, int(object_id))
+
+    def _after_fork(self):
+        # the listener thread and its connection stay with the parent
+        self._entries.clear()
+        self._lock = threading.Lock()
+        self._listener = None
+        self.listening = False
+
+
+# shared by everything in this process
+reference_cache = ReferenceCache()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reference_cache._after_fork)
+
+
+def member(db, member_id):
+    return reference_cache.get(db, "members", member_id)
+
+
+def trainer(db, trainer_id):
+    return reference_cache.get(db, "trainers", trainer_id)
+
+
+def room(db, room_id):
+    return reference_cache.get(db, "rooms", room_id)
@@ -0,0 +1,286 @@
+import heapq
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import text
+
+from services import reference_cache
+from services.base import ServiceError, contains_pattern
+
+# "Find available slots": the earliest times a member could book a PT session, with a
+# trainer and a room that are free for the whole session.
+# Everything that could be in the way (PT sessions and classes of the candidate trainers
+# and rooms, and the member's own PT sessions and enrolled classes) is fetched in one query for the whole date
+# range, already grouped per trainer/room/member as sorted arrays of epoch seconds. After
+# that it's a sweep-line in memory: each resource's busy intervals are merged and turned
+# into free intervals inside opening hours, trainers' free time is intersected with the
+# member's, and candidate start times are walked in time order across all trainers (heap).
+# It's all generators, so a month-long range only costs as much as it takes to find the
+# first few slots.
+
+OPEN_HOUR = 6
+CLOSE_HOUR = 22
+SLOT_STEP = timedelta(minutes=15)  # candidate start times are on this grid (from midnight)
+SLOT_LIMIT = 10
+# no session runs longer than this, so the start_time index can bound the busy query
+# from both sides instead of scanning everything that started before the range
+MAX_SESSION_LENGTH = timedelta(days=1)
+
+EPOCH = datetime(1970, 1, 1)
+
+candidate_trainers_sql = text("""
+SELECT id, full_name
+FROM trainers
+WHERE (CAST(:trainer_id AS integer) IS NULL OR id = :trainer_id)
+  -- the specialty only narrows things down when no trainer was picked
+  AND (CAST(:trainer_id AS integer) IS NOT NULL OR CAST(:specialty AS text) IS NULL OR specialty ILIKE :specialty)
+ORDER BY id
+""")
+
+candidate_rooms_sql = text("""
+SELECT id, name
+FROM rooms
+WHERE CAST(:room_id AS integer) IS NULL OR id = :room_id
+ORDER BY id
+""")
+
+busy_intervals_sql = text("""
+WITH busy AS (
+    SELECT trainer_id, room_id, member_id,
+           extract(epoch FROM start_time)::bigint AS s, extract(epoch FROM end_time)::bigint AS e
+    FROM pt_sessions
+    WHERE status <> 'cancelled'
+      AND start_time < :range_end AND end_time > :range_start AND start_time >= :earliest_start
+      AND (CAST(:trainer_ids AS integer[]) IS NULL OR CAST(:room_ids AS integer[]) IS NULL
+           OR trainer_id = ANY(:trainer_ids) OR room_id = ANY(:room_ids) OR member_id = ANY(:member_ids))
+    UNION ALL
+    SELECT trainer_id, room_id, NULL,
+           extract(epoch FROM start_time)::bigint, extract(epoch FROM end_time)::bigint
+    FROM class_sessions
+    WHERE start_time < :range_end AND end_time > :range_start AND start_time >= :earliest_start
+      AND (CAST(:trainer_ids AS integer[]) IS NULL OR CAST(:room_ids AS integer[]) IS NULL
+           OR trainer_id = ANY(:trainer_ids) OR room_id = ANY(:room_ids))
+    UNION ALL
+    -- classes the member is enrolled in; their trainer and room are already in the rows above
+    SELECT NULL, NULL, e.member_id,
+           extract(epoch FROM c.start_time)::bigint, extract(epoch FROM c.end_time)::bigint
+    FROM class_sessions c
+    JOIN class_enrollments e ON e.class_id = c.id
+    WHERE c.start_time < :range_end AND c.end_time > :range_start AND c.start_time >= :earliest_start
+      AND e.member_id = ANY(:member_ids) AND e.status = 'enrolled'
+)
+SELECT 'trainer', trainer_id, array_agg(s ORDER BY s), array_agg(e ORDER BY s)
+FROM busy WHERE CAST(:trainer_ids AS integer[]) IS NULL OR trainer_id = ANY(:trainer_ids) GROUP BY trainer_id
+UNION ALL
+SELECT 'room', room_id, array_agg(s ORDER BY s), array_agg(e ORDER BY s)
+FROM busy WHERE CAST(:room_ids AS integer[]) IS NULL OR room_id = ANY(:room_ids) GROUP BY room_id
+UNION ALL
+SELECT 'member', member_id, array_agg(s ORDER BY s), array_agg(e ORDER BY s)
+FROM busy WHERE member_id = ANY(:member_ids) GROUP BY member_id
+""")
+
+
+#INTERVALS
+# intervals are (start, end) in epoch seconds, sorted by start
+
+
+def to_seconds(moment):
+    return int((moment - EPOCH).total_seconds())
+
+
+def to_datetime(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def merge_intervals(starts, ends):
+    # sorted by start, possibly overlapping -> sorted and non-overlapping
+    current = None
+    for start, end in zip(starts, ends):
+        if current is None:
+            current = [start, end]
+        elif start <= current[1]:
+            if end > current[1]:
+                current[1] = end
+        else:
+            yield current[0], current[1]
+            current = [start, end]
+    if current is not None:
+        yield current[0], current[1]
+
+
+def opening_windows(range_start, range_end, open_hour=OPEN_HOUR, close_hour=CLOSE_HOUR):
+    windows = []
+    day = range_start.date()
+    while day <= range_end.date():
+        midnight = datetime.combine(day, time())
+        start = max(midnight + timedelta(hours=open_hour), range_start)
+        end = min(midnight + timedelta(hours=close_hour), range_end)
+        if start < end:
+            windows.append((to_seconds(start), to_seconds(end)))
+        day += timedelta(days=1)
+    return windows
+
+
+def free_intervals(windows, busy, min_length):
+    # windows minus the merged busy intervals, one sweep over both;
+    # pieces shorter than min_length can't hold a session and are skipped
+    busy = iter(busy)
+    current = next(busy, None)
+    for window_start, window_end in windows:
+        cursor = window_start
+        while current is not None and current[0] < window_end:
+            if current[1] > cursor:
+                if current[0] - cursor >= min_length:
+                    yield cursor, current[0]
+                cursor = max(cursor, current[1])
+            if current[1] > window_end:
+                break  # still busy at the start of the next window
+            current = next(busy, None)
+        if window_end - cursor >= min_length:
+            yield cursor, window_end
+
+
+def intersect(a, b, min_length):
+    # two sorted non-overlapping streams, same two-pointer sweep as a merge
+    x = next(a, None)
+    y = next(b, None)
+    while x is not None and y is not None:
+        start = max(x[0], y[0])
+        end = min(x[1], y[1])
+        if end - start >= min_length:
+            yield start, end
+        if x[1] < y[1]:
+            x = next(a, None)
+        else:
+            y = next(b, None)
+
+
+def candidate_starts(free, duration, step):
+    for start, end in free:
+        t = -(-start // step) * step  # round up to the grid
+        while t + duration <= end:
+            yield t
+            t += step
+
+
+class RoomCursor:
+    # Walks a room's free intervals. Start times are asked for in increasing order, so an
+    # interval that can't hold this session can't hold any later one either and is dropped.
+    __slots__ = ("free", "current")
+
+    def __init__(self, free):
+        self.free = free
+        self.current = next(free, None)
+
+    def covers(self, start, end):
+        while self.current is not None and self.current[1] < end:
+            self.current = next(self.free, None)
+        return self.current is not None and self.current[0] <= start
+
+
+#FINDER
+
+
+def load_busy(db, range_start, range_end, trainer_ids, room_ids, member_ids):
+    # (resource, id) -> (starts, ends), sorted by start; trainer_ids/room_ids None means all
+    # of them, which lets the query skip those filters entirely
+    rows = db.execute(
+        busy_intervals_sql,
+        {
+            "range_start": range_start,
+            "range_end": range_end,
+            "earliest_start": range_start - MAX_SESSION_LENGTH,
+            "trainer_ids": trainer_ids,
+            "room_ids": room_ids,
+            "member_ids": member_ids,
+        },
+    )
+    return {(resource, resource_id): (starts, ends) for resource, resource_id, starts, ends in rows}
+
+
+def earliest_slots(busy, windows, member_id, trainers, rooms, length, step, limit):
+    # up to limit (start, trainer, room) in epoch seconds, earliest first, one per start time.
+    # Trainers and rooms are tried in the order given when several fit the same start.
+    def free_time(resource, resource_id):
+        starts, ends = busy.get((resource, resource_id), ((), ()))
+        return free_intervals(windows, merge_intervals(starts, ends), length)
+
+    member_free = list(free_time("member", member_id))
+    room_cursors = [(room, RoomCursor(free_time("room", room.id))) for room in rooms]
+
+    # one stream of candidate start times per trainer (already free for the member too),
+    # merged in time order so we can stop as soon as we have enough slots
+    heap = []
+    for index, trainer in enumerate(trainers):
+        free = intersect(iter(member_free), free_time("trainer", trainer.id), length)
+        starts = candidate_starts(free, length, step)
+        first = next(starts, None)
+        if first is not None:
+            heap.append((first, index, starts))
+    heapq.heapify(heap)
+
+    slots = []
+    last_checked = None
+    while heap and len(slots) < limit:
+        start, index, starts = heap[0]
+        # the room check doesn't depend on the trainer, so each start time is only tried once
+        if start != last_checked:
+            last_checked = start
+            room = next((room for room, cursor in room_cursors if cursor.covers(start, start + length)), None)
+            if room is not None:
+                slots.append((start, trainers[index], room))
+        following = next(starts, None)
+        if following is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (following, index, starts))
+    return slots
+
+
+def check_range(range_start, range_end, duration, open_hour, close_hour):
+    if range_end <= range_start:
+        raise ServiceError("End of the date range must be after its start.")
+    if duration <= timedelta(0):
+        raise ServiceError("Duration must be positive.")
+    if not 0 <= open_hour < close_hour <= 24:
+        raise ServiceError("Opening hours must be between 0 and 24, opening before closing.")
+
+
+def find_free_slots(
+    db, member_id, range_start, range_end, duration,
+    trainer_id=None, specialty=None, room_id=None,
+    open_hour=OPEN_HOUR, close_hour=CLOSE_HOUR, limit=SLOT_LIMIT, step=SLOT_STEP,
+):
+    # returns up to limit dicts (start_time, end_time, trainer, room), earliest first,
+    # one per start time (the first trainer/room that fits)
+    check_range(range_start, range_end, duration, open_hour, close_hour)
+
+    member = reference_cache.member(db, member_id)
+    trainers = db.execute(
+        candidate_trainers_sql, {"trainer_id": trainer_id, "specialty": specialty and contains_pattern(specialty)}
+    ).all()
+    if not trainers:
+        raise ServiceError("No trainer matches that trainer/specialty.")
+    rooms = db.execute(candidate_rooms_sql, {"room_id": room_id}).all()
+    if not rooms:
+        raise ServiceError("Room not found.")
+
+    busy = load_busy(
+        db, range_start, range_end,
+        [t.id for t in trainers] if trainer_id or specialty else None,
+        [room_id] if room_id else None,
+        [member.id],
+    )
+    windows = opening_windows(range_start, range_end, open_hour, close_hour)
+    length = int(duration.total_seconds())
+    slots = earliest_slots(busy, windows, member.id, trainers, rooms, length, int(step.total_seconds()), limit)
+    return [
+        {
+            "start_time": to_datetime(start),
+            "end_time": to_datetime(start + length),
+            "trainer_id": trainer.id,
+            "trainer_name": trainer.full_name,
+            "room_id": room.id,
+            "room_name": room.name,
+        }
+        for start, trainer, room in slots
+    ]
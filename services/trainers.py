@@ -0,0 +1,133 @@
+from sqlalchemy import text
+
+from models.entities import Member, Trainer
+from services import metric_analytics
+from services.base import get_or_fail, contains_pattern
+
+
+SCHEDULE_PAGE_SIZE = 50
+SCHEDULE_DAYS = 7
+
+# PT sessions and classes for one trainer in a time window, merged into one list ordered by
+# (start_time, kind, id) (kind is there because a PT session and a class can share an id).
+# Each branch is cut to one page on its own, so the (trainer_id, start_time) indexes only
+# read what can end up on this page, and the outer query merges the two.
+# The row comparison against :after_* is the keyset: it continues after the last row of the
+# previous page; the plain start_time >= bound is what the index can use for it.
+trainer_schedule_sql = text("""
+SELECT kind, id, start_time, end_time, status, title, capacity, room_id, room_name, member_id, member_name
+FROM (
+    (
+        SELECT
+            'class' AS kind, c.id, c.start_time, c.end_time, NULL AS status, c.title, c.capacity,
+            c.room_id, r.name AS room_name, NULL::integer AS member_id, NULL AS member_name
+        FROM class_sessions c
+        JOIN rooms r ON r.id = c.room_id
+        WHERE c.trainer_id = :trainer_id
+          AND c.start_time >= :after_start AND c.start_time < :window_end
+          AND (c.start_time, 'class', c.id) > (:after_start, :after_kind, :after_id)
+        ORDER BY c.start_time, c.id
+        LIMIT :limit
+    )
+    UNION ALL
+    (
+        SELECT
+            'pt' AS kind, p.id, p.start_time, p.end_time, p.status, NULL AS title, NULL AS capacity,
+            p.room_id, r.name AS room_name, p.member_id, m.full_name AS member_name
+        FROM pt_sessions p
+        JOIN rooms r ON r.id = p.room_id
+        JOIN members m ON m.id = p.member_id
+        WHERE p.trainer_id = :trainer_id
+          AND p.start_time >= :after_start AND p.start_time < :window_end
+          AND (p.start_time, 'pt', p.id) > (:after_start, :after_kind, :after_id)
+        ORDER BY p.start_time, p.id
+        LIMIT :limit
+    )
+) schedule
+ORDER BY start_time, kind, id
+LIMIT :limit
+""")
+
+
+def schedule_params(trainer_id, window_start, window_end, after, limit):
+    # after is the (start_time, kind, id) of the last row already shown, None for the first page
+    after_start, after_kind, after_id = after or (window_start, "", 0)
+    return {
+        "trainer_id": trainer_id,
+        "window_end": window_end,
+        "after_start": after_start,
+        "after_kind": after_kind,
+        "after_id": after_id,
+        "limit": limit,
+    }
+
+
+def next_key(rows, limit):
+    # keyset for the next page, None when this was the last one
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return last.start_time, last.kind, last.id
+
+
+def trainer_schedule(db, trainer_id, window_start, window_end, after=None, limit=SCHEDULE_PAGE_SIZE):
+    # returns (trainer, rows, next_key)
+    trainer = get_or_fail(db, Trainer, trainer_id, "Trainer not found.")
+    rows = db.execute(
+        trainer_schedule_sql, schedule_params(trainer.id, window_start, window_end, after, limit)
+    ).all()
+    return trainer, rows, next_key(rows, limit)
+
+
+LOOKUP_PAGE_SIZE = 20
+
+# One round trip per page: rank the matching members first (the trigram index on
+# full_name makes both the ILIKE and the fuzzy % match indexable), then join the latest
+# metric for just that page from member_metric_summary (what member_latest_metric reads).
+member_lookup_sql = text("""
+WITH matches AS (
+    SELECT
+        id,
+        full_name,
+        fitness_goal,
+        full_name ILIKE :pattern AS exact,
+        similarity(full_name, :name) AS score
+    FROM members
+    WHERE full_name ILIKE :pattern OR full_name % :name
+    ORDER BY exact DESC, score DESC, id
+    LIMIT :limit OFFSET :offset
+)
+SELECT
+    m.id,
+    m.full_name,
+    m.fitness_goal,
+    s.latest_recorded_at AS recorded_at,
+    s.latest_weight AS weight,
+    s.latest_heart_rate AS heart_rate,
+    s.latest_body_fat_percentage AS body_fat_percentage
+FROM matches m
+LEFT JOIN member_metric_summary s ON s.member_id = m.id
+ORDER BY m.exact DESC, m.score DESC, m.id
+""")
+
+
+def lookup_params(name_part, limit, offset):
+    return {"name": name_part, "pattern": contains_pattern(name_part), "limit": limit, "offset": offset}
+
+
+def search_members(db, name_part, limit=LOOKUP_PAGE_SIZE, offset=0):
+    # substring matches first, then fuzzy ones by similarity; rows are streamed as they arrive
+    result = db.execute(
+        member_lookup_sql.execution_options(stream_results=True, max_row_buffer=limit),
+        lookup_params(name_part, limit, offset),
+    )
+    yield from result
+
+
+TREND_DAYS = 180
+
+
+def member_trend(db, member_id, days=TREND_DAYS):
+    # returns (member, report), report is None when there are no readings in the window
+    member = get_or_fail(db, Member, member_id, "Member not found.")
+    return member, metric_analytics.member_trend(member.id, member.target_weight, days=days)
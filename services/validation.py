@@ -0,0 +1,64 @@
+from datetime import date, datetime
+
+# Checks for loosely typed input (JSON bodies, query strings, batch records) shared by the
+# front ends: app/api_server.py turns BadRequest into a 400, batch mode into "invalid".
+# They only check the shape of a value; the rules about what's allowed stay in the
+# service functions.
+
+
+class BadRequest(Exception):
+    pass
+
+
+def required(body, key):
+    if body.get(key) in (None, ""):
+        raise BadRequest(f"{key} is required.")
+    return body[key]
+
+
+def as_int(value, key):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"{key} must be an integer.")
+
+
+def as_float(value, key):
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"{key} must be a number.")
+
+
+def as_bool(value, key):
+    # a JSON true/false; "false" is a string, not a no
+    if value in (None, ""):
+        return False
+    if not isinstance(value, bool):
+        raise BadRequest(f"{key} must be true or false.")
+    return value
+
+
+def as_datetime(value, key):
+    # the database stores local times without a zone, so "2025-03-01T10:00:00Z" or
+    # "...+02:00" is converted to this machine's local time first
+    if value in (None, ""):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"{key} must be an ISO date/time.")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def as_date(value, key):
+    if value in (None, ""):
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"{key} must be an ISO date.")
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+# Unit tests for the pure logic (interval maths, validation, normalising), plus the session
+# hooks on an in-memory SQLite database, so none of them need PostgreSQL running.
+#
+#   python -m pytest -q
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    # a session with its transaction already begun, like a service function gets
+    session = Session(create_engine("sqlite://"))
+    session.execute(text("SELECT 1"))
+    yield session
+    session.close()
@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy import event
+
+from services.base import after_commit
+
+
+def test_runs_on_commit(db):
+    ran = []
+    after_commit(db, lambda: ran.append(1))
+    assert ran == []
+    db.commit()
+    assert ran == [1]
+
+
+def test_dropped_on_rollback(db):
+    ran = []
+    after_commit(db, lambda: ran.append(1))
+    db.rollback()
+    db.commit()
+    assert ran == []
+
+
+def test_savepoint_release_waits_for_the_real_commit(db):
+    ran = []
+    with db.begin_nested():
+        after_commit(db, lambda: ran.append("savepoint"))
+    assert ran == []
+    db.commit()
+    assert ran == ["savepoint"]
+
+
+def test_savepoint_rollback_only_drops_its_own_callbacks(db):
+    ran = []
+    after_commit(db, lambda: ran.append("before"))
+    with db.begin_nested():
+        after_commit(db, lambda: ran.append("released"))
+    with pytest.raises(ValueError):
+        with db.begin_nested():
+            after_commit(db, lambda: ran.append("rolled back"))
+            with db.begin_nested():
+                after_commit(db, lambda: ran.append("inner"))
+            raise ValueError
+    db.commit()
+    assert ran == ["before", "released"]
+
+
+def test_failed_commit_runs_nothing(db):
+    ran = []
+    with db.begin_nested():
+        after_commit(db, lambda: ran.append(1))
+
+    def fail(session):
+        raise RuntimeError("commit failed")
+
+    event.listen(db, "before_commit", fail)
+    with pytest.raises(RuntimeError):
+        db.commit()
+    db.rollback()
+    event.remove(db, "before_commit", fail)
+    db.commit()
+    assert ran == []
@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy.exc import IntegrityError
+
+from services.availability import PTAvailabilityIndex, ResourceSchedule, overlap_violation
+
+
+def at(hour, minute=0):
+    return datetime(2030, 3, 1, hour, minute)
+
+
+def schedule(*sessions):
+    s = ResourceSchedule()
+    for start, end, session_id in sessions:
+        s.add(start, end, session_id)
+    return s
+
+
+def test_find_overlap():
+    s = schedule((at(9), at(10), 1), (at(12), at(13), 2))
+    assert s.find_overlap(at(9, 30), at(10, 30)) == 1
+    assert s.find_overlap(at(8), at(14)) in (1, 2)
+    assert s.find_overlap(at(12, 15), at(12, 45)) == 2
+
+
+def test_touching_sessions_dont_overlap():
+    s = schedule((at(9), at(10), 1))
+    assert s.find_overlap(at(10), at(11)) is None
+    assert s.find_overlap(at(8), at(9)) is None
+
+
+def test_long_session_found_from_far_back():
+    # starts long before the window and is still running
+    s = schedule((at(6), at(18), 1), (at(7), at(8), 2))
+    assert s.find_overlap(at(16), at(17)) == 1
+
+
+def test_remove():
+    s = schedule((at(9), at(10), 1), (at(9), at(11), 2))
+    assert s.remove(1)
+    assert not s.remove(1)
+    assert s.find_overlap(at(10, 30), at(12)) == 2
+    assert s.remove(2)
+    assert s.find_overlap(at(9), at(12)) is None
+    assert s.starts == [] and s.intervals == []
+
+
+def test_prune_drops_sessions_that_are_over():
+    s = schedule((at(8), at(9), 1), (at(9), at(10), 2), (at(11), at(12), 3))
+    s.prune(at(10))
+    assert [i[2] for i in s.intervals] == [3]
+    assert s.starts == [at(11)]
+
+
+class FakeIndex(PTAvailabilityIndex):
+    # no database: _load finds nothing, the "database" answer is set by the test
+    def __init__(self, in_db, max_size=100, ttl=60, fresh=1.0):
+        super().__init__(max_size, ttl, fresh)
+        self.in_db = in_db
+        self.db_checks = 0
+
+    def _load(self, db, missing, now):
+        with self._lock:
+            for key in missing:
+                self._schedules[key] = ResourceSchedule()
+            while len(self._schedules) > self.max_size:
+                self._schedules.popitem(last=False)
+
+    def _conflict_in_db(self, db, keys, start_time, end_time):
+        self.db_checks += 1
+        return self.in_db
+
+
+def booked(trainer_id, start, end, session_id=1):
+    class Session:
+        pass
+    session = Session()
+    session.id, session.trainer_id, session.room_id, session.member_id = session_id, trainer_id, 1, 1
+    session.start_time, session.end_time = start, end
+    return session
+
+
+def test_busy_answer_stands_without_the_database():
+    index = FakeIndex(in_db=None)
+    index.find_conflict(None, 1, 1, 1, at(9), at(10))
+    index.add(booked(1, at(9), at(10)))
+    assert index.find_conflict(None, 1, 1, 1, at(9, 30), at(10, 30)) == "trainer"
+    assert index.db_checks == 0
+
+
+def test_cancelled_elsewhere_frees_the_slot_after_the_ttl():
+    index = FakeIndex(in_db=None, ttl=0)
+    index.find_conflict(None, 1, 1, 1, at(9), at(10))
+    index.add(booked(1, at(9), at(10)))
+    # another process cancelled it: the schedule is loaded again, without the session
+    assert index.find_conflict(None, 1, 1, 1, at(9), at(10)) is None
+
+
+def test_fresh_free_answer_skips_the_database():
+    index = FakeIndex(in_db="room")
+    assert index.find_conflict(None, 1, 1, 1, at(9), at(10)) is None
+    assert index.db_checks == 0
+
+
+def test_older_free_answer_checked_against_the_database():
+    index = FakeIndex(in_db="room", fresh=0)
+    assert index.find_conflict(None, 1, 1, 1, at(9), at(10), confirm=False) is None
+    assert index.db_checks == 0
+    # booked by another process since the load: refused, and the room is loaded again
+    assert index.find_conflict(None, 1, 1, 1, at(9), at(10)) == "room"
+    assert index.db_checks == 1
+    assert ("room", 1) not in index._schedules
+
+
+def test_least_recently_used_resources_are_evicted():
+    index = FakeIndex(in_db=None, max_size=6)
+    index.find_conflict(None, 1, 1, 1, at(9), at(10))
+    index.find_conflict(None, 2, 2, 2, at(9), at(10))
+    index.find_conflict(None, 3, 3, 3, at(9), at(10))
+    assert len(index._schedules) == 6
+    assert ("trainer", 1) not in index._schedules
+    assert ("trainer", 3) in index._schedules
+
+
+def test_sessions_that_are_over_are_pruned_on_lookup():
+    index = FakeIndex(in_db=None)
+    index.find_conflict(None, 1, 1, 1, at(9), at(10))
+    past = datetime.now() - timedelta(days=1)
+    index.add(booked(1, past, past + timedelta(hours=1)))
+    index.find_conflict(None, 1, 1, 1, at(9), at(10))
+    assert index._schedules[("trainer", 1)].intervals == []
+
+
+def integrity_error(orig):
+    return IntegrityError("INSERT INTO pt_sessions ...", {}, orig)
+
+
+def test_overlap_violation_psycopg2():
+    orig = Exception("conflicting key value violates exclusion constraint")
+    orig.diag = SimpleNamespace(constraint_name="pt_sessions_trainer_no_overlap")
+    assert overlap_violation(integrity_error(orig)) == "trainer"
+    orig.diag = SimpleNamespace(constraint_name="some_other_constraint")
+    assert overlap_violation(integrity_error(orig)) is None
+
+
+def test_overlap_violation_asyncpg():
+    # SQLAlchemy's asyncpg adapter raises its own error (no .diag) from asyncpg's, which
+    # carries the constraint name
+    class ExclusionViolationError(Exception):
+        sqlstate = "23P01"
+        constraint_name = "pt_sessions_room_no_overlap"
+
+    class AdaptedError(Exception):
+        pass
+
+    try:
+        try:
+            raise ExclusionViolationError()
+        except ExclusionViolationError as e:
+            raise AdaptedError(str(e)) from e
+    except AdaptedError as adapted:
+        orig = adapted
+    assert overlap_violation(integrity_error(orig)) == "room"
+    assert overlap_violation(integrity_error(AdaptedError())) is None
@@ -0,0 +1,117 @@
+import io
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+
+from app import batch
+from services import Conflict
+from services.availability import PTAvailabilityIndex, ResourceSchedule
+from services.base import after_commit
+from services.validation import required
+
+
+@pytest.fixture
+def index(monkeypatch):
+    # a "book" op that only does what book_pt_session does to the availability index
+    index = PTAvailabilityIndex()
+    index._schedules[("trainer", 1)] = ResourceSchedule()
+    index.in_savepoint = []
+
+    def book(db, session_id, refuse):
+        index.in_savepoint.append(db.in_nested_transaction())
+        if refuse:
+            raise Conflict("Trainer already has a session at that time.")
+        session = SimpleNamespace(
+            id=session_id, trainer_id=1, room_id=1, member_id=session_id,
+            start_time=datetime(2025, 3, 1, 9 + session_id), end_time=datetime(2025, 3, 1, 10 + session_id),
+        )
+        after_commit(db, lambda: index.add(session))
+        return session
+
+    monkeypatch.setitem(batch.OPERATIONS, "book", (book, lambda r: (required(r, "id"), r.get("refuse", False))))
+    return index
+
+
+def parse(records):
+    return [batch.parse_record(n, json.dumps(r)) for n, r in enumerate(records, start=1)]
+
+
+def run(db, records):
+    pending = batch.run_records(db, parse(records))
+    out, counts = io.StringIO(), {}
+    batch.commit(db, pending, out, counts)
+    return [json.loads(line) for line in out.getvalue().splitlines()], counts
+
+
+def booked(index):
+    return [interval[2] for interval in index._schedules[("trainer", 1)].intervals]
+
+
+def test_index_updated_only_after_the_batch_commits(db, index):
+    pending = batch.run_records(db, parse([{"op": "book", "id": 1}]))
+    # the record has run, but nothing is committed yet
+    assert booked(index) == []
+    batch.commit(db, pending, io.StringIO(), {})
+    assert booked(index) == [1]
+
+
+def test_refused_record_keeps_the_others(db, index):
+    results, counts = run(db, [
+        {"op": "book", "id": 1},
+        {"op": "book", "id": 2, "refuse": True},
+        {"op": "book", "id": 3},
+    ])
+    assert [r["status"] for r in results] == ["ok", "refused", "ok"]
+    assert booked(index) == [1, 3]
+    assert counts == {"ok": 2, "refused": 1}
+    # straight through up to the refusal, then the first one again and the last in a savepoint
+    assert index.in_savepoint == [False, False, False, True]
+
+
+def test_refusals_after_the_first(db, index):
+    results, counts = run(db, [
+        {"op": "book", "id": 1},
+        {"op": "book", "id": 2, "refuse": True},
+        {"op": "book", "id": 3},
+        {"op": "book", "id": 4, "refuse": True},
+        {"op": "nope"},
+        {"op": "book", "id": 5},
+    ])
+    assert [r["status"] for r in results] == ["ok", "refused", "ok", "refused", "invalid", "ok"]
+    assert booked(index) == [1, 3, 5]
+    assert index.in_savepoint == [False, False, False, True, True, True]
+
+
+def test_clean_batch_runs_without_savepoints(db, index):
+    results, counts = run(db, [{"op": "book", "id": 1}, {"op": "nope"}, {"op": "book", "id": 2}])
+    assert [r["status"] for r in results] == ["ok", "invalid", "ok"]
+    assert [r.get("id") for r in results] == [1, None, 2]
+    assert index.in_savepoint == [False, False]
+    assert booked(index) == [1, 2]
+
+
+def test_failed_commit_leaves_the_index_alone(db, index):
+    def fail(session):
+        # before_commit fires for savepoints too, only fail the real COMMIT
+        if session.get_nested_transaction() is None:
+            raise RuntimeError("connection lost")
+
+    event.listen(db, "before_commit", fail)
+    results, counts = run(db, [{"op": "book", "id": 1}, {"op": "book", "id": 2}])
+    assert [r["status"] for r in results] == ["error", "error"]
+    assert all("Batch commit failed" in r["error"] and "id" not in r for r in results)
+    assert counts == {"error": 2}
+    assert booked(index) == []
+
+    # and the next batch starts clean
+    event.remove(db, "before_commit", fail)
+    run(db, [{"op": "book", "id": 3}])
+    assert booked(index) == [3]
+
+
+def test_invalid_records(db, index):
+    results, counts = run(db, [{"op": "nope"}, {"op": "book"}])
+    assert [r["status"] for r in results] == ["invalid", "invalid"]
@@ -0,0 +1,30 @@
+from app import export_data
+from app.export_data import find_gaps, in_ranges, to_ranges
+
+
+def test_to_ranges():
+    assert to_ranges([]) == []
+    assert to_ranges([3, 4, 5, 9, 11, 12]) == [[3, 5], [9, 9], [11, 12]]
+
+
+def test_in_ranges():
+    ranges = [[3, 5], [9, 9]]
+    assert [i for i in range(12) if in_ranges(ranges, i)] == [3, 4, 5, 9]
+    assert not in_ranges([], 1)
+
+
+def test_find_gaps_remembers_what_was_not_seen():
+    # ids 11-20 were new, 14 and 15 weren't there (yet)
+    seen = set(range(11, 21)) - {14, 15}
+    assert find_gaps(10, 20, seen, []) == [[14, 15]]
+
+
+def test_find_gaps_drops_the_ones_that_turned_up():
+    # last time 14-15 were missing, now 15 committed and 21-30 are new
+    assert find_gaps(20, 30, {15} | set(range(21, 31)), [[14, 15]]) == [[14, 14]]
+
+
+def test_find_gaps_forgets_old_gaps(monkeypatch):
+    monkeypatch.setattr(export_data, "LOOKBACK_IDS", 10)
+    # 3 is more than LOOKBACK_IDS behind the new watermark, 25 isn't
+    assert find_gaps(20, 30, set(range(21, 31)) - {25}, [[3, 3]]) == [[25, 25]]
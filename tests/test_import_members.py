@@ -0,0 +1,73 @@
+from datetime import date
+
+import pytest
+
+from app.import_members import (
+    DATE_FORMATS, Rejected, clean_date, clean_email, clean_gender, clean_name, clean_phone, normalize,
+)
+
+
+def rejected_because(clean, *args):
+    with pytest.raises(Rejected) as e:
+        clean(*args)
+    return str(e.value)
+
+
+def test_clean_email():
+    assert clean_email("  Ann.Lee@Example.COM ") == "ann.lee@example.com"
+    assert rejected_because(clean_email, " ") == "missing email"
+    assert rejected_because(clean_email, None) == "missing email"
+    assert rejected_because(clean_email, "ann@example") == "bad email"
+    assert rejected_because(clean_email, "ann lee@example.com") == "bad email"
+    assert rejected_because(clean_email, "a" * 95 + "@x.com") == "bad email"
+
+
+def test_clean_name():
+    assert clean_name("  Ann \t  Lee ") == "Ann Lee"
+    assert rejected_because(clean_name, "") == "missing name"
+    assert rejected_because(clean_name, "x" * 101) == "name too long"
+
+
+def test_clean_date():
+    assert clean_date("1990-05-04", DATE_FORMATS) == date(1990, 5, 4)
+    assert clean_date("04.05.1990", DATE_FORMATS) == date(1990, 5, 4)
+    assert clean_date(" ", DATE_FORMATS) is None
+    assert rejected_because(clean_date, "05/04/1990", DATE_FORMATS) == "bad date_of_birth"
+    assert clean_date("05/04/1990", ["%m/%d/%Y"]) == date(1990, 5, 4)
+    assert rejected_because(clean_date, "1850-01-01", DATE_FORMATS) == "bad date_of_birth"
+    assert rejected_because(clean_date, "2999-01-01", DATE_FORMATS) == "bad date_of_birth"
+
+
+def test_clean_gender():
+    assert clean_gender(" F ") == "Female"
+    assert clean_gender("MAN") == "Male"
+    assert clean_gender("non-binary") == "Non-Binary"
+    assert clean_gender("") is None
+
+
+def test_clean_phone():
+    assert clean_phone("(613) 555-0142") == "613-555-0142"
+    assert clean_phone("+1 613 555 0142") == "613-555-0142"
+    assert clean_phone("+44 20 7946 0958") == "+442079460958"
+    assert clean_phone(None) is None
+    assert rejected_because(clean_phone, "555-0142") == "bad phone"
+
+
+def test_normalize():
+    batch = [
+        (2, ["Ann Lee", "Ann@Example.com", "1990-05-04", "f", "613 555 0142"]),
+        (3, ["Bob", "not an email", "", "", ""]),
+        (4, ["Ann  Lee-Smith", "ann@example.com ", "", "", ""]),
+        (6, ["Dan", "dan@example.com", "", "m", ""]),
+        (7, ["Dan", "DAN@example.com", "", "female", ""]),
+        (5, ["", "carl@example.com", "", "", ""]),
+    ]
+    rows, rejected, duplicates = normalize(batch, DATE_FORMATS)
+    # the same email in any case is one member; the later line's name wins, its empty cells
+    # keep what the earlier line had (as if the lines came in separate batches)
+    assert rows == [
+        ("Ann Lee-Smith", "ann@example.com", date(1990, 5, 4), "Female", "613-555-0142"),
+        ("Dan", "dan@example.com", None, "Female", None),
+    ]
+    assert [(line_no, reason) for line_no, values, reason in rejected] == [(3, "bad email"), (5, "missing name")]
+    assert duplicates == 2
@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import numpy as np
+
+from app.ingest_metrics import parse_numbers, parse_timestamps, validate
+
+
+def test_parse_numbers_marks_what_isnt_a_number():
+    values, invalid = parse_numbers(["1.5", "", None, "abc", 3])
+    assert values[0] == 1.5 and values[4] == 3
+    assert np.isnan(values[1:4]).all()
+    assert invalid.tolist() == [False, False, False, True, False]
+
+
+def test_parse_timestamps():
+    parsed = parse_timestamps(["2025-01-02 08:00", "2025-01-02T08:00:30", "", "yesterday"])
+    assert parsed[:2].tolist() == [datetime(2025, 1, 2, 8, 0), datetime(2025, 1, 2, 8, 0, 30)]
+    assert np.isnat(parsed[2:]).all()
+
+
+def test_validate():
+    batch = [
+        ["1", "2025-01-02 08:00", "80.5", "60", ""],
+        ["x", "2025-01-02 08:00", "1000", "60", ""],  # bad member and weight, counted once
+        ["0", "2025-01-02 08:00", "80", "", ""],
+        ["1.5", "2025-01-02 08:00", "80", "", ""],
+        ["2147483648", "2025-01-02 08:00", "80", "", ""],  # doesn't fit members.id
+        ["1", "yesterday", "80", "", ""],
+        ["1", "1999-12-31 23:00", "80", "", ""],
+        ["1", "2025-01-03 08:00", "1000", "", ""],
+        ["1", "2025-01-03 08:00", "80", "300", ""],
+        ["1", "2025-01-03 08:00", "80", "", "90"],
+        ["1", "2025-01-03 08:00", "", "", ""],
+        ["1", "2025-01-02 08:00", "81", "61", ""],  # same member and time as the first line
+        [2, "2025-01-02T09:00:00", 70, None, 20.123],  # as it comes from JSONL
+    ]
+    rows, rejected, duplicates = validate(batch)
+    assert rows == [
+        (1, datetime(2025, 1, 2, 8, 0), 80.5, 60, None),
+        (2, datetime(2025, 1, 2, 9, 0), 70.0, None, 20.12),
+    ]
+    assert rejected == {
+        "bad member_id": 4,
+        "bad recorded_at": 2,
+        "bad weight": 1,
+        "bad heart_rate": 1,
+        "bad body_fat_percentage": 1,
+        "no measurements": 1,
+    }
+    assert duplicates == 1
+
+
+def test_validate_rejects_readings_from_the_future():
+    rows, rejected, duplicates = validate([["1", "2999-01-01 00:00", "80", "", ""]])
+    assert rows == [] and rejected == {"bad recorded_at": 1}
@@ -0,0 +1,61 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from services.base import contains_pattern
+from services.scheduling import (
+    RoomCursor, earliest_slots, free_intervals, intersect, merge_intervals, opening_windows,
+    to_datetime, to_seconds,
+)
+
+
+def test_merge_intervals():
+    assert list(merge_intervals([0, 5, 10, 30], [10, 7, 20, 40])) == [(0, 20), (30, 40)]
+    # touching intervals are one busy stretch
+    assert list(merge_intervals([0, 10], [10, 20])) == [(0, 20)]
+    assert list(merge_intervals([], [])) == []
+
+
+def test_free_intervals():
+    windows = [(0, 100), (200, 300)]
+    busy = [(10, 20), (90, 210), (250, 260)]
+    # (90, 210) runs over the end of the first window into the second
+    assert list(free_intervals(windows, iter(busy), 5)) == [(0, 10), (20, 90), (210, 250), (260, 300)]
+
+
+def test_free_intervals_skips_short_pieces():
+    assert list(free_intervals([(0, 100)], iter([(3, 50)]), 5)) == [(50, 100)]
+    assert list(free_intervals([(0, 100)], iter([(-50, -10)]), 5)) == [(0, 100)]
+    assert list(free_intervals([(0, 100)], iter([(0, 100)]), 5)) == []
+
+
+def test_intersect():
+    a = [(0, 10), (20, 30)]
+    b = [(5, 25)]
+    assert list(intersect(iter(a), iter(b), 1)) == [(5, 10), (20, 25)]
+    assert list(intersect(iter(a), iter(b), 6)) == []
+    assert list(intersect(iter(a), iter([]), 1)) == []
+
+
+def test_room_cursor():
+    cursor = RoomCursor(iter([(0, 10), (20, 50)]))
+    assert cursor.covers(0, 10)
+    assert not cursor.covers(5, 15)
+    assert cursor.covers(25, 40)
+    assert not cursor.covers(45, 60)
+    assert not cursor.covers(100, 110)
+
+
+def test_earliest_slots_avoid_the_members_busy_time():
+    # the member is in a class 7:00-8:00, as busy_intervals_sql returns it
+    day = datetime(2030, 3, 1)
+    windows = opening_windows(day.replace(hour=6), day.replace(hour=10))
+    busy = {("member", 1): ([to_seconds(day.replace(hour=7))], [to_seconds(day.replace(hour=8))])}
+    trainer = SimpleNamespace(id=1)
+    room = SimpleNamespace(id=1)
+    slots = earliest_slots(busy, windows, 1, [trainer], [room], 3600, 1800, 10)
+    assert [to_datetime(start).strftime("%H:%M") for start, _, _ in slots] == ["06:00", "08:00", "08:30", "09:00"]
+
+
+def test_contains_pattern_escapes_wildcards():
+    assert contains_pattern("yoga") == "%yoga%"
+    assert contains_pattern("100%_fit\\") == "%100\\%\\_fit\\\\%"
@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from services.validation import BadRequest, as_bool, as_datetime, as_int, required
+
+
+def test_as_datetime_naive_unchanged():
+    assert as_datetime("2025-03-01T10:00", "start_time") == datetime(2025, 3, 1, 10, 0)
+    assert as_datetime("", "start_time") is None
+
+
+def test_as_datetime_with_offset_becomes_local_time():
+    parsed = as_datetime("2025-03-01T10:00:00Z", "start_time")
+    assert parsed.tzinfo is None
+    expected = datetime(2025, 3, 1, 10, 0, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    assert parsed == expected
+    # comparable with the naive times from the database
+    assert parsed < datetime(2025, 3, 3)
+
+
+def test_bad_values():
+    with pytest.raises(BadRequest):
+        as_datetime("tomorrow", "start_time")
+    with pytest.raises(BadRequest):
+        as_int("x", "member_id")
+    with pytest.raises(BadRequest):
+        required({"email": ""}, "email")
+
+
+def test_as_bool():
+    assert as_bool(True, "dry_run") is True
+    assert as_bool(False, "dry_run") is False
+    assert as_bool(None, "dry_run") is False
+    for value in ("false", "true", 1, 0):
+        with pytest.raises(BadRequest):
+            as_bool(value, "dry_run")